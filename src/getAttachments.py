@@ -22,9 +22,12 @@ import argparse
 import configparser
 from datetime import date
 from mpapi.client import MpApi
+from mpapi.downloader import Downloader
 from mpapi.module import Module
 from mpapi.search import Search
+from mpapi.throttle import Throttle
 from pathlib import Path
+from typing import Optional
 
 conf_fn = "getAttachments.jobs"
 response_cache = "_ga_response.xml"  # for debugging
@@ -32,8 +35,19 @@ NSMAP = {"m": "http://www.zetcom.com/ria/ws/module"}
 
 
 class GetAttachments:
-    def __init__(self, *, baseURL: str, job: str, user: str, pw: str) -> None:
-        self.api = MpApi(baseURL=baseURL, user=user, pw=pw)
+    def __init__(
+        self,
+        *,
+        baseURL: str,
+        job: str,
+        user: str,
+        pw: str,
+        throttle: Optional[Throttle] = None,
+    ) -> None:
+        if throttle is None:
+            throttle = Throttle()
+        self.throttle = throttle
+        self.api = MpApi(baseURL=baseURL, user=user, pw=pw, throttle=throttle)
         self.job = job
         self.setup_conf()  # writes to self.conf
 
@@ -59,7 +73,14 @@ class GetAttachments:
             out_dir.mkdir(parents=True)
 
         print(f"* response has {no} asset items")
-
+        manifest = out_dir.joinpath("manifest.json")
+        with Downloader(
+            api=self.api, workers=self.throttle.maxInFlight, manifest=manifest
+        ) as dl:
+            self._queue(data=data, dl=dl, out_dir=out_dir, name_policy=name_policy)
+        print(f"* {dl.downloaded} downloaded, {dl.skipped} complete already")
+
+    def _queue(self, *, data: Module, dl: Downloader, out_dir: Path, name_policy: str):
         for item in data.iter(module="Multimedia"):
             ID = item.get("id")
             if item.get("hasAttachments") == "true":
@@ -87,11 +108,9 @@ class GetAttachments:
                 raise SyntaxError(f"Error: Unknown config value: {name_policy}")
 
             if hasAttachments:  # only d/l if there is an attachment
-                if path.exists():  # let's not overwrite existing files
+                # let's not overwrite complete files
+                if not dl.add(ID=ID, path=path):
                     print("\tfile exists already")
-                else:
-                    print(f"\t{path}")
-                    self.api.saveAttachment(id=ID, path=path)
             else:
                 print("\tno attachment")
 
@@ -13,6 +13,7 @@ DIR STRUCTURE
     projectData              # <-- use it as working directory (pwd)
         ajob/20210401        # <-- project dir
             report.log
+            metrics.prom     # requests per endpoint (also metrics.json)
             variousFiles.xml
             ...
         credentials.py       # use protection (e.g. .gitignore)
@@ -57,9 +58,11 @@ from typing import NewType, Optional, Union
 from mpapi.chunky import Chunky
 from mpapi.client import MpApi
 from mpapi.constants import NSMAP
+from mpapi.metrics import Metrics
 from mpapi.module import Module
 from mpapi.sar import Sar
 from mpapi.search import Search
+from mpapi.throttle import Throttle
 from zipfile import ZipFile, ZIP_LZMA
 
 Since = Optional[str]
@@ -72,13 +75,50 @@ chunkSize = 1000
 
 class Mink:
     def __init__(
-        self, *, conf: str, job: str, baseURL: str, user: str, pw: str
+        self,
+        *,
+        conf: str,
+        job: str,
+        baseURL: str,
+        user: str,
+        pw: str,
+        throttle: Optional[Throttle] = None,
+        metrics: Optional[Metrics] = None,
+        prefetch: int = 0,
+        plan: bool = False,
     ) -> None:
-        self.sar = Sar(baseURL=baseURL, user=user, pw=pw)
-        self.api = MpApi(baseURL=baseURL, user=user, pw=pw)
-        self.chunker = Chunky(chunkSize=chunkSize, baseURL=baseURL, pw=pw, user=user)
+        """
+        All requests of the job go through one throttle, so its maxInFlight
+        (mink -p) sets the job's throughput. They are also recorded in
+        metrics, which are saved as metrics.prom and metrics.json in the
+        project dir when the job is done.
+
+        prefetch is the number of chunks the chunk command downloads while
+        it's still busy with the current one (see Chunky.getByType); by
+        default, chunks are fetched one after the other as before. With
+        plan=True, the chunk command counts the items first and fetches the
+        chunks in parallel (see Chunky.getPlanned).
+        """
+        if throttle is None:
+            throttle = Throttle()
+        if metrics is None:
+            metrics = Metrics()
+        self.throttle = throttle
+        self.metrics = metrics
+        self.prefetch = prefetch
+        self.plan = plan
+        shared = {"throttle": throttle, "metrics": metrics}
+        self.sar = Sar(baseURL=baseURL, user=user, pw=pw, **shared)
+        self.api = MpApi(baseURL=baseURL, user=user, pw=pw, **shared)
+        self.chunker = Chunky(
+            chunkSize=chunkSize, baseURL=baseURL, pw=pw, user=user, **shared
+        )
         self.conf = conf
-        self._parse_conf(job=job)
+        self.metrics_dir: Optional[Path] = None
+        try:
+            self._parse_conf(job=job)
+        finally:  # also if the job fails halfway
+            self._saveMetrics()
 
     def info(self, msg: str) -> None:
         logging.info(msg)
@@ -184,6 +224,9 @@ class Mink:
         print(
             f" CHUNKER: {Type}-{ID} since:{since} chunkSize: {self.chunker.chunkSize} "
         )
+        if self.plan:
+            self._chunkPlanned(Type=Type, ID=ID, target=target, since=since)
+            return
 
         # ignore chunks already on disk
         no, offset = self._fastforward(Type=Type, ID=ID, suffix=".zip")
@@ -200,6 +243,7 @@ class Mink:
             target=target,
             since=since,
             offset=offset,
+            prefetch=self.prefetch,
         ):
             if chunk:  # Module is True if >0 items
                 # print(f"###chunk size:{chunk.actualSize(module='Object')}")
@@ -287,25 +331,15 @@ class Mink:
             self.info(f" joining modules, saving to {join_fn}")
 
             # module for target and type refers to the type of selection
-            m = (
-                self._getPart(
-                    module="Person", Id=Id, Type=Type, label=label, since=since
-                )
-                + self._getPart(
-                    module="Multimedia", Id=Id, Type=Type, label=label, since=since
-                )
-                + self._getPart(
-                    module="Object", Id=Id, Type=Type, label=label, since=since
-                )
-            )
-
+            modules = ["Person", "Multimedia", "Object"]
             if Type == "exhibit":
-                print(" d: about to get exhibit...")
-                m += self._getPart(
-                    module="Exhibition", Id=Id, Type=Type, label=label, since=since
-                ) + self._getPart(
-                    module="Registrar", Id=Id, Type=Type, label=label, since=since
+                modules += ["Exhibition", "Registrar"]
+            m = Module()
+            for module in modules:
+                part = self._getPart(
+                    module=module, Id=Id, Type=Type, label=label, since=since
                 )
+                m.add(doc=part.etree, adopt=True)  # part is not needed anymore
             print(" d: start cleaning")
             m.clean()
             m.validate()
@@ -316,23 +350,41 @@ class Mink:
         """
         Pack (or join) all clean files into one bigger package. We act on all
         *-join-*.xml files in the current project directory and save to
-        $label$date.xml in current working directory.
+        $label$date.xml in the parent directory.
+
+        Expects
+        * args[0]: mode (optional); "stream" (default) or "memory"
+
+        In stream mode, the files are read with iterparse and the pack is
+        written incrementally (see _packStream), so memory doesn't grow with
+        the size of the pack. In memory mode, all files are joined into one
+        Module object before it's written to disk.
 
         mink's dsl
-            pack
+            pack [mode]
         """
+        try:
+            mode = args[0]
+        except:
+            mode = "stream"
         label = str(self.project_dir.parent.name)
         date = str(self.project_dir.name)
-        pack_fn = self.project_dir / f"../{label}{date}.xml".resolve()
+        pack_fn = (self.project_dir / f"../{label}{date}.xml").resolve()
         if pack_fn.exists():
             print(f"Pack file exists already, no overwrite: {pack_fn}")
-        else:
-            print(f"Making new pack file: {pack_fn}")
+            return
+        print(f"Making new pack file: {pack_fn}")
+        files = sorted(self.project_dir.glob("*-join-*.xml"))
+        if mode == "stream":
+            self._packStream(files=files, path=pack_fn)
+        elif mode == "memory":
             m = Module()
-            for in_fn in self.project_dir.glob("*-join-*.xml"):
+            for in_fn in files:
                 print(f"Packing file {in_fn}")
                 m = m + Module(file=in_fn)
             m.toFile(path=pack_fn)
+        else:
+            raise SyntaxError(f"ERROR: Unknown pack mode: {mode}")
 
     #
     # HELPERS
@@ -341,6 +393,27 @@ class Mink:
     def _chunkPath(self, *, Type, ID, no, suffix):
         return self.project_dir / f"{Type}{ID}-chunk{no}{suffix}"
 
+    def _chunkPlanned(self, *, Type, ID, target, since) -> None:
+        """
+        chunk with a plan: the plan file in the project dir records which
+        chunks are done, so an aborted run continues where it left off.
+        """
+        plan_fn = self.project_dir / f"{Type}{ID}-plan.json"
+        print(f" planned chunks, see {plan_fn}")
+        for no, chunk in self.chunker.getPlanned(
+            ID=ID,
+            Type=Type,
+            target=target,
+            since=since,
+            workers=self.throttle.maxInFlight,
+            planFile=plan_fn,
+        ):
+            chunk_fn = self._chunkPath(Type=Type, ID=ID, no=no, suffix=".xml")
+            chunk.clean()
+            self.info(f"zipping chunk {chunk_fn}")
+            chunk.toZip(path=chunk_fn)
+            chunk.validate()
+
     def _fastforward(self, *, Type, ID, suffix):
         """
         Given the usual params for a chunk filename (i.e. Type,ID, suffix), we loop
@@ -379,7 +452,12 @@ class Mink:
             FromM = Module(file=From)
 
         try:
-            expected = self.sar.saveAttachments(data=FromM, adir=pix_dir, since=since)
+            expected = self.sar.saveAttachments(
+                data=FromM,
+                adir=pix_dir,
+                since=since,
+                workers=self.throttle.maxInFlight,
+            )
         except Exception as e:
             self.info("Error during saveAttachments")
             raise e
@@ -454,6 +532,76 @@ class Mink:
         # We dont need parts dir when in chunk mode, so we're making it later
         self.parts_dir = self.project_dir / "parts"
 
+    def _saveMetrics(self) -> None:
+        """Write request metrics of the whole job to the project dir."""
+        if self.metrics_dir is None:
+            return
+        self.metrics.toPrometheus(path=self.metrics_dir / "metrics.prom")
+        self.metrics.toJSON(path=self.metrics_dir / "metrics.json")
+        for endpoint, stats in self.metrics.summary().items():
+            self.info(
+                f"{endpoint}: {stats['count']} calls, {stats['errors']} errors, "
+                f"{stats['retries']} retries, {stats['latency']['mean']:.2f}s avg"
+            )
+
+    def _packStream(self, *, files: list, path: Path) -> None:
+        """
+        Merge several zml files into one without loading them into memory.
+        Only a single moduleItem and a table with the ids and timestamps of
+        all items are held in memory at any time.
+
+        Like Module's add, we keep only distinct moduleItems and of duplicate
+        items only the newest (according to __lastModified); of equally new
+        items, the first one wins.
+
+        Algorithm
+        * 1st pass: read all files and note for every (mtype, id) the newest
+          version and the file it's in.
+        * 2nd pass: for every mtype, read the files again that have items of
+          that type and write the winning items, so that all items of one
+          type end up in one module element.
+        """
+        standardDT = Module()._standardDT
+        newest = {}  # (mtype, ID) -> (lastModified, fileNo)
+        sizes = {}  # mtype -> number of distinct items
+        fileTypes = []  # fileNo -> mtypes in that file
+        for fileNo, in_fn in enumerate(files):
+            print(f"Indexing file {in_fn}")
+            mtypes = set()
+            for itemN in Module.iterFile(path=in_fn):
+                mtype = itemN.getparent().get("name")
+                mtypes.add(mtype)
+                key = (mtype, itemN.get("id"))
+                lastModified = standardDT(inputN=itemN)
+                if key not in newest:
+                    sizes[mtype] = sizes.get(mtype, 0) + 1
+                    newest[key] = (lastModified, fileNo)
+                elif newest[key][0] < lastModified:
+                    newest[key] = (lastModified, fileNo)
+            fileTypes.append(mtypes)
+
+        ns = NSMAP["m"]
+        with etree.xmlfile(str(path), encoding="UTF-8") as xf:
+            xf.write_declaration(standalone=True)
+            with xf.element(f"{{{ns}}}application", nsmap={None: ns}):
+                with xf.element(f"{{{ns}}}modules"):
+                    for mtype in sizes:
+                        with xf.element(
+                            f"{{{ns}}}module", name=mtype, totalSize=str(sizes[mtype])
+                        ):
+                            for fileNo, in_fn in enumerate(files):
+                                if mtype not in fileTypes[fileNo]:
+                                    continue
+                                print(f"Packing {mtype} from {in_fn}")
+                                for itemN in Module.iterFile(path=in_fn, mtype=mtype):
+                                    key = (mtype, itemN.get("id"))
+                                    if newest.get(key) == (
+                                        standardDT(inputN=itemN),
+                                        fileNo,
+                                    ):
+                                        xf.write(itemN, pretty_print=True)
+                                        del newest[key]
+
     def _parse_conf(self, *, job: str) -> None:
         """
         For a job specified on command line, executes the dsl commands in that job.
@@ -485,6 +633,8 @@ class Mink:
                         self._mkdirs()  # also sets project_dir etc.
                         self._init_log()
                         self.info(f"Project dir: {self.project_dir}")
+                        if self.metrics_dir is None:  # not for jobs run by all
+                            self.metrics_dir = self.project_dir
                     else:
                         self.project_dir: Path = Path(".")
                         right_job = False
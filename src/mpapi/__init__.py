@@ -8,6 +8,7 @@ from getAttachments import GetAttachments
 from mink import Mink
 from mpapi.module import Module
 from mpapi.client import MpApi
+from mpapi.throttle import Throttle
 from pathlib import Path
 import tomllib
 
@@ -33,12 +34,33 @@ def mink():
     parser = argparse.ArgumentParser(description="Commandline frontend for MpApi.py")
     parser.add_argument("-j", "--job", help="job to run")  # , required=True
     parser.add_argument("-c", "--conf", help="config file", default="jobs.dsl")
+    _throttleArgs(parser)
+    parser.add_argument(
+        "--prefetch",
+        help="chunks downloaded in advance (default 0)",
+        type=int,
+        default=0,
+    )
+    parser.add_argument(
+        "--plan",
+        help="count items first, then get chunks in parallel",
+        action="store_true",
+    )
     parser.add_argument("-v", "--version", help="Display version information")
     args = parser.parse_args()
     if args.version:
         print(f"Version: {__version__}")
         sys.exit(0)
-    m = Mink(job=args.job, conf=args.conf, baseURL=baseURL, pw=pw, user=user)
+    m = Mink(
+        job=args.job,
+        conf=args.conf,
+        baseURL=baseURL,
+        pw=pw,
+        user=user,
+        throttle=_throttle(args),
+        prefetch=args.prefetch,
+        plan=args.plan,
+    )
 
 
 def updateItem():
@@ -103,5 +125,24 @@ def getAttachments():
     parser.add_argument(
         "-j", "--job", required=True, help="pick a job from getAttachments.jobs file"
     )
+    _throttleArgs(parser)
     args = parser.parse_args()
-    GetAttachments(baseURL=baseURL, job=args.job, user=user, pw=pw)
+    GetAttachments(
+        baseURL=baseURL, job=args.job, user=user, pw=pw, throttle=_throttle(args)
+    )
+
+
+def _throttleArgs(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument(
+        "-p",
+        "--parallel",
+        help="max. number of parallel requests to RIA",
+        type=int,
+        default=4,
+    )
+    parser.add_argument("--rps", help="max. requests per second", type=float)
+    parser.add_argument("--bps", help="max. bytes per second", type=float)
+
+
+def _throttle(args: argparse.Namespace) -> Throttle:
+    return Throttle(maxInFlight=args.parallel, rps=args.rps, bps=args.bps)
@@ -0,0 +1,183 @@
+"""
+AsyncMpApi - asyncio interface for MpApi with a limit on requests in flight
+
+Harvesting is mostly waiting for RIA, so we want to have several requests
+on the way at the same time. AsyncMpApi mirrors the core endpoints of MpApi
+as coroutines and returns the same types (Module objects, requests'
+responses).
+
+USAGE
+    import asyncio
+    from mpapi.aclient import AsyncMpApi
+
+    async def main():
+        async with AsyncMpApi(baseURL=baseURL, user=user, pw=pw, maxInFlight=8) as api:
+            m = await api.getItem2(mtype="Object", ID=12345)
+            mL = await asyncio.gather(
+                *[api.getItem2(mtype="Object", ID=ID) for ID in IDs]
+            )
+            m = await api.search2(query=q)
+
+    asyncio.run(main())
+
+DESIGN
+* Requests are made by a normal MpApi object (see self.api), so everything
+  MpApi does (authentication, error handling) applies here too. Each call
+  runs in a thread pool with maxInFlight workers; that's the limit of
+  concurrent requests. Parsing the response also happens in the pool, not in
+  the event loop.
+* We don't depend on an async http library; requests' connection pool is
+  sized to maxInFlight, so connections get reused. Retries and timeouts
+  work as in MpApi.
+* At most maxInFlight requests are on the way; further calls wait in line in
+  the order they were made.
+"""
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from mpapi.client import MpApi
+from mpapi.module import Module
+from mpapi.search import Search
+import requests
+from typing import Any, Callable
+
+
+class AsyncMpApi:
+    def __init__(
+        self,
+        *,
+        baseURL: str,
+        user: str,
+        pw: str,
+        acceptLang: str = "de",
+        maxInFlight: int = 8,
+        **kwargs,
+    ) -> None:
+        """
+        Further keyword arguments (retries, backoff, retryBudget, timeout etc.)
+        are passed on to MpApi.
+        """
+        if maxInFlight < 1:
+            raise ValueError("maxInFlight needs to be at least 1")
+        self.maxInFlight = maxInFlight
+        self.api = MpApi(
+            baseURL=baseURL,
+            user=user,
+            pw=pw,
+            acceptLang=acceptLang,
+            poolSize=maxInFlight,
+            **kwargs,
+        )
+        self._executor = ThreadPoolExecutor(
+            max_workers=maxInFlight, thread_name_prefix="AsyncMpApi"
+        )
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """Waits for running requests and closes the connections."""
+        self._executor.shutdown(wait=True)
+        self.api.session.close()
+
+    #
+    # SEARCH
+    #
+
+    async def search(self, *, xml: str) -> requests.Response:
+        return await self._run(self.api.search, xml=xml)
+
+    async def search2(self, *, query: Search) -> Module:
+        """
+        EXPECTS
+        * Search object
+        RETURNS
+        * Module object
+        """
+        return await self._run(self.api.search2, query=query)
+
+    #
+    # WHOLE MODULE ITEMS
+    #
+
+    async def getItem(self, *, module: str, id: int) -> requests.Response:
+        return await self._run(self.api.getItem, module=module, id=id)
+
+    async def getItem2(self, *, mtype: str, ID: int) -> Module:
+        return await self._run(self.api.getItem2, mtype=mtype, ID=ID)
+
+    async def createItem2(self, *, mtype: str, data: Module) -> Module:
+        return await self._run(self.api.createItem2, mtype=mtype, data=data)
+
+    async def createItem3(self, *, data: Module) -> int:
+        """Returns the id of the new item."""
+        return await self._run(self.api.createItem3, data=data)
+
+    async def updateItem2(
+        self, *, mtype: str, ID: int, data: Module
+    ) -> requests.Response:
+        return await self._run(self.api.updateItem2, mtype=mtype, ID=ID, data=data)
+
+    async def updateItem4(self, data: Module) -> requests.Response:
+        """mtype and ID are taken from data"""
+        return await self._run(self.api.updateItem4, data)
+
+    async def deleteItem2(self, *, mtype: str, ID: int) -> requests.Response:
+        return await self._run(self.api.deleteItem2, mtype=mtype, ID=ID)
+
+    #
+    # ATTACHMENTS
+    #
+
+    async def getAttachment(self, *, module: str, id: int) -> requests.Response:
+        return await self._run(self.api.getAttachment, module=module, id=id)
+
+    async def saveAttachment(
+        self, *, module: str = "Multimedia", id: int, path: str
+    ) -> int:
+        """Saves the attachment to path; returns id if successful."""
+        return await self._run(self.api.saveAttachment, module=module, id=id, path=path)
+
+    async def updateAttachment(
+        self, *, module: str, id: int, path: str = None, **kwargs
+    ) -> requests.Response:
+        """Streams path or data (see MpApi.updateAttachment)."""
+        return await self._run(
+            self.api.updateAttachment, module=module, id=id, path=path, **kwargs
+        )
+
+    async def deleteAttachment(self, *, module: str, id: int) -> requests.Response:
+        return await self._run(self.api.deleteAttachment, module=module, id=id)
+
+    #
+    # VOCABULARY
+    #
+
+    async def vInfo(self, *, instanceName: str, id: int = None) -> requests.Response:
+        return await self._run(self.api.vInfo, instanceName=instanceName, id=id)
+
+    async def vGetNodes(self, *, instanceName: str, **kwargs) -> requests.Response:
+        """Accepts the same optional parameters as MpApi.vGetNodes"""
+        return await self._run(self.api.vGetNodes, instanceName=instanceName, **kwargs)
+
+    async def vNodeByIdentifier(
+        self, *, instanceName: str, id: int
+    ) -> requests.Response:
+        return await self._run(
+            self.api.vNodeByIdentifier, instanceName=instanceName, id=id
+        )
+
+    #
+    # HELPERS
+    #
+
+    async def _run(self, func: Callable, *args, **kwargs) -> Any:
+        """Run a method of MpApi in the pool and wait for the result."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._executor, partial(func, *args, **kwargs)
+        )
@@ -0,0 +1,110 @@
+"""
+SessionAuth - authenticate with a RIA session key instead of the password
+
+With HTTP Basic auth, RIA checks user and password on every request. A
+session key is checked much faster, so bulk jobs should get a key once and
+send that instead.
+
+USAGE
+    api = MpApi(baseURL=baseURL, user=user, pw=pw, auth="session")
+
+    # share one key between several clients (threads, AsyncMpApi, Sar ...)
+    from mpapi.auth import SessionAuth
+    auth = SessionAuth(baseURL=baseURL, user=user, pw=pw)
+    api = MpApi(baseURL=baseURL, user=user, pw=pw, auth=auth)
+    sar = Sar(baseURL=baseURL, user=user, pw=pw, auth=auth)
+
+DESIGN
+* RIA accepts the session key in place of the password, i.e. the request
+  still has a Basic Authorization header, but with user and key.
+* The key is fetched lazily with user and password (GET .../session) on
+  the first request and then used by all requests, whatever thread they
+  come from.
+* If RIA answers 401, the key has probably expired. MpApi fetches a new key
+  (see refresh) and sends the request again, once; since that's done in
+  MpApi._send, the repeated request goes through the throttle and is
+  recorded in the metrics like any other. If several threads run into the
+  401 at the same time, only the first one fetches a new key; the others
+  use it.
+"""
+
+from lxml import etree  # type: ignore
+from mpapi.constants import parser
+import requests
+from requests.auth import AuthBase, _basic_auth_str
+import threading
+from typing import Optional
+
+sessionNS = {"s": "http://www.zetcom.com/ria/ws/session"}
+
+
+def sessionKey(*, xml: bytes) -> str:
+    """Extract the key from RIA's session response; raises ValueError."""
+    tree = etree.fromstring(xml, parser)
+    keyL = tree.xpath("/s:application/s:session/s:key/text()", namespaces=sessionNS)
+    if not keyL:
+        raise ValueError("No session key in response")
+    return str(keyL[0])
+
+
+class SessionAuth(AuthBase):
+    def __init__(
+        self,
+        *,
+        baseURL: str,
+        user: str,
+        pw: str,
+        key: Optional[str] = None,
+        timeout: float = 30,
+    ) -> None:
+        """
+        EXPECTS
+        * baseURL, user, pw: RIA credentials; pw is only used to get a key
+        * key (optional): a session key we already have
+        * timeout: seconds to wait for a new key
+        """
+        self.url = baseURL + "/ria-ws/application/session"
+        self.user = user
+        self.pw = pw
+        self.key = key
+        self.timeout = timeout
+        self.refreshs = 0  # how often we got a new key
+        self._lock = threading.Lock()
+
+    def __call__(self, r: requests.PreparedRequest) -> requests.PreparedRequest:
+        key = self.current()
+        r.headers["Authorization"] = _basic_auth_str(self.user, key)
+        r._sessionKey = key  # type: ignore  # see refresh
+        return r
+
+    def current(self) -> str:
+        """The session key; gets one if we don't have it yet."""
+        with self._lock:
+            if self.key is None:
+                self.key = self._fetch()
+            return self.key
+
+    def refresh(self, *, stale: Optional[str] = None) -> str:
+        """
+        Get a new key, unless another thread already replaced the stale
+        one; returns the current key.
+        """
+        with self._lock:
+            if self.key is None or self.key == stale:
+                self.key = self._fetch()
+                self.refreshs += 1
+            return self.key
+
+    #
+    # private helpers
+    #
+
+    def _fetch(self) -> str:
+        r = requests.get(
+            self.url,
+            auth=(self.user, self.pw),
+            headers={"Accept": "application/xml;charset=UTF-8"},
+            timeout=self.timeout,
+        )
+        r.raise_for_status()
+        return sessionKey(xml=r.content)
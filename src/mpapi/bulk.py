@@ -0,0 +1,204 @@
+"""
+BulkUpdater - update many items in parallel with a journal for restarts
+
+Updating thousands of items one by one takes long, and if something goes
+wrong halfway, we need to know which updates went through. BulkUpdater
+sends the updates with a few threads and records every item in an
+append-only journal; when we run it again, completed items are skipped.
+
+USAGE
+    from mpapi.bulk import BulkUpdater
+    bulk = BulkUpdater(api=api, journal="update.journal", workers=4)
+    stats = bulk.run(data=m)            # Module with many items
+    stats = bulk.run(data="updates/")   # dir of xml (or zip) files
+    # -> {"updated": 990, "failed": 10, "skipped": 0, "seconds": 95.1, "rate": 10.4}
+
+    # something other than updateItem2, e.g. a single field
+    def action(*, mtype, ID, data):
+        value = data.xpath("//m:dataField[@name='ObjTechnicalTermClb']/m:value/text()")
+        return api.updateField2(mtype=mtype, ID=ID, dataField="ObjTechnicalTermClb",
+            value=value[0])
+    BulkUpdater(api=api, journal="field.journal", action=action).run(data=m)
+
+DESIGN
+* Every item becomes a Module of its own and is passed to action, which is
+  api.updateItem2 by default. Retries, timeouts, the throttle and metrics
+  of the api apply.
+* Items are read lazily (files with Module.iterFile) and only a few of them
+  wait for a worker at a time, so memory use doesn't grow with the input.
+* The journal has one json line per finished item: mtype, id, status ("ok"
+  or "failed"), duration in seconds, time and, for failures, the error.
+  Lines are only appended and flushed one by one, so a crash loses at most
+  the line being written. Items with status ok are skipped in later runs;
+  failed items are tried again. If reading the items fails or the run is
+  interrupted, updates that were already sent are still journaled.
+* Progress is printed every reportEvery seconds.
+"""
+
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+import datetime
+import json
+from mpapi.module import Module
+from pathlib import Path
+import time
+from typing import Any, Callable, Iterator, Optional, Union
+
+PathX = Union[Path, str]
+
+
+class BulkUpdater:
+    def __init__(
+        self,
+        *,
+        api: Any,
+        journal: PathX,
+        workers: int = 4,
+        action: Optional[Callable] = None,
+        reportEvery: float = 10,
+    ) -> None:
+        """
+        EXPECTS
+        * api: MpApi object used for the requests
+        * journal: path of the journal; it's created if it doesn't exist
+        * workers: number of concurrent updates
+        * action (optional): callable with the keyword arguments mtype, ID and
+          data (Module with a single item) that makes the request; default is
+          api.updateItem2
+        * reportEvery: seconds between progress reports
+        """
+        if workers < 1:
+            raise ValueError("workers needs to be at least 1")
+        self.api = api
+        self.journal = Path(journal)
+        self.workers = workers
+        self.action = api.updateItem2 if action is None else action
+        self.reportEvery = reportEvery
+        self.errors: dict = {}  # (mtype, ID) -> exception
+
+    def completed(self) -> set:
+        """(mtype, ID) of the items the journal has as updated."""
+        done = set()
+        if not self.journal.exists():
+            return done
+        with open(self.journal, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:  # last line may be cut off by a crash
+                    continue
+                key = (entry["mtype"], int(entry["id"]))
+                if entry["status"] == "ok":
+                    done.add(key)
+                else:
+                    done.discard(key)
+        return done
+
+    def run(self, *, data: Union[Module, PathX], mtype: Optional[str] = None) -> dict:
+        """
+        Update all items in data, a Module or the path of a file or dir
+        with xml or zip files (as written by Module.toFile and toZip). If
+        mtype is given, only items of that type are updated.
+
+        RETURNS
+        * dict with the numbers of updated, failed and skipped items, the
+          seconds it took and the rate (items per second)
+        """
+        done = self.completed()
+        self.stats = {"updated": 0, "failed": 0, "skipped": 0}
+        self._start = self._lastReport = time.monotonic()
+        with ThreadPoolExecutor(
+            max_workers=self.workers, thread_name_prefix="BulkUpdater"
+        ) as executor, open(self.journal, "a", encoding="utf-8") as journal:
+            pending: set = set()
+            try:
+                for itemType, ID, single in self._items(data=data, mtype=mtype):
+                    if (itemType, ID) in done:
+                        self.stats["skipped"] += 1
+                        continue
+                    if len(pending) >= 2 * self.workers:
+                        finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        self._finish(finished, journal=journal)
+                    pending.add(executor.submit(self._update, itemType, ID, single))
+            except BaseException:
+                for future in pending:
+                    future.cancel()  # only those that haven't started yet
+                raise
+            finally:
+                # journal what was sent, even if reading items failed or we
+                # were interrupted
+                finished = {f for f in wait(pending).done if not f.cancelled()}
+                self._finish(finished, journal=journal)
+        self._report()
+        if self.errors:
+            print(f"WARN: {len(self.errors)} updates failed, see {self.journal}")
+        return self.stats
+
+    #
+    # private helpers
+    #
+
+    def _finish(self, futures: set, *, journal: Any) -> None:
+        """Write finished updates to the journal and report progress."""
+        for future in futures:
+            mtype, ID, duration, error = future.result()
+            entry = {
+                "mtype": mtype,
+                "id": ID,
+                "status": "ok" if error is None else "failed",
+                "duration": round(duration, 3),
+                "time": datetime.datetime.now().isoformat(timespec="seconds"),
+            }
+            if error is None:
+                self.stats["updated"] += 1
+            else:
+                entry["error"] = str(error)
+                self.stats["failed"] += 1
+                self.errors[(mtype, ID)] = error
+            journal.write(json.dumps(entry) + "\n")
+            journal.flush()
+        if time.monotonic() - self._lastReport >= self.reportEvery:
+            self._report()
+
+    def _items(self, *, data: Union[Module, PathX], mtype: Optional[str]) -> Iterator:
+        """Yields (mtype, ID, Module with only that item)."""
+        if isinstance(data, Module):
+            itemsL: Iterator = iter(data)
+        else:
+            path = Path(data)
+            if path.is_dir():
+                files = sorted(
+                    p for p in path.iterdir() if p.suffix in (".xml", ".zip")
+                )
+            else:
+                files = [path]
+            itemsL = (itemN for p in files for itemN in Module.iterFile(path=p))
+        for itemN in itemsL:
+            itemType = itemN.getparent().get("name")
+            if mtype is not None and itemType != mtype:
+                continue
+            ID = itemN.get("id")
+            if ID is None:
+                raise ValueError(f"moduleItem of type {itemType} without id")
+            single = Module()
+            single.addItem(itemN=itemN, mtype=itemType)  # a copy
+            yield itemType, int(ID), single
+
+    def _report(self) -> None:
+        self._lastReport = time.monotonic()
+        seconds = self._lastReport - self._start
+        finished = self.stats["updated"] + self.stats["failed"]
+        self.stats["seconds"] = round(seconds, 1)
+        self.stats["rate"] = round(finished / seconds, 1) if seconds else 0.0
+        print(
+            f" {self.stats['updated']} updated, {self.stats['failed']} failed, "
+            f"{self.stats['skipped']} skipped; {self.stats['rate']} items/s"
+        )
+
+    def _update(self, mtype: str, ID: int, single: Module) -> tuple:
+        """Runs in a worker; returns (mtype, ID, duration, error or None)."""
+        start = time.monotonic()
+        try:
+            self.action(mtype=mtype, ID=ID, data=single)
+        except Exception as e:
+            return mtype, ID, time.monotonic() - start, e
+        return mtype, ID, time.monotonic() - start, None
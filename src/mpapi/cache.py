@@ -0,0 +1,226 @@
+"""
+ResponseCache - an on-disk cache for RIA's responses
+
+Many jobs ask RIA the same questions again and again: the same searches, the
+same items, the module definitions. ResponseCache keeps the responses in a
+SQLite database, so MpApi can answer repeated requests from disk.
+
+USAGE
+    from mpapi.cache import ResponseCache
+    cache = ResponseCache(path="ria.cache", ttl=24 * 3600, maxSize=500 * 2**20)
+    api = MpApi(baseURL=baseURL, user=user, pw=pw, cache=cache)
+    api.getItem2(mtype="Object", ID=123)  # from RIA
+    api.getItem2(mtype="Object", ID=123)  # from cache
+    print(cache.stats())                  # {"hits": 1, "misses": 1, ...}
+
+    # stale entries are not simply thrown away, but checked with a cheap
+    # search for items that have changed since the response (see MpApi)
+    cache = ResponseCache(path="ria.cache", ttl=3600, revalidate=True)
+
+DESIGN
+* Entries are keyed by method, url, the Accept header and the request body.
+  Bodies that are xml (i.e. searches) are canonicalized first, so
+  whitespace, attribute order and the like don't produce new entries.
+* Response bodies are stored zlib-compressed.
+* An entry older than ttl seconds is stale. Stale entries are either
+  fetched again or, with revalidate=True, checked by MpApi.
+* If the compressed bodies together exceed maxSize bytes, the least
+  recently used entries are deleted.
+* MpApi only caches reads (GET and searches) without stream=True and drops
+  all entries of a module type when it writes to that type.
+"""
+
+from collections import namedtuple
+import hashlib
+from lxml import etree  # type: ignore
+from mpapi.constants import parser
+from pathlib import Path
+import sqlite3
+import threading
+import time
+from typing import Optional, Union
+import zlib
+
+PathX = Union[Path, str]
+
+# body: uncompressed bytes; created: unix time when stored or revalidated
+Entry = namedtuple("Entry", ["body", "contentType", "created", "stale"])
+
+
+class ResponseCache:
+    def __init__(
+        self,
+        *,
+        path: PathX,
+        ttl: Optional[float] = None,
+        maxSize: int = 500 * 2**20,
+        revalidate: bool = False,
+    ) -> None:
+        """
+        EXPECTS
+        * path: sqlite database; created if it doesn't exist yet
+        * ttl: seconds until an entry gets stale; None means never
+        * maxSize: max. size of compressed bodies in bytes
+        * revalidate: if True, stale entries are revalidated instead of
+          fetched again where possible
+        """
+        self.path = Path(path)
+        self.ttl = ttl
+        self.maxSize = maxSize
+        self.revalidate = revalidate
+        self.hits = 0
+        self.misses = 0
+        self.revalidated = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self.db = sqlite3.connect(str(self.path), check_same_thread=False)
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                url TEXT NOT NULL,
+                contentType TEXT,
+                created REAL NOT NULL,
+                accessed REAL NOT NULL,
+                size INTEGER NOT NULL,
+                body BLOB NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS responsesByAccess ON responses (accessed);
+            """)
+
+    def clear(self) -> None:
+        with self._lock, self.db:
+            self.db.execute("DELETE FROM responses")
+
+    def close(self) -> None:
+        self.db.close()
+
+    def get(self, *, key: str) -> Optional[Entry]:
+        """
+        Returns the entry for key (stale or not) or None; counts hits and
+        misses (stale entries count as misses).
+        """
+        with self._lock:
+            row = self.db.execute(
+                "SELECT body, contentType, created FROM responses WHERE key = ?",
+                (key,),
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            body, contentType, created = row
+            stale = self.ttl is not None and time.time() - created > self.ttl
+            if stale:
+                self.misses += 1
+            else:
+                self.hits += 1
+                with self.db:
+                    self.db.execute(
+                        "UPDATE responses SET accessed = ? WHERE key = ?",
+                        (time.time(), key),
+                    )
+        return Entry(zlib.decompress(body), contentType, created, stale)
+
+    def invalidate(self, *, prefix: str) -> int:
+        """Delete all entries whose url starts with prefix; returns number."""
+        with self._lock, self.db:
+            cur = self.db.execute(
+                "DELETE FROM responses WHERE substr(url, 1, ?) = ?",
+                (len(prefix), prefix),
+            )
+        return cur.rowcount
+
+    def key(
+        self,
+        *,
+        method: str,
+        url: str,
+        accept: str = None,
+        data: bytes = None,
+        language: str = None,
+        user: str = None,
+    ) -> str:
+        """
+        Returns the key for a request; see canonical for the body. Clients
+        with another Accept-Language or another user (who may have other
+        rights) get entries of their own.
+        """
+        h = hashlib.sha256()
+        for part in (method.upper(), url, accept or "", language or "", user or ""):
+            h.update(part.encode() + b"\n")
+        h.update(self.canonical(data))
+        return h.hexdigest()
+
+    def put(self, *, key: str, url: str, body: bytes, contentType: str = None) -> None:
+        """Store a response body and evict old entries if necessary."""
+        blob = zlib.compress(body)
+        now = time.time()
+        with self._lock, self.db:
+            self.db.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, url, contentType, now, now, len(blob), blob),
+            )
+            self._evict()
+
+    def stats(self) -> dict:
+        """Returns counters and current size of the cache."""
+        with self._lock:
+            entries, size = self.db.execute(
+                "SELECT count(*), coalesce(sum(size), 0) FROM responses"
+            ).fetchone()
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "revalidated": self.revalidated,
+            "evictions": self.evictions,
+            "entries": entries,
+            "size": size,
+        }
+
+    def touch(self, *, key: str) -> None:
+        """Mark a stale entry as fresh again after successful revalidation."""
+        now = time.time()
+        with self._lock, self.db:
+            self.db.execute(
+                "UPDATE responses SET created = ?, accessed = ? WHERE key = ?",
+                (now, now, key),
+            )
+            self.revalidated += 1
+
+    @staticmethod
+    def canonical(data: Union[bytes, str, None]) -> bytes:
+        """
+        Canonical form of a request body: xml is parsed without blank text
+        and written as c14n; other bodies are used as they are.
+        """
+        if data is None:
+            return b""
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        try:
+            root = etree.fromstring(data, parser)
+        except etree.XMLSyntaxError:
+            return data
+        return etree.tostring(root, method="c14n")
+
+    #
+    # private helpers
+    #
+
+    def _evict(self) -> None:
+        """Delete least recently used entries until we're below maxSize."""
+        (total,) = self.db.execute(
+            "SELECT coalesce(sum(size), 0) FROM responses"
+        ).fetchone()
+        if total <= self.maxSize:
+            return
+        rows = self.db.execute(
+            "SELECT key, size FROM responses ORDER BY accessed"
+        ).fetchall()
+        dropL = []
+        for key, size in rows:
+            if total <= self.maxSize:
+                break
+            dropL.append((key,))
+            total -= size
+        self.db.executemany("DELETE FROM responses WHERE key = ?", dropL)
+        self.evictions += len(dropL)
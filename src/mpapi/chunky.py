@@ -64,16 +64,38 @@
     * Should we write chunks to disk? No. That's not chunky's job. Should be 
       done by mink etc.
     * Let's experiment with type hints again; we're using Python 3.9 type hints
+
+    PREFETCH AND PLANNING
+    * Processing a chunk (cleaning, zipping, validating) takes a while and the
+      network is idle meanwhile. With getByType(..., prefetch=N), the next N
+      chunks (with their related items) are fetched by N worker threads while
+      the caller is busy with the current one. Chunks are yielded in order;
+      while the caller works on one, N more are fetched or waiting, so N + 1
+      are in memory. When the next one is handed over, the caller may still
+      hold the previous one, so there can be N + 2 for a moment.
+    * We still don't know where the end is, so we fetch up to N chunks past
+      the last one. They come back empty and are thrown away.
+    * getPlanned is the deterministic version: plan asks for the totalSize
+      first (limit 0), so we know all offsets in advance. The plan can be
+      saved to a file; then an interrupted harvest continues with the chunks
+      that aren't done yet.
 """
 
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
+from itertools import count, islice
+import json
 from lxml import etree
+import os
 from pathlib import Path
-from typing import Any, Iterator, List, Union
+from typing import Any, Iterable, Iterator, List, Optional, Union
 from mpapi.search import Search
 from mpapi.client import MpApi
 from mpapi.helper import Helper
 from mpapi.module import Module
 from mpapi.sar import Sar
+from mpapi.xpaths import xpaths
 
 NSMAP = {
     "s": "http://www.zetcom.com/ria/ws/module/search",
@@ -96,10 +118,13 @@ allowed_types = ["approval", "exhibit", "group", "loc", "query"]
 
 
 class Chunky(Helper):
-    def __init__(self, *, chunkSize: int, baseURL: str, pw: str, user: str) -> None:
+    def __init__(
+        self, *, chunkSize: int, baseURL: str, pw: str, user: str, **kwargs
+    ) -> None:
+        """Further keyword arguments (e.g. throttle) are passed on to MpApi."""
         self.chunkSize = chunkSize
-        self.api = MpApi(baseURL=baseURL, user=user, pw=pw)
-        self.sar = Sar(baseURL=baseURL, user=user, pw=pw)
+        self.api = MpApi(baseURL=baseURL, user=user, pw=pw, **kwargs)
+        self.sar = Sar(baseURL=baseURL, user=user, pw=pw, **kwargs)
 
     def getByType(
         self,
@@ -109,6 +134,7 @@ class Chunky(Helper):
         target="Object",
         since: since = None,
         offset: int = 0,
+        prefetch: int = 0,
     ) -> Iterator[Module]:
         """
         Get a pack based on approval [group], loc[ation], group, exhibit or query.
@@ -121,6 +147,9 @@ class Chunky(Helper):
         * since: xs:DateTime (more or less)
         * offset: initial offset to ignore object hits
         * target: result module type (only used with query)
+        * prefetch: number of chunks fetched in the background while the
+          current one is processed; 0 fetches one chunk after the other. Up
+          to prefetch + 2 chunks can be in memory (see PREFETCH above).
 
         RETURNS
         * iterator [chunk: Module]: an indepedent chunk with persons,
@@ -135,32 +164,109 @@ class Chunky(Helper):
         """
         if Type not in allowed_types:
             raise SyntaxError(f"Error: Chunk type not recognized: {Type}")
+        args = {"ID": ID, "Type": Type, "target": target, "since": since}
+
+        if prefetch > 0:
+            chunks = self._inOrder(
+                args=args, offsets=count(offset, self.chunkSize), workers=prefetch
+            )
+            with closing(chunks):
+                for chunkData in chunks:
+                    yield chunkData
+                    if chunkData.actualSize(module="Object") < self.chunkSize:
+                        return
 
         lastChunk: bool = False
         while not lastChunk:
-            chunkData = Module()  # new zml Module object
-            if Type == "query":
-                partET = self._savedQuery(Type=target, ID=ID, offset=offset)
-            else:
-                partET = self._getObjects(Type=Type, ID=ID, offset=offset, since=since)
-            chunkData.add(doc=partET)
-
-            # only look for related data if there is something in current chunk
-            if chunkData:
-                # all related Multimedia and Persons items, no chunking
-                for targetType in ["Multimedia", "Person"]:
-                    relatedET = self._relatedItems(
-                        part=partET, target=targetType, since=since
-                    )
-                    if relatedET is not None:
-                        chunkData.add(doc=relatedET)
-
+            chunkData = self._chunk(offset=offset, **args)
             offset += self.chunkSize  # wrong for last chunk
             actualSize = chunkData.actualSize(module="Object")
             if actualSize < self.chunkSize:
                 lastChunk = True
             yield chunkData
 
+    def getPlanned(
+        self,
+        *,
+        ID,
+        Type,
+        target="Object",
+        since: since = None,
+        workers: int = 4,
+        planFile: Union[Path, str, None] = None,
+    ) -> Iterator[tuple[int, Module]]:
+        """
+        Like getByType, but we know all chunks in advance (see plan) and
+        fetch them with several workers; chunks are yielded in order
+        together with their number (one-based).
+
+        EXPECTS
+        * ID, Type, target, since: as in getByType
+        * workers: number of chunks fetched at the same time
+        * planFile (optional): json file with the plan. If it exists, we
+          continue where it left off, i.e. chunks that are done are skipped;
+          otherwise a new plan is made and saved there.
+
+        RETURNS
+        * iterator [(no, chunk)]
+
+        NOTE
+        * A chunk is marked done in the plan file when the caller asks for
+          the next one, i.e. after the caller is done with it.
+        * Items that are added or deleted while we're harvesting shift the
+          offsets, as with getByType.
+        """
+        if Type not in allowed_types:
+            raise SyntaxError(f"Error: Chunk type not recognized: {Type}")
+        args = {"ID": ID, "Type": Type, "target": target, "since": since}
+        path = None if planFile is None else Path(planFile)
+        if path is not None and path.exists():
+            with open(path, "r", encoding="utf-8") as f:
+                plan = json.load(f)
+            theirs = {key: plan[key] for key in args}
+            if theirs != args or plan["chunkSize"] != self.chunkSize:
+                raise ValueError(f"Plan {path} is for another search: {theirs}")
+        else:
+            plan = self.plan(**args)
+            if path is not None:
+                self._savePlan(plan=plan, path=path)
+        todo = [entry for entry in plan["chunks"] if not entry["done"]]
+        chunks = self._inOrder(
+            args=args, offsets=[entry["offset"] for entry in todo], workers=workers
+        )
+        with closing(chunks):
+            for entry, chunkData in zip(todo, chunks):
+                yield entry["no"], chunkData
+                entry["done"] = True
+                if path is not None:
+                    self._savePlan(plan=plan, path=path)
+
+    def plan(self, *, ID, Type, target="Object", since: since = None) -> dict:
+        """
+        Ask RIA how many items there are (a search with limit 0) and plan
+        the chunks.
+
+        RETURNS
+        * dict with the arguments, chunkSize, totalSize and the list of
+          chunks, e.g.
+          {"ID": 123, "Type": "group", "target": "Object", "since": None,
+           "chunkSize": 1000, "totalSize": 2500, "chunks": [
+               {"no": 1, "offset": 0, "done": False}, ...]}
+        """
+        totalSize = self._count(ID=ID, Type=Type, target=target, since=since)
+        return {
+            "ID": ID,
+            "Type": Type,
+            "target": target,
+            "since": since,
+            "chunkSize": self.chunkSize,
+            "totalSize": totalSize,
+            "chunks": [
+                {"no": no, "offset": offset, "done": False}
+                for no, offset in enumerate(range(0, totalSize, self.chunkSize), 1)
+            ],
+        }
+
     def search(self, query: Search, since: since = None, offset: int = 0):
         """
         We could attempt a general chunky search. Just hand over a search query
@@ -175,14 +281,8 @@ class Chunky(Helper):
             query.offset = offset  # todo in search
             r = self.api.search(xml=query.toString())
             partET = etree.fromstring(r.content, ETparser)
-            chunkData.add(doc=partET)
-            # all related Multimedia and Persons items, no chunking
-            for targetType in ["Multimedia", "Person"]:
-                relatedET = self._relatedItems(
-                    part=partET, target=targetType, since=since
-                )
-                if relatedET is not None:
-                    chunkData.add(doc=relatedET)
+            chunkData.add(doc=partET, adopt=True)
+            self._addRelated(chunkData=chunkData, since=since)
 
             offset = offset + self.chunkSize
             actualNo = chunkData.actualSize(module="Object")
@@ -196,8 +296,45 @@ class Chunky(Helper):
     # private methods
     #
 
+    def _addRelated(self, *, chunkData: Module, since: since = None) -> None:
+        """
+        Add all Multimedia and Person items related to the items in chunkData
+        (no chunking). We look up the references of both target types before
+        we add anything, so only immediate relatives of the original items
+        are included. Responses are adopted, not copied.
+        """
+        relatedL = [
+            self._relatedItems(part=chunkData.etree, target=targetType, since=since)
+            for targetType in ["Multimedia", "Person"]
+        ]
+        for relatedET in relatedL:
+            if relatedET is not None:
+                chunkData.add(doc=relatedET, adopt=True)
+
+    def _chunk(
+        self, *, ID, Type: str, target: str, since: since, offset: int
+    ) -> Module:
+        """A single chunk: one part of (object) items with their relatives."""
+        chunkData = Module()  # new zml Module object
+        if Type == "query":
+            partET = self._savedQuery(Type=target, ID=ID, offset=offset)
+        else:
+            partET = self._getObjects(Type=Type, ID=ID, offset=offset, since=since)
+        chunkData.add(doc=partET, adopt=True)  # partET is empty afterwards
+
+        # only look for related data if there is something in current chunk
+        if chunkData:
+            self._addRelated(chunkData=chunkData, since=since)
+        return chunkData
+
     def _getObjects(
-        self, *, Type: str, ID: int, offset: int, since: since = None
+        self,
+        *,
+        Type: str,
+        ID: int,
+        offset: int,
+        since: since = None,
+        limit: Optional[int] = None,
     ) -> ET:
         """
         A part is the result from a single request, e.g. for one module type.
@@ -206,6 +343,7 @@ class Chunky(Helper):
         * ID: of requested group
         * offset: offset for search query
         * since: dateTime string; TODO
+        * limit: number of items; default is chunkSize
 
         RETURNS
         * ET document
@@ -222,7 +360,9 @@ class Chunky(Helper):
             "loc": "ObjCurrentLocationVoc",
         }
 
-        s = Search(module="Object", limit=self.chunkSize, offset=offset)
+        if limit is None:
+            limit = self.chunkSize
+        s = Search(module="Object", limit=limit, offset=offset)
 
         if since is not None:
             s.AND()
@@ -245,6 +385,44 @@ class Chunky(Helper):
         # print(f"status {r.status_code}")
         return etree.fromstring(r.content, ETparser)
 
+    def _inOrder(self, *, args: dict, offsets: Iterable[int], workers: int) -> Iterator:
+        """
+        Fetch the chunks at offsets with workers threads and yield them in
+        order; see PREFETCH above. Chunks that are still being fetched when
+        the caller stops iterating are abandoned.
+        """
+        offsets = iter(offsets)
+        executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="Chunky")
+        pending: deque = deque()
+        try:
+            while True:
+                for offset in islice(offsets, workers + 1 - len(pending)):
+                    pending.append(executor.submit(self._chunk, offset=offset, **args))
+                if not pending:
+                    return
+                # the other chunks are fetched while the caller works on this one
+                yield pending.popleft().result()
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def _count(self, *, ID, Type: str, target: str, since: since) -> int:
+        """Number of (object) items, from a search with limit 0."""
+        if Type == "query":
+            partET = self.api.runSavedQuery2(Type=target, ID=ID, offset=0, limit=0)
+        else:
+            partET = self._getObjects(Type=Type, ID=ID, offset=0, since=since, limit=0)
+        sizeL = xpaths["totalSizes"](partET)
+        if not sizeL:
+            raise TypeError("Response has no totalSize")
+        return int(sizeL[0])
+
+    def _savePlan(self, *, plan: dict, path: Path) -> None:
+        """Write the plan atomically."""
+        tmp = path.with_name(path.name + ".part")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(plan, f, indent=1)
+        os.replace(tmp, path)
+
     def _relatedItems(
         self, *, part: ET, target: str, since: since = None
     ) -> Union[ET, None]:
@@ -260,10 +438,7 @@ class Chunky(Helper):
         * etree document with related items of the target type
         """
 
-        IDs: Any = part.xpath(
-            f"//m:moduleReference[@targetModule = '{target}']/m:moduleReferenceItem/@moduleItemId",
-            namespaces=NSMAP,
-        )
+        IDs: Any = xpaths["relatedIDs"](part, target=target)
 
         if len(IDs) == 0:
             print(f"***WARN: No related {target} IDs found!")  # this is not an ERROR
@@ -3,6 +3,17 @@ MpApi - Unofficial Open Source Client for MuseumPlus MpRIA
 
 USAGE
     client = MpApi(baseURL=baseURL, user=user, pw=pw)
+    client = MpApi(
+        baseURL=baseURL, user=user, pw=pw,
+        poolSize=10,         # connections for threaded use
+        retries=3,           # retry failed GET, PUT, DELETE and searches
+        backoff=1,           # seconds, doubles with every retry (with jitter)
+        retryBudget=100,     # max. retries over the lifetime of client
+        timeout=(10, 300),   # (connect, read) timeout in seconds
+        throttle=Throttle(maxInFlight=8, rps=20),  # see throttle.py
+        metrics=Metrics(),   # counts, latencies, bytes; see metrics.py
+        auth="session",      # send a session key instead of the password
+    )
     r = client.getItem(module="Object", id="12345")
     client.toFile(response=r, path="path/to/file.xml")
     ... todo: some more examples
@@ -18,27 +29,127 @@ SEE ALSO
     http://docs.zetcom.com/ws
 """
 
-# import logging
+from concurrent.futures import ThreadPoolExecutor
+import logging
+from requests.adapters import HTTPAdapter
 from requests.auth import HTTPBasicAuth
 from lxml import etree  # type: ignore
+from mpapi.auth import SessionAuth, sessionKey
+from mpapi.cache import ResponseCache
 from mpapi.constants import NSMAP
+from mpapi.downloader import Downloader
+from mpapi.metrics import Metrics
 from mpapi.search import Search
 from mpapi.module import Module
+from mpapi.throttle import Throttle
+from mpapi.uploader import UploadBody
+from mpapi.xpaths import xpaths
 from pathlib import Path  # used only sparingly
-from typing import Any, Union
+import random
+import re
+import threading
+import time
+from typing import Any, Callable, Iterable, Iterator, Optional, Union
 import requests
 
 # ET: Any
 ETparser = etree.XMLParser(remove_blank_text=True)
+# (connect, read) in seconds, one number for both or None for no timeout
+Timeout = Union[float, tuple, None]
+DEFAULT: Any = object()  # use the timeout given in constructor
+
+idempotent = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+retryStatus = {429, 502, 503, 504}
+# POSTs that only read, i.e. searches and saved queries; cacheable
+searchURL = re.compile(r"/search(/|$)")
+# item or search whose cached response we can revalidate
+revalidateURL = re.compile(r"/module/([^/]+)/(?:(\d+)|search/?)$")
+
+
+def _changedSince(*, queryET: Any, since: str) -> bool:
+    """
+    Rewrite a search query in place, so that it counts the items that match
+    the query and have been modified after since. Returns False if we don't
+    know how for that query.
+    """
+    S = "{http://www.zetcom.com/ria/ws/module/search}"
+    expertL = queryET.xpath(
+        "/s:application/s:modules/s:module/s:search/s:expert", namespaces=NSMAP
+    )
+    if len(expertL) != 1 or len(expertL[0]) > 1:
+        return False
+    expertN = expertL[0]
+    searchN = expertN.getparent()
+    searchN.set("limit", "0")
+    searchN.set("offset", "0")
+    for selectN in searchN.findall(f"{S}select"):
+        searchN.remove(selectN)
+    if len(expertN):
+        criterionN = expertN[0]
+        andN = etree.SubElement(expertN, f"{S}and")
+        andN.append(criterionN)  # moves it
+        parentN = andN
+    else:
+        parentN = expertN
+    etree.SubElement(
+        parentN, f"{S}greater", fieldPath="__lastModified", operand=since
+    )
+    return True
 
 
 class MpApi:
     def __init__(
-        self, *, baseURL: str, user: str, pw: str, acceptLang: str = "de"
+        self,
+        *,
+        baseURL: str,
+        user: str,
+        pw: str,
+        acceptLang: str = "de",
+        poolSize: int = 10,
+        retries: int = 3,
+        backoff: float = 1,
+        maxBackoff: float = 60,
+        retryBudget: Optional[int] = None,
+        timeout: Timeout = (10, 300),
+        cache: Optional[ResponseCache] = None,
+        throttle: Optional[Throttle] = None,
+        metrics: Optional[Metrics] = None,
+        auth: Union[str, SessionAuth] = "basic",
     ) -> None:
+        """
+        EXPECTS
+        * baseURL, user, pw: RIA credentials
+        * acceptLang: language of formattedValues etc.
+        * poolSize: max. number of connections kept open; set it to the number
+          of threads that share this object
+        * retries: how often a failed request is repeated (see _request)
+        * backoff: seconds to wait before the first retry; doubles with each
+          further retry (with random jitter), but never more than maxBackoff
+        * retryBudget: max. number of retries over the lifetime of this object,
+          i.e. usually per job; None means no limit
+        * timeout: default (connect, read) timeout in seconds for every
+          request; a single number for both or None to wait forever
+        * cache (optional): ResponseCache for GETs and searches (see
+          _cachedRequest)
+        * throttle (optional): Throttle that limits concurrency and rate of
+          requests; share one between all clients of a job
+        * metrics (optional): Metrics that records every request per
+          endpoint; share one between all clients of a job
+        * auth: "basic" sends user and password with every request;
+          "session" gets a session key once and sends that instead (see
+          auth.py). Pass a SessionAuth to share a key between clients.
+        """
         self.appURL = baseURL + "/ria-ws/application"
+        self.user = user
         s = requests.Session()
-        s.auth = (user, pw)
+        if auth == "basic":
+            s.auth = (user, pw)
+        elif auth == "session":
+            s.auth = SessionAuth(baseURL=baseURL, user=user, pw=pw)
+        elif isinstance(auth, SessionAuth):
+            s.auth = auth
+        else:
+            raise ValueError(f"Unknown auth: {auth}")
         s.headers.update(
             {
                 "Content-Type": "application/xml",
@@ -46,34 +157,326 @@ class MpApi:
                 "Accept-Language": acceptLang,
             }
         )
+        adapter = HTTPAdapter(pool_connections=poolSize, pool_maxsize=poolSize)
+        s.mount("http://", adapter)
+        s.mount("https://", adapter)
         self.session = s
+        self.retries = retries
+        self.backoff = backoff
+        self.maxBackoff = maxBackoff
+        self.retryBudget = retryBudget
+        self.retriesUsed = 0
+        self.timeout = timeout
+        self.cache = cache
+        self.throttle = throttle
+        self.metrics = metrics
+        self._retryLock = threading.Lock()
+
+    def _delete(self, url, *, timeout: Timeout = DEFAULT):
+        return self._request("DELETE", url, timeout=timeout)
+
+    def _get(self, url, *, headers=None, stream=False, timeout: Timeout = DEFAULT):
+        if headers is None:
+            headers = {}
+        return self._request(
+            "GET", url, headers=headers, stream=stream, timeout=timeout
+        )
 
-    def _delete(self, url):
-        r = self.session.delete(url)
-        r.raise_for_status()
+    def _post(
+        self,
+        url,
+        *,
+        data,
+        retry: bool = False,
+        stream: bool = False,
+        timeout: Timeout = DEFAULT,
+    ):
+        return self._request(
+            "POST", url, data=data, retry=retry, stream=stream, timeout=timeout
+        )
+
+    def _put(self, url, *, data, headers=None, timeout: Timeout = DEFAULT):
+        return self._request("PUT", url, data=data, headers=headers, timeout=timeout)
+
+    def _request(
+        self,
+        method: str,
+        url: str,
+        *,
+        retry: Optional[bool] = None,
+        timeout: Timeout = DEFAULT,
+        **kwargs,
+    ) -> requests.Response:
+        """
+        Make a request and raise HTTPError if it fails, like requests'
+        raise_for_status.
+
+        Connection errors, timeouts and responses with a status in
+        retryStatus are retried up to self.retries times with exponential
+        backoff and jitter, as long as the retry budget isn't used up. By
+        default, only idempotent methods (GET, PUT, DELETE) are retried;
+        use retry=True for POSTs that don't change anything, e.g. searches.
+
+        If there is a cache, reads are answered from it (see _cachedRequest)
+        and writes drop the cached responses of their module type.
+        """
+        if retry is None:
+            retry = method in idempotent
+        if timeout is DEFAULT:
+            timeout = self.timeout
+        if self.cache is None or kwargs.get("stream"):
+            return self._send(method, url, retry=retry, timeout=timeout, **kwargs)
+        if method == "GET" or (method == "POST" and searchURL.search(url)):
+            return self._cachedRequest(
+                method, url, retry=retry, timeout=timeout, **kwargs
+            )
+        try:
+            return self._send(method, url, retry=retry, timeout=timeout, **kwargs)
+        finally:
+            # module/Object/123/... -> module/Object/
+            parts = url[len(self.appURL) :].strip("/").split("/")
+            self.cache.invalidate(prefix=f"{self.appURL}/{'/'.join(parts[:2])}/")
+
+    def _cachedRequest(
+        self, method: str, url: str, *, retry: bool, timeout: Timeout, **kwargs
+    ) -> requests.Response:
+        """
+        Answer a read request from the cache if possible. Stale entries are
+        revalidated if the cache wants that and we know how (see _unchanged);
+        otherwise, we ask RIA and store the response.
+        """
+        headers = {**self.session.headers, **(kwargs.get("headers") or {})}
+        key = self.cache.key(
+            method=method,
+            url=url,
+            accept=headers.get("Accept"),
+            data=kwargs.get("data"),
+            language=headers.get("Accept-Language"),
+            user=self.user,
+        )
+        entry = self.cache.get(key=key)
+        if entry is not None:
+            if not entry.stale:
+                return self._cachedResponse(url=url, entry=entry)
+            if self.cache.revalidate and self._unchanged(
+                url=url, data=kwargs.get("data"), body=entry.body
+            ):
+                self.cache.touch(key=key)
+                return self._cachedResponse(url=url, entry=entry)
+        r = self._send(method, url, retry=retry, timeout=timeout, **kwargs)
+        self.cache.put(
+            key=key, url=url, body=r.content, contentType=r.headers.get("Content-Type")
+        )
         return r
 
-    def _get(self, url, *, headers=None, stream=False):
-        if headers is None:
-            headers = {}
-        r = self.session.get(url, headers=headers)
-        r.raise_for_status()
+    def _cachedResponse(self, *, url: str, entry: Any) -> requests.Response:
+        r = requests.Response()
+        r.status_code = 200
+        r.reason = "OK"
+        r.url = url
+        r._content = entry.body
+        if entry.contentType is not None:
+            r.headers["Content-Type"] = entry.contentType
+        r.encoding = requests.utils.get_encoding_from_headers(r.headers) or "utf-8"
         return r
 
-    def _post(self, url, *, data):
-        r = self.session.post(url, data=data)
+    def _unchanged(self, *, url: str, data: Any, body: bytes) -> bool:
+        """
+        "since" revalidation of a cached item or search response: we ask RIA
+        how many items of the request have been modified after the newest
+        __lastModified in the cached response (limit=0, so we only get the
+        count). Returns True if there are none, False if there are some or if
+        we can't tell.
+
+        Items that have been deleted or no longer match a search are not
+        noticed; the ttl still applies to them.
+        """
+        match = revalidateURL.search(url)
+        if match is None:
+            return False
+        mtype, ID = match.groups()
+        try:
+            cachedET = etree.fromstring(body, ETparser)
+        except etree.XMLSyntaxError:
+            return False
+        lastModifiedL = xpaths["lastModifiedValues"](cachedET)
+        if not lastModifiedL:
+            return False
+        since = max(lastModifiedL).strip().replace(" ", "T")
+        if ID is not None:
+            q = Search(module=mtype, limit=0, offset=0)
+            q.addCriterion(operator="equalsField", field="__id", value=ID)
+            queryET = q.toET()
+        else:
+            queryET = etree.fromstring(ResponseCache.canonical(data), ETparser)
+        if not _changedSince(queryET=queryET, since=since):
+            return False
+        r = self._send(
+            "POST",
+            f"{self.appURL}/module/{mtype}/search",
+            data=etree.tostring(queryET),
+            retry=True,
+            timeout=self.timeout,
+        )
+        sizeL = xpaths["totalSizes"](etree.fromstring(r.content, ETparser))
+        return sum(int(size) for size in sizeL) == 0
+
+    def _send(
+        self, method: str, url: str, *, retry: bool, timeout: Timeout, **kwargs
+    ) -> requests.Response:
+        """
+        The actual request with retries; see _request. If there are metrics,
+        the call is recorded with its retries once it's done.
+
+        With session auth, a 401 means that the key has probably expired; we
+        get a new one and send the request once more. That doesn't use up
+        one of the retries, but it's counted as one in the metrics.
+        """
+        data = kwargs.get("data")
+        resendable = not (isinstance(data, UploadBody) and not data.repeatable)
+        if not resendable:
+            retry = False  # a generator can't be sent again
+        auth = self.session.auth
+        newKey = resendable and isinstance(auth, SessionAuth)
+        start = time.monotonic()
+        attempt = 0
+        resent = 0
+        r = None
+        try:
+            while True:
+                r = None
+                try:
+                    r = self._throttled(method, url, timeout=timeout, **kwargs)
+                except (requests.ConnectionError, requests.Timeout) as e:
+                    if not retry or not self._mayRetry(attempt=attempt):
+                        raise e
+                    self._wait(attempt=attempt, reason=str(e), url=url)
+                else:
+                    if r.status_code == 401 and newKey:
+                        newKey = False  # only once
+                        r.close()
+                        auth.refresh(stale=getattr(r.request, "_sessionKey", None))
+                        resent = 1
+                        continue
+                    if r.status_code not in retryStatus:
+                        break
+                    if not retry or not self._mayRetry(attempt=attempt):
+                        break
+                    r.close()
+                    self._wait(
+                        attempt=attempt,
+                        reason=f"HTTP {r.status_code}",
+                        url=url,
+                        retryAfter=r.headers.get("Retry-After"),
+                    )
+                attempt += 1
+        finally:
+            if self.metrics is not None:
+                self._record(
+                    method,
+                    url,
+                    r=r,
+                    latency=time.monotonic() - start,
+                    retries=attempt + resent,
+                    stream=kwargs.get("stream", False),
+                )
         r.raise_for_status()
         return r
 
-    def _put(self, url, *, data):
-        r = self.session.put(url, data=data)
-        r.raise_for_status()
+    def _record(
+        self,
+        method: str,
+        url: str,
+        *,
+        r: Optional[requests.Response],
+        latency: float,
+        retries: int,
+        stream: bool,
+    ) -> None:
+        """Record a call in self.metrics; r is None if there's no response."""
+        if r is None:
+            self.metrics.record(
+                method=method, url=url, status=None, latency=latency, retries=retries
+            )
+            return
+        # counts the body of the last attempt; also works for file uploads
+        sent = int(r.request.headers.get("Content-Length") or 0)
+        self.metrics.record(
+            method=method,
+            url=url,
+            status=r.status_code,
+            latency=latency,
+            sent=sent,
+            received=0 if stream else len(r.content),
+            retries=retries,
+        )
+
+    def _throttled(self, method: str, url: str, **kwargs) -> requests.Response:
+        """A single request that goes through the throttle if there is one."""
+        if self.throttle is None:
+            return self.session.request(method, url, **kwargs)
+        self.throttle.acquire()
+        start = time.monotonic()
+        status = None
+        try:
+            r = self.session.request(method, url, **kwargs)
+            status = r.status_code
+        finally:
+            self.throttle.release(latency=time.monotonic() - start, status=status)
+        sent = int(r.request.headers.get("Content-Length") or 0)
+        received = 0 if kwargs.get("stream") else len(r.content)
+        self.throttle.consume(sent + received)
         return r
 
-    def _search(self, *, queryET) -> requests.Response:
+    def _chunks(self, r: requests.Response, *, chunkSize: int) -> Iterator[bytes]:
+        """
+        Body of a streamed response in chunks; the bytes count against the
+        throttle's limit and in the metrics.
+        """
+        for chunk in r.iter_content(chunk_size=chunkSize):
+            if self.throttle is not None:
+                self.throttle.consume(len(chunk))
+            if self.metrics is not None:
+                self.metrics.addReceived(
+                    method=r.request.method, url=r.url, n=len(chunk)
+                )
+            yield chunk
+
+    def _streamItems(
+        self, r: requests.Response, *, chunkSize: int = 64 * 1024
+    ) -> Iterator:
+        """
+        Yields moduleItems from a streamed response as they arrive; the
+        response is closed when we're done or the iterator is dropped.
+        """
+        with r:
+            yield from Module.iterStream(chunks=self._chunks(r, chunkSize=chunkSize))
+
+    def _mayRetry(self, *, attempt: int) -> bool:
+        """Uses up one retry of the budget if there is one left."""
+        if attempt >= self.retries:
+            return False
+        with self._retryLock:
+            if self.retryBudget is not None and self.retriesUsed >= self.retryBudget:
+                logging.warning("retry budget used up")
+                return False
+            self.retriesUsed += 1
+        return True
+
+    def _wait(
+        self, *, attempt: int, reason: str, url: str, retryAfter: str = None
+    ) -> None:
+        delay = random.uniform(0, min(self.maxBackoff, self.backoff * 2**attempt))
+        if retryAfter is not None and retryAfter.isdigit():
+            delay = max(delay, min(self.maxBackoff, int(retryAfter)))
+        logging.warning(f"{reason} for {url}; retrying in {delay:.1f}s")
+        time.sleep(delay)
+
+    def _search(self, *, queryET, stream: bool = False) -> requests.Response:
         """
         A version of the search method that expects the query as etree document
-        and returns requests response.
+        and returns requests response. With stream=True, the body is not
+        downloaded yet; see _streamItems.
         """
 
         mtype = queryET.xpath(
@@ -84,27 +487,32 @@ class MpApi:
             raise TypeError("Unknown module")
         url = f"{self.appURL}/module/{mtype}/search"
 
+        # searches don't change anything, so they can be retried
         return self._post(
             url,
             data=etree.tostring(queryET),  # encoding="unicode"
+            retry=True,
+            stream=stream,
         )
 
     #
     # A SESSION
     #
-    def getSessionKey(self) -> str:  # should be int?
+    def getSessionKey(self) -> str:
         """
         GET http://.../ria-ws/application/session
+
+        Returns the key as a string (not a list); raises ValueError if the
+        response has none. With auth="session", that's the key we're using.
+
+        NEW
+        * used to return the list of xpath results
         """
+        if isinstance(self.session.auth, SessionAuth):
+            return self.session.auth.current()
         url = self.appURL + "/session"
         r = self._get(url)
-        tree = self.ETfromString(xml=r.text)
-
-        key = tree.xpath(
-            "/s:application/s:session/s:key/text()",
-            namespaces={"s": "http://www.zetcom.com/ria/ws/session"},
-        )
-        return key
+        return sessionKey(xml=r.content)
 
     #
     # B REQUESTS WITH module.xsd response?
@@ -221,18 +629,29 @@ class MpApi:
         queryET = self.ETfromString(xml=xml)
         return self._search(queryET=queryET)
 
-    def search2(self, *, query: Search) -> Module:
+    def search2(
+        self, *, query: Search, stream: bool = False
+    ) -> Union[Module, Iterator]:
         """
         Perform a search, but with modern parameters and return values
 
         EXPECTS
         * Search object
+        * stream (optional): if True, don't wait for the whole response, but
+          yield moduleItems while they arrive (see Module.iterStream)
         RETURNS
-        * Module object
+        * Module object or, with stream=True, an iterator of moduleItems
+
+        USAGE
+            for itemN in client.search2(query=q, stream=True):
+                mtype = itemN.getparent().get("name")
         """
         query.validate(mode="search")
+        if stream:
+            r = self._search(queryET=query.toET(), stream=True)
+            return self._streamItems(r)
         r = self._search(queryET=query.toET())
-        m = Module(xml=r.text)
+        m = Module(xml=r.content)
         # print (f"ACTUAL SIZE: {m.actualSize()}")
         return m
 
@@ -240,11 +659,23 @@ class MpApi:
     B.3 WHOLE MODULE ITEMS
     r = createItem2(mtype="Object", data=m)
     m = getItem2(mtype="Object", ID=123)
+    m = getItems(mtype="Object", IDs=[123, 456])
     r = updateItem2(mtype="Object", data=m)
     r = deleteItem2(mtype="Object", ID=123)
     """
 
-    def getItem(self, *, module: str, id: int) -> requests.Response:
+    def getItem(
+        self,
+        *,
+        module: str,
+        id: int,
+        loadAttachment: bool = False,
+        loadThumbnailExtraSmall: bool = False,
+        loadThumbnailSmall: bool = False,
+        loadThumbnailMedium: bool = False,
+        loadThumbnailLarge: bool = False,
+        loadThumbnailExtraLarge: bool = False,
+    ) -> requests.Response:
         """
         Get a single module item
         GET http://.../ria-ws/application/module/{module}/{__id}
@@ -257,16 +688,89 @@ class MpApi:
         loadThumbnailMedium | type: boolean | default: false | load medium thumbnail
         loadThumbnailLarge | type: boolean | default: false | load large thumbnail
         loadThumbnailExtraLarge | type: boolean | default: false | load extra large thumbnail
-        """
-        return self._get(f"{self.appURL}/module/{module}/{id}")
 
-    def getItem2(self, *, mtype: str, ID: int) -> Module:
+        NEW
+        * the URL parameters are keyword arguments now, e.g.
+          getItem(module="Multimedia", id=123, loadThumbnailSmall=True)
+        """
+        flags = {
+            "loadAttachment": loadAttachment,
+            "loadThumbnailExtraSmall": loadThumbnailExtraSmall,
+            "loadThumbnailSmall": loadThumbnailSmall,
+            "loadThumbnailMedium": loadThumbnailMedium,
+            "loadThumbnailLarge": loadThumbnailLarge,
+            "loadThumbnailExtraLarge": loadThumbnailExtraLarge,
+        }
+        url = f"{self.appURL}/module/{module}/{id}"
+        query = "&".join(f"{name}=true" for name, value in flags.items() if value)
+        if query:
+            url += "?" + query  # part of the url, so the cache tells them apart
+        return self._get(url)
+
+    def getItem2(
+        self, *, mtype: str, ID: int, stream: bool = False
+    ) -> Union[Module, Iterator]:
         """
         Like getItem, but with modern parameter names and returns Module
-        object.
+        object; with stream=True an iterator of moduleItems like search2.
         """
+        if stream:
+            r = self._get(f"{self.appURL}/module/{mtype}/{ID}", stream=True)
+            return self._streamItems(r)
         r = self.getItem(module=mtype, id=ID)
-        return Module(xml=r.text)
+        return Module(xml=r.content)
+
+    def getItems(
+        self,
+        *,
+        mtype: str,
+        IDs: Iterable[int],
+        batchSize: int = 100,
+        workers: int = 4,
+        fields: Optional[Iterable[str]] = None,
+    ) -> Module:
+        """
+        Get many items of one module type with a few searches instead of one
+        getItem per item.
+
+        EXPECTS
+        * mtype: module type
+        * IDs: ids of the requested items; duplicates are ignored
+        * batchSize: number of ids OR'ed together in one search
+        * workers: number of searches running at the same time
+        * fields (optional): only request these fieldPaths (see
+          Search.addField), e.g. ["__id", "ObjObjectNumberGrp"]
+
+        RETURNS
+        * Module with all the items that exist; ids that don't exist are
+          silently missing
+
+        USAGE
+            m = client.getItems(mtype="Object", IDs=[1, 2, 3])
+        """
+        if batchSize < 1:
+            raise ValueError("batchSize needs to be at least 1")
+        IDs = sorted({int(ID) for ID in IDs})
+        batches = [IDs[i : i + batchSize] for i in range(0, len(IDs), batchSize)]
+
+        def query(batch: list) -> Search:
+            q = Search(module=mtype, limit=-1, offset=0)
+            if len(batch) > 1:
+                q.OR()
+            for ID in batch:
+                q.addCriterion(operator="equalsField", field="__id", value=str(ID))
+            if fields is not None:
+                for field in fields:
+                    q.addField(field=field)
+            return q
+
+        m = Module()
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for part in executor.map(
+                lambda batch: self.search2(query=query(batch)), batches
+            ):
+                m.add(doc=part.etree, adopt=True)
+        return m
 
     def createItem(self, *, module: str, xml: str) -> requests.Response:
         """
@@ -687,7 +1191,14 @@ class MpApi:
         r = self._get(url, headers={"Accept": "application/octet-stream"})
         return r
 
-    def saveAttachment(self, *, module: str = "Multimedia", id: int, path: str) -> int:
+    def saveAttachment(
+        self,
+        *,
+        module: str = "Multimedia",
+        id: int,
+        path: str,
+        chunkSize: int = 1024 * 1024,
+    ) -> int:
         """
         Streaming version of getAttachment that saves attachment directly to disk.
         Expects
@@ -695,31 +1206,82 @@ class MpApi:
         - id: item id in specified module (int)
         - path: filename/path to save attachment to
         to.
+        - chunkSize: bytes written at a time
         Returns id if successful.
-        Note: There is a similar saveAttachments in Sar.py that calls this one.
+        Note: There is a similar saveAttachments in Sar.py that downloads many
+        attachments in parallel. Both use Downloader, so path appears only
+        when the download is complete and an interrupted download is resumed
+        on the next call.
         """
-        url = f"{self.appURL}/module/{module}/{id}/attachment"
-        with self.session.get(
-            url, stream=True, headers={"Accept": "application/octet-stream"}
-        ) as r:
-            r.raise_for_status()
-            with open(path, "wb") as f:
-                for chunk in r.iter_content(chunk_size=8192):
-                    f.write(chunk)
+        Downloader(api=self, chunkSize=chunkSize).download(
+            mtype=module, ID=id, path=path
+        )
         return id
 
-    def getThumbnail(self, *, module: str, id: int, path: str) -> requests.Response:
+    def getThumbnail(
+        self, *, module: str, id: int, path: Optional[str] = None
+    ) -> Union[requests.Response, int]:
         """
         Get the thumbnail of a module item attachment
         GET http://.../ria-ws/application/module/{module}/{__id}/thumbnail
+
+        Without path, returns the response (thumbnail in r.content). With
+        path, the thumbnail is streamed to path like in saveAttachment and
+        id is returned.
+
+        NEW
+        * path used to be required, but was ignored
         """
+        if path is not None:
+            Downloader(api=self, resource="thumbnail").download(
+                mtype=module, ID=id, path=path
+            )
+            return id
         url = f"{self.appURL}/module/{module}/{id}/thumbnail"
         r = self._get(url, headers={"Accept": "application/octet-stream"})
         return r  # r.content
 
-    def updateAttachment(self, *, module: str, id: int, path: str) -> requests.Response:
+    def saveThumbnails(
+        self,
+        *,
+        module: str = "Multimedia",
+        IDs: Iterable[int],
+        tdir: Union[str, Path],
+        suffix: str = ".jpg",
+        workers: int = 4,
+    ) -> dict:
+        """
+        Save the thumbnails of many items to tdir/{id}{suffix}, several at
+        a time; thumbnails that exist already are skipped. Much cheaper than
+        downloading the attachments if all we need is a preview.
+
+        RETURNS
+        * dict with the numbers of downloaded and skipped thumbnails
+
+        If downloads fail (e.g. items without attachment), the first error is
+        raised after all downloads are done, like Downloader.close.
+        """
+        tdir = Path(tdir)
+        tdir.mkdir(parents=True, exist_ok=True)
+        with Downloader(
+            api=self, workers=workers, resource="thumbnail", skipExisting=True
+        ) as dl:
+            for ID in IDs:
+                dl.add(mtype=module, ID=ID, path=tdir / f"{ID}{suffix}")
+        return {"downloaded": dl.downloaded, "skipped": dl.skipped}
+
+    def updateAttachment(
+        self,
+        *,
+        module: str,
+        id: int,
+        path: Optional[str] = None,
+        data: Any = None,
+        size: Optional[int] = None,
+        name: Optional[str] = None,
+        progress: Optional[Callable] = None,
+    ) -> requests.Response:
         """
-        Add or update the attachment of a module item, as a base64 encoded XML
         Add or update the attachment of a module item, as a binary stream
         PUT http://.../ria-ws/application/module/{module}/{__id}/attachment
         Successfully changed and tested: 9.4.2023
@@ -727,21 +1289,32 @@ class MpApi:
         When an attachment is uploaded through the gui, the field Dateiname is set
         automatically. This method does not update any fields.
 
-        It's unclear if this version can be streamed and how big the files can be.
-        Currently I am inclined to leave this version be and try out additional
-        version with corresponding numbers i.e. updateAttachment2 etc.
+        EXPECTS
+        * path: file to upload; or
+        * data: file handle (binary mode), iterable of bytes (with size) or
+          UploadBody
+        * size: number of bytes in data; required for iterables
+        * name: file name sent to RIA; default is the name of path
+        * progress (optional): called with (sent, size) while sending
+
+        NEW
+        * The file is streamed in chunks instead of being read into memory,
+          so its size doesn't matter; see uploader.py. Use Uploader for many
+          files.
         """
         url = f"{self.appURL}/module/{module}/{id}/attachment"
-        with open(path, mode="rb") as f:
-            file = f.read()
-
-        fn = Path(path).name
-
-        # print(f"FN:{fn} {file}")
-        headers = {"X-File-Name": fn, "Content-Type": "application/octet-stream"}
-        r = self.session.put(url, data=file, headers=headers)
-        r.raise_for_status()
-        return r
+        if path is not None:
+            data = path
+            if name is None:
+                name = Path(path).name
+        if data is None:
+            raise TypeError("Need path or data")
+        if name is None:
+            name = Path(getattr(data, "name", "attachment")).name
+        if not isinstance(data, UploadBody):
+            data = UploadBody(source=data, size=size, progress=progress)
+        headers = {"X-File-Name": name, "Content-Type": "application/octet-stream"}
+        return self._put(url, data=data, headers=headers)
 
     def deleteAttachment(self, *, module: str, id: int) -> requests.Response:
         """
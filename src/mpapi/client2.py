@@ -24,7 +24,7 @@ from lxml import etree  # type: ignore
 from mpapi.client import MpApi
 from mpapi.search import Search
 from mpapi.module import Module
-from typing import Any, Union
+from typing import Any, Iterator, Union
 import requests
 
 ETparser = etree.XMLParser(remove_blank_text=True)
@@ -105,18 +105,22 @@ class Client2:
     # B.2 SEARCHING
     #
 
-    def search(self, *, query: Search) -> Module:
+    def search(self, *, query: Search, stream: bool = False) -> Union[Module, Iterator]:
         """
         Perform a search, but with modern parameters and return values
 
         EXPECTS
         * Search object
+        * stream (optional): yield moduleItems while they arrive
         RETURNS
-        * Module object
+        * Module object or, with stream=True, an iterator of moduleItems
         """
         query.validate(mode="search")
+        if stream:
+            r = self.client._search(queryET=query.toET(), stream=True)
+            return self.client._streamItems(r)
         r = self.client._search(queryET=query.toET())
-        return Module(xml=r.text)
+        return Module(xml=r.content)
 
     """
     B.3 WHOLE MODULE ITEMS
@@ -131,7 +135,7 @@ class Client2:
         Like getItem, but with modern parameters and returns Module object.
         """
         r = self.client.getItem(module=modType, id=modItemId)
-        return Module(xml=r.text)
+        return Module(xml=r.content)
 
     def createItem(self, *, modType: str, data: Module) -> Module:
         """
@@ -0,0 +1,221 @@
+"""
+Definitions - a local, indexed copy of RIA's module definitions
+
+RIA describes every module type with its fields, their dataTypes and the
+targets of references (GET .../module/{mtype}/definition). Definitions
+keeps that information in a SQLite database, so we can check field paths
+and look up dataTypes offline, i.e. without a round trip to RIA.
+
+USAGE
+    from mpapi.definitions import Definitions
+    defs = Definitions(path="definitions.db", api=api)  # api is optional
+    defs.update(api=api)                 # (re)load definitions of all modules
+    defs.field(mtype="Object", name="ObjTechnicalTermClb")
+    # -> Field(kind="dataField", dataType="Clob", target=None)
+    defs.validate(mtype="Multimedia", path="MulObjectRef.ObjPublicationGrp.TypeVoc")
+    # raises ValueError for unknown fields
+
+    # let Search and Module use it
+    Search.definitions = defs
+    Module.definitions = defs
+
+DESIGN
+* Fields are stored by mtype and name; fields inside repeatableGroups,
+  composites and references have dotted names (e.g.
+  ObjObjectNumberGrp.InventarNrSTxt).
+* Field paths follow moduleReferences into their target module.
+  After a vocabularyReference, the rest of the path is not checked.
+  Names that start with "__" (__id, __lastModified etc.) are system fields
+  and always accepted.
+* If a module type is not in the database and we have an api, its
+  definition is downloaded and stored. Without an api, we can't tell and
+  validate returns None.
+"""
+
+from collections import namedtuple
+import difflib
+from lxml import etree  # type: ignore
+from mpapi.constants import NSMAP, parser
+from pathlib import Path
+import sqlite3
+import threading
+from typing import Any, Iterator, Optional, Union
+
+PathX = Union[Path, str]
+Field = namedtuple("Field", ["kind", "dataType", "target"])
+systemField = Field("systemField", None, None)
+
+
+class Definitions:
+    def __init__(self, *, path: PathX, api: Any = None) -> None:
+        """
+        Opens the database at path; creates a new one if it doesn't exist
+        yet. If api (MpApi) is given, missing module definitions are
+        downloaded on demand.
+        """
+        self.path = Path(path)
+        self.api = api
+        self._lock = threading.Lock()
+        self.db = sqlite3.connect(str(self.path), check_same_thread=False)
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS modules (
+                mtype TEXT PRIMARY KEY
+            );
+            CREATE TABLE IF NOT EXISTS fields (
+                mtype TEXT NOT NULL,
+                name TEXT NOT NULL,
+                kind TEXT NOT NULL,
+                dataType TEXT,
+                target TEXT,
+                PRIMARY KEY (mtype, name)
+            ) WITHOUT ROWID;
+            """)
+
+    def close(self) -> None:
+        self.db.close()
+
+    def field(self, *, mtype: str, name: str) -> Optional[Field]:
+        """
+        Returns the Field for a (possibly dotted) name in the module type
+        itself, i.e. without following references; None if there is none.
+        """
+        self._ensure(mtype=mtype)
+        with self._lock:
+            row = self.db.execute(
+                "SELECT kind, dataType, target FROM fields WHERE mtype = ? AND name = ?",
+                (mtype, name),
+            ).fetchone()
+        if row is None:
+            return None
+        return Field(*row)
+
+    def load(self, *, xml: Union[str, bytes, Any]) -> int:
+        """
+        Store the module definitions in xml (string, bytes or etree) as
+        returned by MpApi.getDefinition; definitions of the module types in
+        xml replace older ones. Returns the number of fields.
+        """
+        if isinstance(xml, str):
+            xml = xml.encode("utf-8")
+        if isinstance(xml, bytes):
+            xml = etree.fromstring(xml, parser)
+        rows = []
+        mtypes = []
+        for moduleN in xml.iter(f"{{{NSMAP['m']}}}module"):
+            mtype = moduleN.get("name")
+            mtypes.append(mtype)
+            rows.extend((mtype, *row) for row in _walk(parentN=moduleN, prefix=""))
+        with self._lock, self.db:
+            for mtype in mtypes:
+                self.db.execute("DELETE FROM fields WHERE mtype = ?", (mtype,))
+                self.db.execute("INSERT OR IGNORE INTO modules VALUES (?)", (mtype,))
+            self.db.executemany(
+                "INSERT OR REPLACE INTO fields VALUES (?, ?, ?, ?, ?)", rows
+            )
+        return len(rows)
+
+    def mtypes(self) -> list:
+        """Module types we have definitions for."""
+        with self._lock:
+            return [
+                row[0]
+                for row in self.db.execute("SELECT mtype FROM modules ORDER BY mtype")
+            ]
+
+    def names(self, *, mtype: str) -> list:
+        """All field names of a module type (dotted for nested fields)."""
+        with self._lock:
+            return [
+                row[0]
+                for row in self.db.execute(
+                    "SELECT name FROM fields WHERE mtype = ? ORDER BY name", (mtype,)
+                )
+            ]
+
+    def update(self, *, api: Any = None, mtype: str = None) -> int:
+        """
+        Download the definition of one (or all) module types and store it;
+        uses self.api if no api is given. Returns number of fields.
+        """
+        api = self.api if api is None else api
+        if api is None:
+            raise TypeError("Need an api to download definitions")
+        r = api.getDefinition(module=mtype)
+        return self.load(xml=r.content)
+
+    def validate(self, *, mtype: str, path: str) -> Optional[Field]:
+        """
+        Check a dotted field path as used in searches, e.g.
+        "MulObjectRef.ObjPublicationGrp.TypeVoc" for mtype Multimedia.
+
+        Returns the Field the path ends in or None if we don't have the
+        definitions to tell. Raises ValueError if the path doesn't exist.
+        """
+        segments = path.split(".")
+        current = mtype
+        prefix = ""
+        for no, segment in enumerate(segments):
+            if segment.startswith("__"):
+                return systemField
+            if not self._known(mtype=current):
+                return None
+            name = prefix + segment
+            f = self.field(mtype=current, name=name)
+            if f is None:
+                raise ValueError(self._unknown(mtype=current, name=name, path=path))
+            if no == len(segments) - 1 or f.kind == "vocabularyReference":
+                return f
+            if f.kind == "moduleReference" and (
+                self.field(mtype=current, name=f"{name}.{segments[no + 1]}") is None
+            ):
+                # not a field of the reference itself, so go to the target
+                current = f.target
+                prefix = ""
+            else:
+                prefix = name + "."
+        return None  # not reached
+
+    #
+    # private helpers
+    #
+
+    def _ensure(self, *, mtype: str) -> None:
+        """Download definition of mtype if we don't have it, but an api."""
+        if self.api is not None and not self._has(mtype=mtype):
+            self.update(mtype=mtype)
+
+    def _has(self, *, mtype: str) -> bool:
+        with self._lock:
+            row = self.db.execute(
+                "SELECT 1 FROM modules WHERE mtype = ?", (mtype,)
+            ).fetchone()
+        return row is not None
+
+    def _known(self, *, mtype: str) -> bool:
+        self._ensure(mtype=mtype)
+        return self._has(mtype=mtype)
+
+    def _unknown(self, *, mtype: str, name: str, path: str) -> str:
+        msg = f"Unknown field '{name}' in module {mtype} (path '{path}')"
+        similar = difflib.get_close_matches(name, self.names(mtype=mtype), n=3)
+        if similar:
+            msg += f"; did you mean {', '.join(similar)}?"
+        return msg
+
+
+def _walk(*, parentN: Any, prefix: str) -> Iterator[tuple]:
+    """
+    Yields (name, kind, dataType, target) for the named children of a
+    definition element, recursively with dotted names.
+    """
+    for childN in parentN:
+        if not isinstance(childN.tag, str):
+            continue
+        if childN.get("name") is None:  # e.g. a wrapper element
+            yield from _walk(parentN=childN, prefix=prefix)
+            continue
+        kind = etree.QName(childN).localname
+        name = prefix + childN.get("name")
+        target = childN.get("targetModule") or childN.get("instanceName")
+        yield name, kind, childN.get("dataType"), target
+        yield from _walk(parentN=childN, prefix=name + ".")
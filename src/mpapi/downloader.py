@@ -0,0 +1,322 @@
+"""
+Downloader - parallel, resumable downloads of attachments (or thumbnails)
+
+Harvests often come with thousands of multimedia attachments. Downloader
+fetches them with a few threads and makes sure that a file that exists on
+disk is complete.
+
+USAGE
+    from mpapi.downloader import Downloader
+    with Downloader(api=api, workers=4, manifest="pix/manifest.json") as dl:
+        for ID in IDs:
+            dl.add(mtype="Multimedia", ID=ID, path=f"pix/{ID}.jpg")
+    # leaving the with block waits for all downloads
+
+    # single file, in the current thread
+    size, sha256 = Downloader(api=api).download(
+        mtype="Multimedia", ID=123, path="pix/123.jpg"
+    )
+
+    # thumbnails instead of attachments; files that exist are not fetched
+    with Downloader(api=api, resource="thumbnail", skipExisting=True) as dl:
+        ...
+
+DESIGN
+* Jobs are put into a bounded queue that is processed by a pool of worker
+  threads. When the queue is full, add blocks, so we never hold more than a
+  few jobs in memory.
+* We download to {path}.part and rename it to path only when the download
+  is complete. Renaming is atomic, so path is either complete or missing.
+* If a .part file exists from an earlier attempt, we ask RIA for the rest
+  with an HTTP Range request. If the server doesn't support ranges, we start
+  from scratch. Broken connections are resumed the same way, with the
+  api's retries, backoff and retry budget.
+* Completed files are recorded in a json manifest with mtype, id, size and
+  sha256 checksum. A file is skipped only if it's in the manifest with the
+  same size (and, with verify=True, the same checksum). Files that exist
+  without a manifest entry are downloaded again since we can't know if they
+  are complete, unless skipExisting is True. Since files appear only when
+  complete, that is safe for files that Downloader wrote.
+* Dirs from before we had a manifest may have half-written files, so their
+  files are downloaded again once. If you know that they are complete, pass
+  skipExisting=True.
+* Downloader uses the api's requests, so retries, timeouts, the throttle
+  and the connection pool of MpApi apply. Size the api's poolSize to
+  workers.
+"""
+
+import hashlib
+import json
+import os
+from pathlib import Path
+import queue
+import requests
+import threading
+from typing import Any, Optional, Union
+
+PathX = Union[Path, str]
+broken = (
+    requests.ConnectionError,
+    requests.Timeout,
+    requests.exceptions.ChunkedEncodingError,
+)
+
+
+class Downloader:
+    def __init__(
+        self,
+        *,
+        api: Any,
+        workers: int = 4,
+        queueSize: Optional[int] = None,
+        chunkSize: int = 1024 * 1024,
+        manifest: Optional[PathX] = None,
+        verify: bool = False,
+        resource: str = "attachment",
+        skipExisting: bool = False,
+    ) -> None:
+        """
+        EXPECTS
+        * api: MpApi object used for the requests
+        * workers: number of concurrent downloads
+        * queueSize: max. number of waiting jobs; default is 2 * workers
+        * chunkSize: bytes read from the network and written at a time
+        * manifest (optional): path of json file recording complete downloads
+        * verify: if True, recompute checksums of files in the manifest
+          before skipping them
+        * resource: "attachment" or "thumbnail"
+        * skipExisting: if True, skip every file that exists, whether it's in
+          the manifest or not
+        """
+        if workers < 1:
+            raise ValueError("workers needs to be at least 1")
+        if resource not in ("attachment", "thumbnail"):
+            raise ValueError(f"Unknown resource: {resource}")
+        self.resource = resource
+        self.skipExisting = skipExisting
+        self.api = api
+        self.workers = workers
+        self.chunkSize = chunkSize
+        self.verify = verify
+        self.errors: dict = {}  # (mtype, ID) -> exception
+        self.downloaded = 0
+        self.skipped = 0
+        self._queue: queue.Queue = queue.Queue(
+            maxsize=2 * workers if queueSize is None else queueSize
+        )
+        self._threads: list = []
+        self._pending: set = set()  # paths queued or in progress
+        self._lock = threading.Lock()
+        self._entries: dict = {}
+        self._unsaved = 0
+        self.manifest = None
+        if manifest is not None:
+            self.manifest = Path(manifest)
+            if self.manifest.exists():
+                with open(self.manifest, "r", encoding="utf-8") as f:
+                    self._entries = json.load(f)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def add(self, *, mtype: str = "Multimedia", ID: int, path: PathX) -> bool:
+        """
+        Queue the attachment of mtype/ID for download to path; blocks while
+        the queue is full.
+
+        Returns False if the file is complete already (or queued already),
+        True if it has been queued.
+        """
+        path = Path(path)
+        with self._lock:
+            if path in self._pending:
+                return False
+            self._pending.add(path)  # reserved while we check it
+        # outside the lock; with verify=True, this hashes the whole file
+        if self.isComplete(path=path):
+            with self._lock:
+                self._pending.discard(path)
+                self.skipped += 1
+            return False
+        if not self._threads:
+            self._start()
+        self._queue.put((mtype, ID, path))
+        return True
+
+    def close(self) -> None:
+        """
+        Wait for all queued downloads and save the manifest. Re-raises the
+        first error after all jobs are done; see self.errors for all of them.
+        """
+        for _ in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+        self.saveManifest()
+        if self.errors:
+            print(f"WARN: {len(self.errors)} downloads failed")
+            raise next(iter(self.errors.values()))
+
+    def download(
+        self, *, mtype: str = "Multimedia", ID: int, path: PathX
+    ) -> tuple[int, str]:
+        """
+        Download a single attachment to path in the current thread, resuming
+        a previous partial download if there is one.
+
+        Returns (size, sha256) of the complete file.
+        """
+        path = Path(path)
+        part = path.with_name(path.name + ".part")
+        url = f"{self.api.appURL}/module/{mtype}/{ID}/{self.resource}"
+        attempt = 0
+        while True:
+            try:
+                size, sha256 = self._fetch(url=url, part=part)
+            except broken as e:
+                # broken during the transfer; resume from what we have
+                if not self.api._mayRetry(attempt=attempt):
+                    raise e
+                self.api._wait(attempt=attempt, reason=str(e), url=url)
+                attempt += 1
+                continue
+            break
+        os.replace(part, path)
+        self._record(path=path, mtype=mtype, ID=ID, size=size, sha256=sha256)
+        return size, sha256
+
+    def isComplete(self, *, path: PathX) -> bool:
+        """
+        True if path exists and matches the size (and checksum with
+        verify=True) recorded in the manifest; with skipExisting, True if
+        path exists.
+        """
+        path = Path(path)
+        if self.skipExisting and path.exists():
+            return True
+        entry = self._entries.get(self._key(path))
+        if entry is None or not path.exists():
+            return False
+        if path.stat().st_size != entry["size"]:
+            return False
+        if self.verify and _sha256(path=path) != entry["sha256"]:
+            return False
+        return True
+
+    def saveManifest(self) -> None:
+        """Write the manifest atomically (if there is one)."""
+        if self.manifest is None:
+            return
+        with self._lock:
+            data = json.dumps(self._entries, indent=1, sort_keys=True)
+            self._unsaved = 0
+            tmp = self.manifest.with_name(self.manifest.name + ".part")
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.write(data)
+            os.replace(tmp, self.manifest)
+
+    #
+    # private helpers
+    #
+
+    def _fetch(self, *, url: str, part: Path) -> tuple[int, str]:
+        """
+        Request url and append to part (or overwrite it if the server ignores
+        our Range request). Returns size and checksum of part.
+        """
+        offset = part.stat().st_size if part.exists() else 0
+        headers = {"Accept": "application/octet-stream"}
+        if offset:
+            headers["Range"] = f"bytes={offset}-"
+        try:
+            r = self.api._get(url, stream=True, headers=headers)
+        except requests.HTTPError as e:
+            if offset and e.response.status_code == 416:
+                # range not satisfiable, e.g. part is bigger than the file
+                part.unlink()
+                return self._fetch(url=url, part=part)
+            raise e
+        with r:
+            digest = hashlib.sha256()
+            if r.status_code == 206:
+                _update(digest, path=part)
+                mode = "ab"
+            else:
+                offset = 0
+                mode = "wb"
+            expected = r.headers.get("Content-Length")
+            written = 0
+            with open(part, mode) as f:
+                for chunk in self.api._chunks(r, chunkSize=self.chunkSize):
+                    f.write(chunk)
+                    digest.update(chunk)
+                    written += len(chunk)
+        if expected is not None and written != int(expected):
+            raise requests.ConnectionError(
+                f"Incomplete download: {written} of {expected} bytes from {url}"
+            )
+        return offset + written, digest.hexdigest()
+
+    def _key(self, path: Path) -> str:
+        """Manifest keys are paths relative to the manifest's dir."""
+        if self.manifest is None:
+            return str(path)
+        return Path(os.path.relpath(path, self.manifest.parent)).as_posix()
+
+    def _record(
+        self, *, path: Path, mtype: str, ID: int, size: int, sha256: str
+    ) -> None:
+        with self._lock:
+            self._entries[self._key(path)] = {
+                "mtype": mtype,
+                "id": int(ID),
+                "size": size,
+                "sha256": sha256,
+            }
+            self._unsaved += 1
+            save = self._unsaved >= 50
+        if save:  # save now and then, so little is lost on a crash
+            self.saveManifest()
+
+    def _start(self) -> None:
+        for no in range(self.workers):
+            thread = threading.Thread(
+                target=self._work, name=f"Downloader-{no}", daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+
+    def _work(self) -> None:
+        while True:
+            job = self._queue.get()
+            if job is None:
+                return
+            mtype, ID, path = job
+            try:
+                print(f" getting {path}")
+                self.download(mtype=mtype, ID=ID, path=path)
+                with self._lock:
+                    self.downloaded += 1
+            except Exception as e:
+                print(f"WARN: download of {mtype} {ID} failed: {e}")
+                with self._lock:
+                    self.errors[(mtype, ID)] = e
+            finally:
+                with self._lock:
+                    self._pending.discard(path)
+
+
+def _sha256(*, path: Path) -> str:
+    digest = hashlib.sha256()
+    _update(digest, path=path)
+    return digest.hexdigest()
+
+
+def _update(digest: Any, *, path: Path) -> None:
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
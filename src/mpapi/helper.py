@@ -2,6 +2,7 @@ from lxml import etree
 from mpapi.constants import NSMAP
 from pathlib import Path
 import pkgutil
+import threading
 from typing import Union
 from zipfile import ZipFile, ZIP_LZMA
 
@@ -10,6 +11,36 @@ from zipfile import ZipFile, ZIP_LZMA
 # ET = NewType("ET", Union [
 ET = any
 
+schemaFiles = {
+    "module": "data/xsd/module_1_6.xsd",
+    "search": "data/xsd/search_1_6.xsd",
+    "session": "data/xsd/session_1_0.xsd",
+    "vocabulary": "data/xsd/vocabulary_1_1.xsd",
+}
+_xsdCache = {}  # mode -> xsd as bytes, shared by all threads
+_xsdLock = threading.Lock()
+_schemas = threading.local()  # mode -> XMLSchema, one per thread
+
+
+def getSchema(*, mode: str) -> etree.XMLSchema:
+    """
+    Returns the compiled XMLSchema for mode (module, search, session or
+    vocabulary).
+
+    Schemas are loaded once per process and compiled once per thread. lxml's
+    schema objects keep their error log, so we don't share them between
+    threads; this way validate can be called from several threads at once.
+    """
+    if mode not in schemaFiles:
+        raise TypeError("Unknown validation mode")
+    cache = _schemas.__dict__
+    if mode not in cache:
+        with _xsdLock:
+            if mode not in _xsdCache:
+                _xsdCache[mode] = pkgutil.get_data(__name__, schemaFiles[mode])
+        cache[mode] = etree.XMLSchema(etree.fromstring(_xsdCache[mode]))
+    return cache[mode]
+
 
 class Helper:
     def fromFile(self, *, path: Path) -> None:
@@ -24,6 +55,7 @@ class Helper:
 
     def toFile(self, *, path: Union[Path, str]) -> None:
         # path can be str or Pathlib object as well
+        self._beforeWrite()
         doc = self.etree
         try:
             self._write(path=str(path), doc=doc)
@@ -32,14 +64,17 @@ class Helper:
             self._write(path=str(path), doc=doc)
 
     def toFile2(self, *, path) -> None:  # should not be necessary
+        self._beforeWrite()
         doc = self.etree
         doc.write(str(path), pretty_print=True, method="c14n2")
 
     def toET(self) -> ET:
+        self._beforeWrite()
         return self.etree
 
     def toString(self, *, et: ET = None) -> str:
         if et is None:
+            self._beforeWrite()
             et = self.etree
         return etree.tostring(
             et, pretty_print=True, encoding="unicode"
@@ -58,6 +93,7 @@ class Helper:
         zip_path: AKu/260k/20221201/query513067-chunk1.zip
         short_path: query513067-chunk1.xml
         """
+        self._beforeWrite()
         short_path = Path(path).name
         zip_path = Path(path).with_suffix(".zip")
 
@@ -72,26 +108,27 @@ class Helper:
         """
         Validates a whole xml document of the type module.
 
-        Mode defaults to "module", use "seach" if you're validating a query.
-        """
+        Mode defaults to "module", use "seach" if you're validating a query;
+        "session" and "vocabulary" work as well.
 
-        if mode == "module":
-            xsd = pkgutil.get_data(__name__, "data/xsd/module_1_6.xsd")
-        elif mode == "search":
-            xsd = pkgutil.get_data(__name__, "data/xsd/search_1_6.xsd")
-        else:
-            raise TypeError("Unknown validation mode")
+        NEW
+        * schemas are no longer loaded and compiled on every call, see
+          getSchema
+        """
         # more options for http access?
-
-        # if not hasattr(self, mode):
-        self.mode = etree.fromstring(xsd)
-        xmlschema = etree.XMLSchema(self.mode)
-        xmlschema.assertValid(self.etree)  # dies if doesn't validate
+        getSchema(mode=mode).assertValid(self.etree)  # dies if doesn't validate
         return True
 
     def xpath(self, *, xpath: str):
         return self.etree.xpath(xpath, namespaces=NSMAP)
 
+    def _beforeWrite(self) -> None:
+        """
+        Gets called before the document is handed out or written; subclasses
+        can use it to bring the document up to date (see Module).
+        """
+        pass
+
     def _write(self, *, path, doc) -> None:
         # ,pretty_print=True, method="c14n2"
         doc.write(str(path), pretty_print=True, encoding="UTF-8")
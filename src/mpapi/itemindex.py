@@ -0,0 +1,259 @@
+"""
+An on-disk index for random access to moduleItems in big zml files
+
+After a harvest we often need a single item (e.g. Object 254808) out of a
+multi-GB join file or out of one of hundreds of chunk zips. Instead of parsing
+everything every time, we note for every moduleItem where it is: mtype, id,
+__lastModified, source file and byte span. To get the item back, we seek to
+that span and parse only the bytes of that item.
+
+USAGE
+    from mpapi.itemindex import ItemIndex
+    idx = ItemIndex(path="harvest.idx")   # creates or opens sqlite db
+    idx.add(path="join.xml")              # index an xml file
+    idx.add(path="group123-chunk1.zip")   # or a zipped chunk as written by toZip
+    idx.lookup(mtype="Object", ID=254808) # -> list of locations
+    for mtype, itemN in idx.read(keys=[("Object", 254808)]):
+        ...
+    idx.close()
+
+    # or more conveniently
+    m = Module.fromIndex(index="harvest.idx", keys=[("Object", 254808)])
+
+DESIGN
+* The index is a SQLite database, so it's compact, sorted by (mtype, id) and
+  needs no extra dependencies.
+* We find the moduleItems by scanning the raw bytes for <moduleItem> tags,
+  since iterparse doesn't tell us byte positions. This relies on RIA's
+  moduleItems being in the default namespace without prefix.
+* In zip files, the span refers to the unzipped xml file. To index it, we
+  unpack it to a temporary file next to the zip, so that big files don't
+  need to fit into memory. Zipped files can't be seeked cheaply, so on read
+  we go through them front to back, but don't parse anything we don't need.
+* If an item is in several files, we return the newest according to
+  __lastModified; of equally new items, the one indexed first wins.
+* Files that changed after they have been indexed raise an error on read;
+  just add them again.
+"""
+
+import mmap
+from lxml import etree  # type: ignore
+from mpapi.constants import NSMAP, parser
+from mpapi.xpaths import xpaths
+import os
+from pathlib import Path
+import re
+import shutil
+import sqlite3
+import tempfile
+from typing import Any, Iterable, Iterator, Union
+from zipfile import ZipFile
+
+ET = Any
+PathX = Union[Path, str]
+
+# <module name="...">, start tag (maybe self-closing) or end tag of a moduleItem
+tagRegex = re.compile(
+    rb'<module\s[^>]*?name="([^"]*)"|<moduleItem(?:\s[^>]*)?>|</moduleItem>'
+)
+
+
+class ItemIndex:
+    def __init__(self, *, path: PathX) -> None:
+        """
+        Opens the index at path; creates a new one if it doesn't exist yet.
+        """
+        self.path = Path(path)
+        self.db = sqlite3.connect(str(self.path))
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS files (
+                fileNo INTEGER PRIMARY KEY,
+                path TEXT UNIQUE NOT NULL,
+                member TEXT,
+                size INTEGER NOT NULL,
+                mtime INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS items (
+                mtype TEXT NOT NULL,
+                id INTEGER NOT NULL,
+                lastModified INTEGER,
+                fileNo INTEGER NOT NULL,
+                start INTEGER NOT NULL,
+                length INTEGER NOT NULL,
+                PRIMARY KEY (mtype, id, fileNo, start)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS itemsByFile ON items (fileNo);
+            """)
+
+    def add(self, *, path: PathX) -> int:
+        """
+        Index all moduleItems in the zml file at path (xml or zip). If that
+        file has been indexed before, its old entries are replaced.
+
+        Returns the number of moduleItems found.
+        """
+        path = Path(path).resolve()
+        stat = path.stat()
+        member = None
+        if path.suffix == ".zip":
+            member = path.with_suffix(".xml").name
+            # unpacked next to the zip, so we don't need the member in memory
+            with ZipFile(path, "r") as zippy, zippy.open(member) as src:
+                with tempfile.TemporaryFile(dir=path.parent) as f:
+                    shutil.copyfileobj(src, f, 1024 * 1024)
+                    rows = self._scanFile(f=f)
+        else:
+            with open(path, "rb") as f:
+                rows = self._scanFile(f=f)
+
+        with self.db:
+            old = self._fileNo(path=path)
+            if old is not None:
+                self.db.execute("DELETE FROM items WHERE fileNo = ?", (old,))
+                self.db.execute("DELETE FROM files WHERE fileNo = ?", (old,))
+            cur = self.db.execute(
+                "INSERT INTO files (path, member, size, mtime) VALUES (?, ?, ?, ?)",
+                (str(path), member, stat.st_size, stat.st_mtime_ns),
+            )
+            fileNo = cur.lastrowid
+            self.db.executemany(
+                "INSERT OR REPLACE INTO items VALUES (?, ?, ?, ?, ?, ?)",
+                ((mtype, ID, lm, fileNo, start, n) for mtype, ID, lm, start, n in rows),
+            )
+        return len(rows)
+
+    def close(self) -> None:
+        self.db.close()
+
+    def keys(self) -> Iterator[tuple]:
+        """Yields distinct (mtype, id) tuples in sorted order."""
+        for mtype, ID in self.db.execute(
+            "SELECT DISTINCT mtype, id FROM items ORDER BY mtype, id"
+        ):
+            yield mtype, ID
+
+    def lookup(self, *, mtype: str, ID: int) -> list:
+        """
+        Returns a list of (path, lastModified, start, length) tuples for every
+        copy of the moduleItem, newest first; empty list if there is none.
+        """
+        return self.db.execute(
+            """SELECT f.path, i.lastModified, i.start, i.length
+            FROM items i JOIN files f ON i.fileNo = f.fileNo
+            WHERE i.mtype = ? AND i.id = ?
+            ORDER BY i.lastModified DESC, i.fileNo""",
+            (mtype, int(ID)),
+        ).fetchall()
+
+    def read(self, *, keys: Iterable[tuple]) -> Iterator[tuple]:
+        """
+        Yields (mtype, moduleItemN) for the newest copy of every requested
+        (mtype, id) key. Every file is read only once and in order, so the
+        items come out sorted by file and position, not by key.
+
+        Raises KeyError if a key is not in the index and ValueError if a file
+        has changed since it was indexed.
+        """
+        spans = {}  # fileNo -> [(start, length, mtype)]
+        missing = []
+        for mtype, ID in dict.fromkeys((k[0], int(k[1])) for k in keys):
+            row = self.db.execute(
+                """SELECT fileNo, start, length FROM items
+                WHERE mtype = ? AND id = ?
+                ORDER BY lastModified DESC, fileNo LIMIT 1""",
+                (mtype, ID),
+            ).fetchone()
+            if row is None:
+                missing.append((mtype, ID))
+            else:
+                fileNo, start, length = row
+                spans.setdefault(fileNo, []).append((start, length, mtype))
+        if missing:
+            raise KeyError(f"Not in index: {missing}")
+
+        for fileNo in sorted(spans):
+            path, member, size, mtime = self.db.execute(
+                "SELECT path, member, size, mtime FROM files WHERE fileNo = ?",
+                (fileNo,),
+            ).fetchone()
+            stat = Path(path).stat()
+            if stat.st_size != size or stat.st_mtime_ns != mtime:
+                raise ValueError(f"File changed since it was indexed: {path}")
+            if member is None:
+                with open(path, "rb") as f:
+                    yield from self._readSpans(f=f, spans=spans[fileNo])
+            else:
+                with ZipFile(path, "r") as zippy:
+                    with zippy.open(member) as f:
+                        yield from self._readSpans(f=f, spans=spans[fileNo])
+
+    #
+    # private helpers
+    #
+
+    def _fileNo(self, *, path: Path) -> Union[int, None]:
+        row = self.db.execute(
+            "SELECT fileNo FROM files WHERE path = ?", (str(path),)
+        ).fetchone()
+        if row is not None:
+            return row[0]
+
+    def _parseItem(self, *, raw: bytes) -> ET:
+        """
+        Parse the bytes of a single moduleItem; we need a parent for the
+        default namespace.
+        """
+        outer = etree.fromstring(
+            b'<module xmlns="' + NSMAP["m"].encode() + b'">' + raw + b"</module>",
+            parser,
+        )
+        return outer[0]
+
+    def _readSpans(self, *, f: Any, spans: list) -> Iterator[tuple]:
+        # seeking forward only, so that zipped files are unpacked only once
+        for start, length, mtype in sorted(spans):
+            f.seek(start)
+            itemN = self._parseItem(raw=f.read(length))
+            yield mtype, itemN
+
+    def _row(self, *, data: Any, mtype: str, start: int, end: int) -> tuple:
+        itemN = self._parseItem(raw=data[start:end])
+        # yyyymmddhhmmss, so that dates and shorter times sort correctly
+        digits = re.sub(r"\D", "", xpaths["lastModified"](itemN))[:14]
+        return (
+            mtype,
+            int(itemN.get("id")),
+            int(digits.ljust(14, "0")) if digits else None,
+            start,
+            end - start,
+        )
+
+    def _scan(self, *, data: Any) -> Iterator[tuple]:
+        """
+        Yields (mtype, id, lastModified, start, length) for every moduleItem in
+        data (bytes or mmap).
+        """
+        mtype = None
+        start = None
+        for match in tagRegex.finditer(data):
+            tag = match.group(0)
+            if tag.startswith(b"<module") and not tag.startswith(b"<moduleItem"):
+                mtype = match.group(1).decode()
+            elif tag.startswith(b"<moduleItem") and tag.endswith(b"/>"):
+                # empty item like <moduleItem id="1"/>
+                yield self._row(
+                    data=data, mtype=mtype, start=match.start(), end=match.end()
+                )
+            elif tag.startswith(b"<moduleItem"):
+                start = match.start()
+            elif start is not None:
+                yield self._row(data=data, mtype=mtype, start=start, end=match.end())
+                start = None
+
+    def _scanFile(self, *, f: Any) -> list:
+        """Scan a file opened in binary mode via mmap; see _scan."""
+        f.flush()
+        if os.fstat(f.fileno()).st_size == 0:  # can't mmap empty files
+            return []
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            return list(self._scan(data=data))
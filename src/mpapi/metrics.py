@@ -0,0 +1,217 @@
+"""
+Metrics - counts, latencies and bytes of requests to RIA per endpoint
+
+Requests are grouped by method and endpoint template, i.e. the url with
+ids and names replaced by placeholders (e.g. POST module/{mtype}/search).
+
+USAGE
+    from mpapi.metrics import Metrics
+    metrics = Metrics()
+    api = MpApi(baseURL=baseURL, user=user, pw=pw, metrics=metrics)
+    ...
+    metrics.summary()                       # dict, see below
+    metrics.toJSON(path="metrics.json")
+    metrics.toPrometheus(path="metrics.prom")  # text exposition format
+
+    {"GET module/{mtype}/{id}": {
+        "count": 12, "errors": 0, "retries": 1,
+        "latency": {"sum": 3.2, "mean": 0.27, "buckets": {"0.05": 0, ...}},
+        "bytesSent": 0, "bytesReceived": 834567,
+        "status": {"200": 12}}}
+
+DESIGN
+* One record per call, not per attempt; the latency includes retries and
+  the waits between them. For streamed responses, the latency is the time
+  until the headers arrived; bytes are counted while the body is read.
+* Latency buckets are cumulative like Prometheus histograms.
+* Responses served from a ResponseCache without asking RIA are not
+  recorded.
+"""
+
+import json
+from pathlib import Path
+import threading
+from typing import Optional, Union
+from urllib.parse import urlsplit
+
+PathX = Union[Path, str]
+
+buckets = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, float("inf"))
+
+# segment that follows one of these is a name, not part of the template
+placeholders = {
+    "module": "{mtype}",
+    "instances": "{instanceName}",
+    "nodeClasses": "{className}",
+    "termClasses": "{className}",
+    "labels": "{language}",
+}
+
+
+def endpoint(url: str) -> str:
+    """
+    Endpoint template for a url, e.g.
+    http://host/ria-ws/application/module/Object/123 -> module/{mtype}/{id}
+    """
+    path = urlsplit(url).path
+    marker = "/ria-ws/application/"
+    if marker in path:
+        path = path.split(marker, 1)[1]
+    segments = path.strip("/").split("/")
+    template = []
+    for no, segment in enumerate(segments):
+        previous = segments[no - 1] if no > 0 else None
+        if segment.isdigit():
+            template.append("{id}")
+        elif previous in placeholders and segment != "definition":
+            template.append(placeholders[previous])
+        else:
+            template.append(segment)
+    return "/".join(template)
+
+
+class Metrics:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._data: dict = {}
+
+    def addReceived(self, *, method: str, url: str, n: int) -> None:
+        """Count bytes of a streamed response as they are read."""
+        with self._lock:
+            self._entry(key=(method, endpoint(url)))["bytesReceived"] += n
+
+    def record(
+        self,
+        *,
+        method: str,
+        url: str,
+        status: Optional[int],
+        latency: float,
+        sent: int = 0,
+        received: int = 0,
+        retries: int = 0,
+    ) -> None:
+        """
+        Record a call; status is None if there was no response at all (e.g.
+        connection error).
+        """
+        with self._lock:
+            entry = self._entry(key=(method, endpoint(url)))
+            entry["count"] += 1
+            entry["retries"] += retries
+            entry["latencySum"] += latency
+            for no, bound in enumerate(buckets):
+                if latency <= bound:
+                    entry["buckets"][no] += 1
+            entry["bytesSent"] += sent
+            entry["bytesReceived"] += received
+            status = "error" if status is None else str(status)
+            entry["status"][status] = entry["status"].get(status, 0) + 1
+
+    def reset(self) -> None:
+        with self._lock:
+            self._data = {}
+
+    def summary(self) -> dict:
+        """Returns a dict with the numbers per 'METHOD endpoint'."""
+        with self._lock:
+            result = {}
+            for (method, template), entry in sorted(self._data.items()):
+                count = entry["count"]
+                errors = sum(
+                    n
+                    for status, n in entry["status"].items()
+                    if status == "error" or int(status) >= 400
+                )
+                result[f"{method} {template}"] = {
+                    "count": count,
+                    "errors": errors,
+                    "retries": entry["retries"],
+                    "latency": {
+                        "sum": round(entry["latencySum"], 6),
+                        "mean": round(entry["latencySum"] / count, 6) if count else 0,
+                        "buckets": {
+                            _le(bound): n for bound, n in zip(buckets, entry["buckets"])
+                        },
+                    },
+                    "bytesSent": entry["bytesSent"],
+                    "bytesReceived": entry["bytesReceived"],
+                    "status": dict(sorted(entry["status"].items())),
+                }
+            return result
+
+    def toJSON(self, *, path: PathX) -> None:
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.summary(), f, indent=2)
+
+    def toPrometheus(self, *, path: PathX) -> None:
+        """
+        Writes the metrics in Prometheus' text exposition format, e.g. for
+        node_exporter's textfile collector.
+        """
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(self.prometheus())
+
+    def prometheus(self) -> str:
+        with self._lock:
+            items = sorted(self._data.items())
+        lines = []
+
+        def header(name: str, kind: str, help: str) -> None:
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+
+        header("mpapi_requests_total", "counter", "Calls to RIA by status.")
+        for (method, template), entry in items:
+            for status, n in sorted(entry["status"].items()):
+                labels = _labels(method, template, status=status)
+                lines.append(f"mpapi_requests_total{{{labels}}} {n}")
+        header(
+            "mpapi_request_duration_seconds", "histogram", "Latency of calls to RIA."
+        )
+        for (method, template), entry in items:
+            for bound, n in zip(buckets, entry["buckets"]):
+                labels = _labels(method, template, le=_le(bound))
+                lines.append(f"mpapi_request_duration_seconds_bucket{{{labels}}} {n}")
+            labels = _labels(method, template)
+            lines.append(
+                f"mpapi_request_duration_seconds_sum{{{labels}}} {entry['latencySum']}"
+            )
+            lines.append(
+                f"mpapi_request_duration_seconds_count{{{labels}}} {entry['count']}"
+            )
+        for name, key, help in (
+            ("mpapi_request_bytes_total", "bytesSent", "Bytes sent to RIA."),
+            ("mpapi_response_bytes_total", "bytesReceived", "Bytes received."),
+            ("mpapi_retries_total", "retries", "Retried attempts."),
+        ):
+            header(name, "counter", help)
+            for (method, template), entry in items:
+                lines.append(f"{name}{{{_labels(method, template)}}} {entry[key]}")
+        return "\n".join(lines) + "\n"
+
+    #
+    # private helpers
+    #
+
+    def _entry(self, *, key: tuple) -> dict:
+        if key not in self._data:
+            self._data[key] = {
+                "count": 0,
+                "retries": 0,
+                "latencySum": 0.0,
+                "buckets": [0] * len(buckets),
+                "bytesSent": 0,
+                "bytesReceived": 0,
+                "status": {},
+            }
+        return self._data[key]
+
+
+def _labels(method: str, template: str, **extra) -> str:
+    labels = {"method": method, "endpoint": template, **extra}
+    return ",".join(f'{k}="{v}"' for k, v in labels.items())
+
+
+def _le(bound: float) -> str:
+    return "+Inf" if bound == float("inf") else str(bound)
@@ -37,9 +37,12 @@ USAGE:
     xml_str = m.toString()
     lxml = m.toET()  # returns lxml etree document
     m.validate()     # dies if doc doesn't validate
+    m.validateItems() # {(mtype, ID): error} for invalid items, checked in parallel
 
     # inspecting module data     
     adict = m.describe()          # no of items per mtype
+    digestsD = m.digests()        # content hash per moduleItem
+    changes = old.diff(new)       # added, removed and changed items
     m.totalSize(module="Object")  # no of items as per attribute
     m.actualSize(module="Object") # no of actual items
     sizeInt = len(m)
@@ -56,6 +59,13 @@ USAGE:
     for item in m.iter(module="Object"):
         #do something with object item
 
+    # stream items from files that are too big for memory (xml or zip)
+    for itemN in Module.iterFile(path="big.xml", mtype="Object"):
+        #do something with item; it's cleared afterwards
+
+    # random access to items in big files; see itemindex.py
+    m = Module.fromIndex(index="harvest.idx", keys=[("Object", 254808)])
+
     # deleting stuff
     m.dropRepeatableGroup(parent=miN, name="ObjValuationGrp")
     m._dropFields(parent=miN, type="systemField")
@@ -66,7 +76,9 @@ USAGE:
     # other changes to xml
     m.updateTotalSize() # update for all module types
     m.add(doc=ET)
+    m.add(doc=ET, adopt=True)  # moves items from ET into m without copying
     m3 = m1 + m2
+    m1 += m2                    # like m1 = m1 + m2, but without copying m1
 
     # WRITING XML FROM SCRATCH
     m = Module()
@@ -79,12 +91,18 @@ USAGE:
 """
 
 from collections import namedtuple  # experimenting with namedtuples
+from concurrent.futures import ThreadPoolExecutor
 from copy import deepcopy  # for lxml
+import hashlib
 from lxml import etree  # type: ignore
 from mpapi.constants import NSMAP, parser
-from mpapi.helper import Helper
+from mpapi.helper import Helper, getSchema
+from mpapi.itemindex import ItemIndex
+from mpapi.transform import Transform
+from mpapi.xpaths import compiled, xpaths
 from pathlib import Path
-from typing import Any, Iterator, Optional, Union
+from typing import Any, Iterable, Iterator, Optional, Union
+from zipfile import ZipFile
 
 # xpath 1.0 and lxml don't allow empty string or None for default ns
 dataTypes = {"Clb": "Clob", "Dat": "Date", "Lnu": "Long", "Txt": "Varchar"}
@@ -94,8 +112,62 @@ ET = Any
 PathX = Union[Path, str]
 Item = namedtuple("Item", ["type", "id"])
 
+# rules for clean and uploadForm; see transform.py
+cleanRules = Transform(
+    dropElements={"repeatableGroup": {"ObjValuationGrp"}},
+    dropAttribs={"*": {"uuid"}},
+)
+
+# parts of a moduleItem that change without a change of content; see digests
+digestRules = Transform(
+    dropElements={"formattedValue": None},
+    dropAttribs={"*": {"uuid"}},
+)
+
+uploadRules = Transform(
+    dropElements={
+        # we want to preserve systemField:__orgUnit
+        "systemField": {
+            "__id",
+            "__lastModified",
+            "__lastModifiedUser",
+            "__createdUser",
+            "__created",
+            "__uuid",
+        },
+        "virtualField": None,
+        "formattedValue": None,
+        "dataField": {
+            "ModifiedByTxt",
+            "ModifiedDateDat",
+            "ObjRecordCreatedByTxt",
+            "ObjInventoryDateDat",
+            "DatestampFromFuzzySearchLnu",
+            "DatestampToFuzzySearchLnu",
+        },
+        "moduleReference": {"ObjMultimediaRef"},  # "ObjObjectGroupsRef"
+    },
+    keepElements={"systemField": {"__orgUnit"}},
+    dropAttribs={
+        # upload sometimes wants moduleItem@id, sometimes not
+        "moduleItem": {"uuid", "hasAttachments"},
+        "module": {"totalSize"},
+        "dataField": {"dataType"},
+        # do we need to eliminate size attributes in repeatableGroups?
+        "repeatableGroup": {"size"},
+        # moduleReference: we need to keep name and targetModule
+        "vocabularyReference": {"id", "instanceName"},
+        "vocabularyReferenceItem": {"name"},
+        # sometimes we want to have repeatableGroupItem@id
+        # "moduleReferenceItem": {"seqNo"}, "compositeItem": {"seqNo"}
+    },
+)
+
 
 class Module(Helper):
+    # Definitions object for dataTypes of new dataFields; see definitions.py
+    definitions = None
+
     def __add__(self, m2):  # pytest complains when I add type hints
         """
         join two Module objects using the + operator:
@@ -121,15 +193,35 @@ class Module(Helper):
 
         RETURNS
         * lxml.etree._Element object
+
+        Raises KeyError if there is no such moduleItem.
+
+        NEW
+        * uses the internal index instead of a new xpath for every lookup
         """
         mtype = item[0]
         ID = str(item[1])
 
-        itemN: ET = self.xpath(
-            f"/m:application/m:modules/m:module[@name = '{mtype}']/m:moduleItem[@id = '{ID}']"
-        )[0]
+        hit = self._lookup(mtype=mtype, ID=ID)
+        if hit is None:
+            raise KeyError(f"No moduleItem with mtype '{mtype}' and id '{ID}'")
+        itemN, moduleN = hit
         return itemN
 
+    def __iadd__(self, m2):
+        """
+        join another Module object into this one in place:
+            m1 = Module(file="one.xml")
+            m1 += Module(file="two.xml")
+
+        Unlike +, this doesn't copy m1; m2 remains unchanged. Use
+            m1.add(doc=m2.etree, adopt=True)
+        if you don't need m2 any longer and want to save the copy of m2 as
+        well.
+        """
+        self.add(doc=m2.etree)
+        return self
+
     def __init__(self, *, file: PathX = None, tree: ET = None, xml: str = None) -> None:
         """
         There are FOUR ways to make a new Module object. Pick one:
@@ -140,6 +232,10 @@ class Module(Helper):
 
         INTERNALS
         * the lxml document is stored in self.etree
+        * a dictionary (mtype, id) -> (moduleItem, module) is built lazily on
+          first lookup; it also counts moduleItems per mtype; see _getIndex
+        * totalSize attributes of changed modules are written only when the
+          document is written or handed out; see _beforeWrite
 
         NEW
         * previous versions were not able to deal with multi-type documents;
@@ -166,6 +262,8 @@ class Module(Helper):
                 <modules/>
             </application>"""
             self.etree = etree.fromstring(xml, parser)
+        self._index = None
+        self._dirty = set()  # mtypes whose totalSize needs updating
 
     def __iter__(self) -> ET:
         """
@@ -175,9 +273,7 @@ class Module(Helper):
             for moduleItem in m:
                 #do something with moduleItem
         """
-        apath = "/m:application/m:modules/m:module/m:moduleItem"
-        itemsN = self.xpath(apath)
-        for itemN in itemsN:
+        for itemN in xpaths["items"](self.etree):
             yield itemN
 
     def __len__(self):
@@ -194,8 +290,12 @@ class Module(Helper):
                 m
         to check type:
             isinstance(m, Module)
+
+        NEW
+        * uses the item counters in the internal index instead of counting
+          (checked against the document, see _counts)
         """
-        return int(self.xpath("count(/m:application/m:modules/m:module/m:moduleItem)"))
+        return sum(self._counts().values())
 
     def __str__(self):
         return self.toString()
@@ -217,24 +317,17 @@ class Module(Helper):
         NEW
         * Used to return None when requested object didn't exist, now raises
           TypeError.
+        * uses the item counters in the internal index instead of counting
+          (checked against the document, see _counts)
 
         EXAMPLE
         <application xmlns="http://www.zetcom.com/ria/ws/module">
            <modules>
               <module name="Object" totalSize="173">
         """
-        try:
-            return int(
-                self.xpath(
-                    f"count(/m:application/m:modules/m:module[@name ='{module}']/m:moduleItem)"
-                )
-            )
-        except:
-            raise TypeError(
-                f"Requested module '{module}' doesn't exist or has no moduleItems"
-            )
+        return self._counts().get(module, 0)
 
-    def add(self, *, doc: ET) -> None:
+    def add(self, *, doc: ET, adopt: bool = False) -> None:
         """
         add a new doc[ument] to the Module, i.e. join two documents.
 
@@ -255,51 +348,50 @@ class Module(Helper):
 
         That means we dont need to know what the types in the old doc are.
 
-        m.join(doc=lxml)
-        m.join(doc=Module())
+        m.add(doc=lxml)
+        m.add(doc=lxml, adopt=True)
 
         Should doc be an lxml object or another Module?
+
+        EXPECTS
+        * doc: lxml document (tree or root element)
+        * adopt (optional): if True, we take ownership of doc, i.e. its modules
+          and moduleItems are moved into self without making a copy. Use it for
+          documents that are not needed anymore, e.g. ones freshly parsed from
+          a response; afterwards doc is practically empty. If False (default),
+          doc remains unchanged.
+
         NEW
         * At some point, the method add would change doc so that after
           completion, doc was practically empty.
-        * The current implmentation is very slow; it takes ca. 20 min to add a
-          couple thousand records.
+        * The old implementation was very slow; it took ca. 20 min to add a
+          couple thousand records. Now we look up items in the internal
+          index, so adding is linear in the number of items.
         """
         # List[Union[_Element, Union[_ElementUnicodeResult, _PyElementUnicodeResult, _ElementStringResult]]]
-        doc2 = deepcopy(doc)  # leave doc alone, so we don't change it
+        if adopt:
+            doc2 = doc
+        else:
+            doc2 = deepcopy(doc)  # leave doc alone, so we don't change it
         d2moduleL = doc2.xpath(  # newdoc
             "/m:application/m:modules/m:module",
             namespaces=NSMAP,
         )
 
         for d2moduleN in d2moduleL:
-            try:
-                d2mtypeL: list[ET] = d2moduleN.xpath(
-                    "/m:application/m:modules/m:module/@name", namespaces=NSMAP
-                )
-            except:
-                # newdoc has no mtypes, so appears empty, nothing to add
-                # print("newdoc appears to be empty")
-                return None
-
-            for d2mtype in d2mtypeL:
-                # print(f"newdoc mtype: {d2mtype}")
-                try:  # Does this mtype exist in old doc?
-                    self.xpath(
-                        f"/m:application/m:modules/m:module[@name = '{d2mtype}']"
-                    )[0]
-                except:
-                    # old doc doesn't have this mtype, so we add the whole
-                    # all of d2's modules[@name = {mtype}]/moduleItems to d1
-                    # print (f"d1 doesn't know this mtype {d2mtype}")
-                    d1modules = self.xpath("/m:application/m:modules")[0]
-                    d1modules.append(d2moduleN)
-                else:
-                    # new doc's mtype exists already in old doc
-                    # we need to compare each item in d1 and d2
-                    # print("b4 _compareItems")
-                    self._compareItems(mtype=d2mtype, moduleN=d2moduleN)
-        self.updateTotalSize()
+            d2mtype = d2moduleN.get("name")
+            moduleN = self._getIndex()["modules"].get(d2mtype)
+            if moduleN is None:
+                # old doc doesn't have this mtype, so we add the whole
+                # module[@name = {mtype}] with all its moduleItems to d1
+                d1modules = self.xpath("/m:application/m:modules")[0]
+                d1modules.append(d2moduleN)
+                self._indexModule(moduleN=d2moduleN)
+            else:
+                # new doc's mtype exists already in old doc
+                # we need to compare each item in d1 and d2
+                self._compareItems(mtype=d2mtype, moduleN=d2moduleN)
+        self._dirty.update(self._getIndex()["modules"])
 
     def addItem(self, *, itemN: ET, mtype: str):
         """
@@ -309,6 +401,7 @@ class Module(Helper):
         - We're now checking if item (with that modItemId) exists already. If so, we're
           discarding the old item before adding the new one.
         - We're working on a deepcopy; otherwise we have xml chaos
+        - totalSize is no longer recounted after every item, see _beforeWrite
         """
 
         newN = deepcopy(itemN)  # dont touch the original
@@ -319,7 +412,10 @@ class Module(Helper):
         # it's conceivable that internal module has no module[@name=mtype] yet
         moduleN = self.module(name=mtype)
         moduleN.append(newN)
-        self.updateTotalSize()
+        index = self._getIndex()
+        index["items"][(mtype, modItemId)] = (newN, moduleN)
+        index["counts"][mtype] += 1
+        self._dirty.add(mtype)
 
     def clean(self) -> None:
         """
@@ -328,9 +424,12 @@ class Module(Helper):
         * drops Werte und Versicherung to not spill our guts
         * this method doesn't do any validation
         SEE ALSO sanitize
+
+        NEW
+        * all changes are made in a single pass through the document, see
+          cleanRules
         """
-        self.dropUUID()
-        self.dropRepeatableGroup(name="ObjValuationGrp")
+        cleanRules.apply(tree=self.etree)
 
     def dataField(
         self, *, parent: ET, name: str, dataType: str = None, value: str = None
@@ -341,8 +440,9 @@ class Module(Helper):
         EXPECTS
         * parent; should be moduleItem
         * name of the dataField
-        * dataType (optional): If no dataType is given, dataType will be
-          determined based on last three characters of name.
+        * dataType (optional): If no dataType is given, dataType is taken
+          from the module definition (see Module.definitions) or, if that
+          doesn't know, determined based on last three characters of name.
         * value (optional):
 
         RETURNS
@@ -358,6 +458,8 @@ class Module(Helper):
                 0
             ]
         except:
+            if dataType is None:
+                dataType = self._definedType(parent=parent, name=name)
             if dataType is None:
                 typeHint = name[-3:]
                 dataType = dataTypes[typeHint]
@@ -376,15 +478,82 @@ class Module(Helper):
         return dataFieldN
 
     def delItem(self, *, modItemId: int, mtype: str):
-        itemN = self.xpath(
-            """/m:application/m:modules/m:module[
-            @name = '{mtype}'
-        ]/m:moduleItem[
-            @id = '{str(modItemId)}'
-        ]"""
-        )[0]
+        """
+        Delete the moduleItem with that mtype and ID. Raises KeyError if there
+        is no such item.
+        """
+        hit = self._lookup(mtype=mtype, ID=modItemId)
+        if hit is None:
+            raise KeyError(f"No moduleItem with mtype '{mtype}' and id '{modItemId}'")
+        itemN, moduleN = hit
+        moduleN.remove(itemN)
+        index = self._getIndex()
+        del index["items"][(mtype, str(modItemId))]
+        index["counts"][mtype] -= 1
+        self._dirty.add(mtype)
+
+    def diff(self, other, *, fields: bool = False) -> dict:
+        """
+        Compare this Module with another one (e.g. an older with a newer
+        harvest) using the digests of their moduleItems.
+
+        USAGE
+        changes = old.diff(new)
+        changes = old.diff(new, fields=True)
+
+        RETURNS
+        * dictionary with sets of (mtype, ID) tuples
+            {
+                "added": set(),    # in other, but not in self
+                "removed": set(),  # in self, but not in other
+                "changed": set(),  # in both, but with different content
+            }
+        * if fields is True, there is an additional key "fields" with the
+          names of the top-level fields (dataField, repeatableGroup etc.) that
+          differ for every changed item:
+            {(mtype, ID): {"ObjTechnicalTermClb", "__lastModified"}}
+
+        Runs in linear time; the same things are ignored as in digests.
+        """
+        mine = self.digests()
+        theirs = other.digests()
+        changes = {
+            "added": theirs.keys() - mine.keys(),
+            "removed": mine.keys() - theirs.keys(),
+            "changed": {
+                key for key in mine.keys() & theirs.keys() if mine[key] != theirs[key]
+            },
+        }
+        if fields:
+            # only changed items are compared field by field
+            changes["fields"] = {
+                key: self._diffFields(
+                    self._canonical(itemN=self[key]),
+                    other._canonical(itemN=other[key]),
+                )
+                for key in changes["changed"]
+            }
+        return changes
 
-        itemN.getparent().remove(itemN)
+    def digests(self) -> dict:
+        """
+        Returns a content hash for every moduleItem:
+            {(mtype, ID): digest}
+
+        Items are hashed in canonical form (c14n), so that serialization
+        details don't matter. Things that change without a change of content
+        are ignored: uuid attributes, formattedValue elements and whitespace
+        between elements (see digestRules).
+
+        Items are copied and rewritten one at a time, so memory doesn't grow
+        with the size of the document; self remains unchanged.
+        """
+        digests = {}
+        for itemN in xpaths["items"](self._root()):
+            key = (itemN.getparent().get("name"), itemN.get("id"))
+            c14n = etree.tostring(self._canonical(itemN=itemN), method="c14n")
+            digests[key] = hashlib.blake2b(c14n, digest_size=16).hexdigest()
+        return digests
 
     def describe(self) -> dict:
         """
@@ -395,20 +564,7 @@ class Module(Helper):
         * a dictionary {'Object': 173, 'Person': 58, 'Multimedia': 608}
         """
         # report[type] = number_of_items
-
-        known_types = set()
-        report = dict()
-        moduleL: list[ET] = self.xpath(f"/m:application/m:modules/m:module")
-        for moduleN in moduleL:
-            moduleA = moduleN.attrib
-            known_types.add(moduleA["name"])
-
-        for Type in known_types:
-            itemL: list[ET] = self.xpath(
-                f"/m:application/m:modules/m:module[@name = '{Type}']/m:moduleItem"
-            )
-            report[Type] = len(itemL)
-        return report
+        return dict(self._counts())
 
     def dropUUID(self) -> None:
         """
@@ -427,13 +583,8 @@ class Module(Helper):
         for rgN in rgL:
             rgN.getparent().remove(rgN)
 
-    def existsItem(self, *, mtype: str, modItemId: int):
-        try:
-            self.__getitem__([(mtype, newId)])
-        except:
-            return False
-        else:
-            return True
+    def existsItem(self, *, mtype: str, modItemId: int) -> bool:
+        return self._lookup(mtype=mtype, ID=modItemId) is not None
 
     def extract_first_id(self) -> int:
         return self.xpath("/m:application/m:modules/m:module/m:moduleItem[1]/@id")[0]
@@ -445,7 +596,7 @@ class Module(Helper):
         Raises ValueError if zero or more than 1 mtypes in data
         """
 
-        mtypeL = self.xpath("/m:application/m:modules/m:module/@name")
+        mtypeL = xpaths["mtypes"](self.etree)
         if len(mtypeL) == 0:
             raise ValueError("Data has no content")
         if len(mtypeL) > 1:
@@ -458,7 +609,39 @@ class Module(Helper):
         Returns list of mtypes
 
         """
-        return self.xpath("/m:application/m:modules/m:module/@name")
+        return xpaths["mtypes"](self.etree)
+
+    @staticmethod
+    def fromIndex(*, index: Union[ItemIndex, PathX], keys: Iterable) -> "Module":
+        """
+        Returns a new Module with the requested moduleItems, read from the big
+        files noted in index; only those items are parsed, not whole files.
+
+        USAGE
+        idx = ItemIndex(path="harvest.idx")
+        idx.add(path="join.xml")
+        m = Module.fromIndex(index=idx, keys=[("Object", 254808)])
+
+        EXPECTS
+        * index: ItemIndex object or path to an index file
+        * keys: iterable of (mtype, id) tuples
+
+        Raises KeyError if a key is not in the index. See itemindex.py.
+        """
+        if isinstance(index, ItemIndex):
+            idx = index
+        else:
+            idx = ItemIndex(path=index)
+        m = Module()
+        try:
+            for mtype, itemN in idx.read(keys=keys):
+                m.module(name=mtype).append(itemN)
+        finally:
+            if idx is not index:
+                idx.close()
+        m._index = None
+        m.updateTotalSize()
+        return m
 
     def iter(self, *, module: str = "Object") -> Iterator:
         """
@@ -479,10 +662,84 @@ class Module(Helper):
         * Do we really need to iterate through a document using this module or
           should we simply use lxml for that?
         """
-        apath = f"/m:application/m:modules/m:module[@name ='{module}']/m:moduleItem"
-        itemsN = self.xpath(apath)
-        for itemN in itemsN:
-            yield itemN
+        moduleN = self._getIndex()["modules"].get(module)
+        if moduleN is not None:
+            for itemN in moduleN.iterchildren(
+                "{http://www.zetcom.com/ria/ws/module}moduleItem"
+            ):
+                yield itemN
+
+    @staticmethod
+    def iterFile(*, path: PathX, mtype: str = None) -> Iterator:
+        """
+        Streams moduleItems from a zml file without loading the whole document,
+        so it works for files that are larger than memory. Path can be an xml
+        file or a zipped chunk as written by toZip.
+
+        USAGE
+        for itemN in Module.iterFile(path="big.xml", mtype="Object"):
+            mtype = itemN.getparent().get("name")
+            #do something w/ itemN
+
+        EXPECTS
+        * path: path to xml or zip file
+        * mtype: only yield moduleItems of this type; default is all types
+
+        RETURNS
+        * iterator of moduleItem elements
+
+        CAVEAT
+        * Every moduleItem is cleared after it has been processed and preceding
+          items are deleted, so memory use stays flat. Hence an item is only
+          valid until the next one is requested; if you want to keep it, make
+          a copy (e.g. with deepcopy).
+        * The item's parent is its module element, so its type is still
+          available, but the module doesn't contain the other items.
+        """
+        path = Path(path)
+        itemTag = f"{{{NSMAP['m']}}}moduleItem"
+        if path.suffix == ".zip":
+            with ZipFile(path, "r") as zippy:
+                with zippy.open(path.with_suffix(".xml").name) as f:
+                    yield from Module._iterItems(source=f, tag=itemTag, mtype=mtype)
+        else:
+            yield from Module._iterItems(source=str(path), tag=itemTag, mtype=mtype)
+
+    @staticmethod
+    def iterStream(*, chunks: Iterable[bytes], mtype: str = None) -> Iterator:
+        """
+        Like iterFile, but for zml that arrives in pieces, e.g. the body of a
+        streamed http response. moduleItems are yielded as soon as they are
+        complete, so processing can overlap with the transfer.
+
+        USAGE
+        for itemN in Module.iterStream(chunks=r.iter_content(chunk_size=65536)):
+            #do something w/ itemN
+
+        EXPECTS
+        * chunks: iterable of bytes
+        * mtype (optional): only yield moduleItems of this type
+
+        CAVEATS
+        * same as for iterFile: every item is cleared after it has been
+          processed
+        """
+        itemTag = f"{{{NSMAP['m']}}}moduleItem"
+        parser = etree.XMLPullParser(
+            events=("end",), tag=itemTag, remove_blank_text=True
+        )
+
+        def pulled() -> Iterator:
+            for event, itemN in parser.read_events():
+                if mtype is None or itemN.getparent().get("name") == mtype:
+                    yield itemN
+                Module._release(itemN=itemN)
+
+        for chunk in chunks:
+            parser.feed(chunk)
+            yield from pulled()
+        parser.close()
+        yield from pulled()
 
     def module(self, *, name: str) -> ET:
         """
@@ -508,11 +765,8 @@ class Module(Helper):
               <moduleItem hasAttachments="false" id="254808" uuid="254808">
               ...
         """
-        try:
-            moduleN = self.xpath(f"/m:application/m:modules/m:module[@name='{name}']")[
-                0
-            ]
-        except:
+        moduleN = self._getIndex()["modules"].get(name)
+        if moduleN is None:
             # modules should always exist, module doesn't
             modulesN = self.xpath("/m:application/m:modules")[0]
             moduleN = etree.SubElement(
@@ -521,6 +775,7 @@ class Module(Helper):
                 name=name,
             )
             # might be append instead: modulesN.append(moduleN)...
+            self._indexModule(moduleN=moduleN)
         return moduleN
 
     def moduleItem(
@@ -544,12 +799,13 @@ class Module(Helper):
             </systemField>
         </moduleItem>
         """
-        try:
-            item = parent.xpath(
-                f"/m:moduleItem[@id = '{ID}'",
-                namespaces=NSMAP,
-            )[0]
-        except:
+        mtype = parent.get("name")
+        hit = None
+        if ID is not None:
+            hit = self._lookup(mtype=mtype, ID=ID)
+        if hit is not None:
+            item, moduleN = hit
+        else:
             item = etree.Element(
                 "{http://www.zetcom.com/ria/ws/module}moduleItem",
             )
@@ -558,6 +814,10 @@ class Module(Helper):
             if hasAttachments is not None:
                 item.set("hasAttachments", hasAttachments.lower())
             parent.append(item)
+            index = self._getIndex()
+            if ID is not None:
+                index["items"][(mtype, str(ID))] = (item, parent)
+            index["counts"][mtype] = index["counts"].get(mtype, 0) + 1
         return item
 
     def moduleReference(
@@ -703,12 +963,15 @@ class Module(Helper):
         * Used to return None when requested object didn't exist, now raises
           TypeError.
         * Todo write tests for the errors this method can throw!
+        * totalSize of modules changed by add, addItem or delItem is brought
+          up to date first, see _beforeWrite
 
         EXAMPLE
         <application xmlns="http://www.zetcom.com/ria/ws/module">
            <modules>
               <module name="Object" totalSize="173">
         """
+        self._beforeWrite()
         try:
             return int(
                 self.xpath(
@@ -732,23 +995,11 @@ class Module(Helper):
            <modules>
               <module name="Object" totalSize="173">
         """
-        knownTypes = self._types()
-
-        for modType in knownTypes:
+        for moduleN in xpaths["modules"](self.etree):
             # items per modType
-            itemsL = self.xpath(
-                f"/m:application/m:modules/m:module[@name = '{modType}']/m:moduleItem"
-            )
-            try:
-                moduleN = self.xpath(
-                    f"/m:application/m:modules/m:module[@name = '{modType}']"
-                )[0]
-            except:
-                pass  # it's not an error if file has no items that can be counted
-            else:
-                # print (f".............updating totalSize for {modType}")
-                attributes = moduleN.attrib
-                attributes["totalSize"] = str(int(len(itemsL)))
+            size = xpaths["countChildItems"](moduleN)
+            moduleN.attrib["totalSize"] = str(int(size))
+        self._dirty = set()
 
     def _parse_ident_in_parts(self, *, nr):  # xxx
         partsL = [x.strip() for x in nr.split()]
@@ -772,56 +1023,52 @@ class Module(Helper):
 
         QUESTIONS:
         - Returns a copy or rewrites itself? Act as clean, so rewrite itself
+
+        NEW
+        - all changes are made in a single pass through the document; the
+          rules are defined in uploadRules at the top of this file. Previous
+          versions needed ca. 25 xpath queries, each traversing the whole
+          document.
         """
+        uploadRules.apply(tree=self.etree)
+        self._dirty = set()  # don't write the dropped totalSize again
 
-        # we want to preserve systemField:__orgUnit
-        # self._dropFields(element="systemField")
-        self._dropFieldsByName(element="systemField", name="__id")
-        self._dropFieldsByName(element="systemField", name="__lastModified")
-        self._dropFieldsByName(element="systemField", name="__lastModifiedUser")
-        self._dropFieldsByName(element="systemField", name="__createdUser")
-        self._dropFieldsByName(element="systemField", name="__created")
-        self._dropFieldsByName(element="systemField", name="__uuid")
-
-        self._dropFields(element="virtualField")
-        self._dropFields(element="formattedValue")
-
-        # upload sometimes wants id, sometimes not
-        # self._dropAttribs(xpath="//m:moduleItem", attrib="id")
-        # do we need to eliminate size attributes in repeatableGroups?
-        self._dropAttribs(xpath="//m:repeatableGroup", attrib="size")
-        self._dropAttribs(xpath="//m:moduleItem", attrib="uuid")
-
-        # various attributes in moduleReference? name we need to keep
-        # <moduleReference name="InvNumberSchemeRef" targetModule="InventoryNumber" multiplicity="N:1" size="1">
-        # self._dropAttribs(xpath="//m:moduleReference", attrib="targetModule")
-        # self._dropAttribs(xpath="//m:moduleReference", attrib="multiplicity")
-        # self._dropAttribs(xpath="//m:moduleReference", attrib="size")
-        self._dropAttribs(xpath="//m:vocabularyReference", attrib="id")
-        self._dropAttribs(xpath="//m:vocabularyReference", attrib="instanceName")
-        self._dropAttribs(xpath="//m:vocabularyReferenceItem", attrib="name")
-        self._dropAttribs(xpath="//m:module", attrib="totalSize")
-        self._dropAttribs(xpath="//m:moduleItem", attrib="hasAttachments")
-        self._dropAttribs(xpath="//m:dataField", attrib="dataType")
-        # sometimes we want to have the rGrpItem@id
-        # self._dropAttribs(xpath="//m:repeatableGroupItem", attrib="id")
-        # self._dropAttribs(xpath="//m:moduleReferenceItem", attrib="seqNo")
-        # self._dropAttribs(xpath="//m:compositeItem", attrib="seqNo")
-        # modifiedBy, modifiedDate
-        #    <dataField dataType="Varchar" name="ModifiedByTxt">
-        #      <value>EM_EM</value>
-        #    </dataField>
-        #    <dataField dataType="Date" name="ModifiedDateDat">
-        #      <value>2010-05-07</value>
-        #    </dataField>
-        self._dropFieldsByName(element="dataField", name="ModifiedByTxt")
-        self._dropFieldsByName(element="dataField", name="ModifiedDateDat")
-        self._dropFieldsByName(element="dataField", name="ObjRecordCreatedByTxt")
-        self._dropFieldsByName(element="dataField", name="ObjInventoryDateDat")
-        self._dropFieldsByName(element="dataField", name="DatestampFromFuzzySearchLnu")
-        self._dropFieldsByName(element="dataField", name="DatestampToFuzzySearchLnu")
-        # self._dropFieldsByName(element="moduleReference", name="ObjObjectGroupsRef")
-        self._dropFieldsByName(element="moduleReference", name="ObjMultimediaRef")
+    def validateItems(self, *, workers: int = 4) -> dict:
+        """
+        Validates every moduleItem on its own, several at once, and reports
+        those that fail. Use it for big documents, where validate only tells
+        you that something somewhere is wrong.
+
+        EXPECTS
+        * workers: number of threads
+
+        RETURNS
+        * dictionary {(mtype, ID): error message} with the failing items;
+          empty if all items are valid
+
+        Every item is validated in a copy of the document that contains only
+        that item; the module schema is cached per thread (see getSchema).
+        """
+
+        def _check(itemN: ET) -> Optional[tuple]:
+            mtype = itemN.getparent().get("name")
+            docN = etree.Element("{http://www.zetcom.com/ria/ws/module}application")
+            modulesN = etree.SubElement(
+                docN, "{http://www.zetcom.com/ria/ws/module}modules"
+            )
+            moduleN = etree.SubElement(
+                modulesN, "{http://www.zetcom.com/ria/ws/module}module", name=mtype
+            )
+            moduleN.append(deepcopy(itemN))
+            schema = getSchema(mode="module")
+            if schema.validate(docN):
+                return None
+            errors = "\n".join(e.message for e in schema.error_log)
+            return (mtype, itemN.get("id")), errors
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            results = executor.map(_check, list(self))
+        return dict(r for r in results if r is not None)
 
     def vocabularyReference(
         self, *, parent: ET, name: str, instanceName: str = None, ID: int = None
@@ -919,40 +1166,102 @@ class Module(Helper):
         Note: This is the first method with a positional argument that I write
         in a long time.
         """
-        return self.etree.xpath(path, namespaces=NSMAP)
+        return compiled(path)(self.etree)
 
     #
     # HELPER
     #
 
+    def _beforeWrite(self) -> None:
+        """
+        Write totalSize for the modules that changed since the last time, using
+        the counters in the index. Gets called before the document is written
+        or handed out (toFile, toString, toZip, toET) and by totalSize.
+        """
+        if not self._dirty:
+            return
+        counts = self._counts()
+        index = self._getIndex()
+        for mtype in self._dirty:
+            moduleN = index["modules"].get(mtype)
+            if moduleN is not None:
+                moduleN.attrib["totalSize"] = str(counts[mtype])
+        self._dirty = set()
+
+    def _counts(self) -> dict:
+        """
+        The item counters of the index, checked against the document: if
+        module elements were added or removed or their number of children
+        changed behind our back (e.g. with lxml or a Transform), the index
+        is rebuilt. That check is cheap, i.e. it doesn't visit the items.
+        """
+        index = self._getIndex()
+        modulesL = self.xpath("/m:application/m:modules/m:module")
+        current = len(modulesL) == len(index["modules"]) and all(
+            index["modules"].get(moduleN.get("name")) is moduleN
+            and len(moduleN) == index["counts"].get(moduleN.get("name"))
+            for moduleN in modulesL
+        )
+        if not current:
+            self._index = None
+            index = self._getIndex()
+        return index["counts"]
+
     def _compareItems(self, *, mtype: str, moduleN: ET):
-        # new doc's mtype exists already in old doc
-        # now compare each moduleItem in new doc
+        """
+        New doc's mtype exists already in old doc, so compare each moduleItem
+        of moduleN (from the new doc) with the old doc. Items that are new get
+        appended; items that exist in both docs get replaced if the new one is
+        newer (according to __lastModified).
+        """
+        d1moduleN = self._getIndex()["modules"][mtype]
+        index = self._getIndex()["items"]
         newItemsL: list[ET] = moduleN.xpath("./m:moduleItem", namespaces=NSMAP)
         for newItemN in newItemsL:
-            newID = int(newItemN.attrib["id"])
-            try:
-                # item with that ID exists already
-                oldItemN = self.xpath(
-                    f"/m:application/m:modules/m:module[@name = '{mtype}']/m:moduleItem[@id = '{newID}']"
-                )[
-                    0
-                ]  # IDs should be unique
-            except:
+            newID = newItemN.get("id")
+            hit = self._lookup(mtype=mtype, ID=newID)
+            if hit is None:
                 # itemN does not exist in old doc -> copy it over
-                d1moduleN = self.xpath(
-                    f"/m:application/m:modules/m:module[@name = '{mtype}']"
-                )[0]
                 d1moduleN.append(newItemN)
+                index[(mtype, newID)] = (newItemN, d1moduleN)
+                self._getIndex()["counts"][mtype] += 1
             else:
                 # itemN exists already, now take the newer one
+                oldItemN, oldModuleN = hit
                 oldItemLastModified = self._standardDT(inputN=oldItemN)
                 newItemLastModified = self._standardDT(inputN=newItemN)
 
                 if oldItemLastModified < newItemLastModified:
-                    # take newItem
-                    oldItemN = newItemN  # this will probably not work, but we can debug that later
-                    # else: keep oldItem = do nothing
+                    oldModuleN.replace(oldItemN, newItemN)
+                    index[(mtype, newID)] = (newItemN, oldModuleN)
+                # else: keep oldItem = do nothing
+
+    def _canonical(self, *, itemN: ET) -> ET:
+        """
+        Returns a copy of a moduleItem without the parts that digests
+        ignores (see digestRules) and without whitespace between elements.
+        """
+        copyN = deepcopy(itemN)
+        digestRules.apply(tree=copyN)
+        for elemN in copyN.iter(etree.Element):
+            if elemN.text is not None and not elemN.text.strip() and len(elemN):
+                elemN.text = None
+            if elemN.tail is not None and not elemN.tail.strip():
+                elemN.tail = None
+        return copyN
+
+    def _diffFields(self, itemN: ET, otherN: ET) -> set:
+        """
+        Returns the names of the top-level fields that differ between two
+        canonical moduleItems (as returned by _canonical).
+        """
+        mine = self._fields(itemN)
+        theirs = self._fields(otherN)
+        return {
+            name
+            for name in mine.keys() | theirs.keys()
+            if mine.get(name) != theirs.get(name)
+        }
 
     def _dropAttribs(self, *, attrib, xpath):
         elemL: list[ET] = self.etree.xpath(xpath, namespaces=NSMAP)
@@ -984,6 +1293,7 @@ class Module(Helper):
         elemL: list[ET] = parent.xpath(f"//m:{element}", namespaces=NSMAP)
         for elemN in elemL:
             elemN.getparent().remove(elemN)
+        self._index = None  # might have dropped modules or moduleItems
 
     def _dropFieldsByName(self, *, element: str, name: str) -> None:
         """
@@ -1003,6 +1313,134 @@ class Module(Helper):
         We want to eliminate identNr as part of sanitizing xml for upload form.
         """
 
+    def _fields(self, itemN: ET) -> dict:
+        """
+        {name: canonical xml} for the top-level fields of a moduleItem; for
+        elements without name we use the tag.
+        """
+        fields = {}
+        for fieldN in itemN.iterchildren(etree.Element):
+            name = fieldN.get("name", etree.QName(fieldN).localname)
+            fields[name] = fields.get(name, b"") + etree.tostring(
+                fieldN, method="c14n"
+            )
+        return fields
+
+    def _getIndex(self) -> dict:
+        """
+        Returns the internal index and builds it if necessary. The index has
+        three dictionaries:
+            index["items"][(mtype, ID)] = (moduleItemN, moduleN)
+            index["modules"][mtype] = moduleN
+            index["counts"][mtype] = number of moduleItems
+        IDs are stored as str, as they come from the xml.
+
+        The index is built lazily on first use and kept up to date by the
+        methods of this class that add or remove modules and moduleItems. It
+        gets rebuilt if self.etree is replaced. Hits and counters are checked
+        against the document (see _lookup and _counts), but if you add
+        moduleItems to self.etree directly using lxml, it's cheaper to reset
+        the index with self._index = None.
+        """
+        index = getattr(self, "_index", None)
+        if index is None or index["tree"] is not self.etree:
+            index = {"tree": self.etree, "items": {}, "modules": {}, "counts": {}}
+            self._index = index
+            for moduleN in self.xpath("/m:application/m:modules/m:module"):
+                self._indexModule(moduleN=moduleN)
+        return index
+
+    def _indexModule(self, *, moduleN: ET) -> None:
+        """Add a module element and all its moduleItems to the index."""
+        index = self._getIndex()
+        mtype = moduleN.get("name")
+        index["modules"][mtype] = moduleN
+        items = index["items"]
+        count = index["counts"].get(mtype, 0)
+        for itemN in moduleN.iterchildren(
+            "{http://www.zetcom.com/ria/ws/module}moduleItem"
+        ):
+            items[(mtype, itemN.get("id"))] = (itemN, moduleN)
+            count += 1
+        index["counts"][mtype] = count
+
+    def _isCurrent(self, *, hit: tuple, key: tuple) -> bool:
+        itemN, moduleN = hit
+        if itemN.getparent() is not moduleN or itemN.get("id") != key[1]:
+            return False
+        if moduleN.get("name") != key[0]:
+            return False
+        modulesN = moduleN.getparent()
+        if modulesN is None or modulesN.getparent() is None:
+            return False
+        return modulesN.getparent() is self._root()
+
+    @staticmethod
+    def _iterItems(*, source: Any, tag: str, mtype: Optional[str]) -> Iterator:
+        """
+        Does the work for iterFile; source is a path (as str) or a file-like
+        object.
+        """
+        for event, itemN in etree.iterparse(
+            source, events=("end",), tag=tag, remove_blank_text=True
+        ):
+            if mtype is None or itemN.getparent().get("name") == mtype:
+                yield itemN
+            Module._release(itemN=itemN)
+
+    def _definedType(self, *, parent: ET, name: str) -> Optional[str]:
+        """
+        dataType of a new dataField according to the module definition; None
+        if we have no definitions or they don't know the field.
+
+        For fields in repeatableGroups etc. the name in the definition is
+        dotted (e.g. ObjObjectNumberGrp.InventarNrSTxt).
+        """
+        if self.definitions is None:
+            return None
+        path = [name]
+        node = parent
+        while node is not None and etree.QName(node).localname != "moduleItem":
+            if node.get("name") is not None:
+                path.insert(0, node.get("name"))
+            node = node.getparent()
+        if node is None or node.getparent() is None:
+            return None
+        mtype = node.getparent().get("name")
+        field = self.definitions.field(mtype=mtype, name=".".join(path))
+        if field is None:
+            return None
+        return field.dataType
+
+    @staticmethod
+    def _release(*, itemN: ET) -> None:
+        """Free a streamed moduleItem and the items before it."""
+        itemN.clear()
+        while itemN.getprevious() is not None:
+            del itemN.getparent()[0]
+
+    def _lookup(self, *, mtype: str, ID: Union[int, str]) -> Optional[tuple]:
+        """
+        Returns (moduleItemN, moduleN) for the moduleItem with that mtype and
+        ID or None if there is no such item.
+
+        A hit is only trusted if the nodes still belong to our document and
+        still have that id and name; otherwise the index is rebuilt once.
+        """
+        key = (mtype, str(ID))
+        hit = self._getIndex()["items"].get(key)
+        if hit is not None and not self._isCurrent(hit=hit, key=key):
+            self._index = None
+            hit = self._getIndex()["items"].get(key)
+        return hit
+
+    def _root(self) -> ET:
+        """Returns the root element; self.etree can be element or tree."""
+        try:
+            return self.etree.getroot()
+        except AttributeError:
+            return self.etree
+
     def _standardDT(self, *, inputN) -> str:
         """
         For a given node containing a dateTime return the date in "standard form"
@@ -1011,8 +1449,7 @@ class Module(Helper):
         exist, so the resulting number has always the same length. The upshot is
         that the result can be compared in xpath v1 as a number.
         """
-        xp = "translate(m:systemField[@name ='__lastModified']/m:value,'-:.TZ ','')"
-        new = inputN.xpath(xp, namespaces=NSMAP)
+        new = xpaths["lastModified"](inputN)
         if len(str(new)) > 13:  # zero-based Python, so 13 is 14
             new = int(str(new)[:13])
         elif len(str(new)) < 13:
@@ -1024,10 +1461,4 @@ class Module(Helper):
 
     def _types(self) -> set:
         """Returns a set of module types that exist in the document."""
-        knownTypes = set()
-        moduleL = self.xpath(f"/m:application/m:modules/m:module")
-
-        for moduleN in moduleL:
-            moduleA = moduleN.attrib
-            knownTypes.add(moduleA["name"])
-        return knownTypes
+        return set(xpaths["mtypes"](self.etree))
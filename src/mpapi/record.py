@@ -32,6 +32,7 @@ import copy
 from datetime import datetime
 from lxml import etree
 from mpapi.module import Module
+from mpapi.xpaths import xpaths
 from pathlib import Path
 import pyexiv2
 
@@ -51,7 +52,7 @@ class Record:
         self.module = copy.deepcopy(dataM)  # so we dont change the original
 
     def _mtype(self) -> str:
-        return self.module.xpath("/m:application/m:modules/m:module/@name")[0]
+        return xpaths["mtypes"](self.module.etree)[0]
 
     def __str__(self) -> str:
         return self.module.toString()
@@ -64,13 +65,9 @@ class Record:
         self.raise_if_not_multimedia()
         # would this also work for object records?
 
-        refL = self.module.xpath(
-            "/m:application/m:modules/m:module/m:moduleItem/m:composite[@name='MulReferencesCre']"
-        )
+        refL = xpaths["compositeByName"](self.module.etree, name="MulReferencesCre")
         if len(refL) == 0:
-            lastN = self.module.xpath(
-                "/m:application/m:modules/m:module/m:moduleItem/m:*[last()]"
-            )[0]
+            lastN = xpaths["lastModuleElement"](self.module.etree)[0]
             refN = etree.Element("composite", name="MulReferencesCre")
             lastN.addnext(refN)
         else:
@@ -107,11 +104,8 @@ class Record:
         p = Path(path)
         filename = p.name
 
-        origFileL = self.module.xpath(
-            """
-            /m:application/m:modules/m:module/m:moduleItem/m:dataField
-                [@name = 'MulOriginalFileTxt']
-        """
+        origFileL = xpaths["dataFieldByName"](
+            self.module.etree, name="MulOriginalFileTxt"
         )
 
         # if it already exists delete it
@@ -119,9 +113,7 @@ class Record:
             origFileN = origFileL[0]
             origFileN.getparent().remove(origFileN)
             # print("removing original MulOriginalFileTxt")
-        parentN = self.module.xpath(
-            "/m:application/m:modules/m:module/m:moduleItem/*[last()]"
-        )[0]
+        parentN = xpaths["lastElement"](self.module.etree)[0]
         xml = f"""<dataField dataType="Varchar" name="MulOriginalFileTxt">
           <value>{filename}</value>
         </dataField>"""
@@ -155,21 +147,14 @@ class Record:
         # dateDT = datetime.utcfromtimestamp(mtime)
         utc = dateDT.strftime("%Y-%m-%dT%H:%M:%SZ")
         print(f"ddd-new date: {utc}")
-        dateExifL = self.module.xpath(
-            """
-            /m:application/m:modules/m:module/m:moduleItem/m:dataField
-                [@name = 'MulDateExifTst']
-        """
-        )
+        dateExifL = xpaths["dataFieldByName"](self.module.etree, name="MulDateExifTst")
         if len(dateExifL) > 0:
             dateExifN = dateExifL[0]
             dateExifN.getparent().remove(dateExifN)
             # print("removing original MulDateExifTst")
         # else:
         # print("no MulDateExifTst")
-        parentN = self.module.xpath(
-            "/m:application/m:modules/m:module/m:moduleItem/m:dataField[last()]"
-        )[0]
+        parentN = xpaths["lastDataField"](self.module.etree)[0]
         xml = f"""<dataField dataType="Timestamp" name="MulDateExifTst">
           <value>{utc}</value>
         </dataField>"""
@@ -193,21 +178,14 @@ class Record:
         size = p.stat().st_size
         # print(f"size {size}")
 
-        mulSizeL = self.module.xpath(
-            """
-            /m:application/m:modules/m:module/m:moduleItem/m:dataField
-                [@name = 'MulSizeTxt']
-        """
-        )
+        mulSizeL = xpaths["dataFieldByName"](self.module.etree, name="MulSizeTxt")
 
         if len(mulSizeL) > 0:
             mulSizeN = mulSizeL[0]
             mulSizeN.getparent().remove(mulSizeN)
             # print("removing original MulSizeTxt")
 
-        parentN = self.module.xpath(
-            "/m:application/m:modules/m:module/m:moduleItem/*[last()]"
-        )[0]
+        parentN = xpaths["lastElement"](self.module.etree)[0]
         xml = f"""<dataField dataType="Varchar" name="MulSizeTxt">
           <value>{size} KB</value>
         </dataField>"""
@@ -70,17 +70,20 @@ import os  # b/c Pathlib has troubles with Windows network paths
 from lxml import etree
 from mpapi.client import MpApi
 from mpapi.constants import NSMAP
+from mpapi.downloader import Downloader
 from mpapi.search import Search
 from mpapi.module import Module
+from mpapi.xpaths import xpaths
 from pathlib import Path
-from typing import Union
+from typing import Iterable, Union
 
 ETparser = etree.XMLParser(remove_blank_text=True)
 
 
 class Sar:
-    def __init__(self, *, baseURL: str, user: str, pw: str) -> None:
-        self.api = MpApi(baseURL=baseURL, user=user, pw=pw)
+    def __init__(self, *, baseURL: str, user: str, pw: str, **kwargs) -> None:
+        """Further keyword arguments (e.g. throttle) are passed on to MpApi."""
+        self.api = MpApi(baseURL=baseURL, user=user, pw=pw, **kwargs)
         self.user = user
 
     def _getBy(self, *, module: str, Id: int, field: str, since=None) -> Module:
@@ -156,20 +159,25 @@ class Sar:
 
         # 2600647 = SMB-Digital
         m = self.api.getItem2(mtype=mtype, ID=ID)
-        r = m.xpath(
-            f"""/m:application/m:modules/m:module[
-                @name = '{mtype}']/m:moduleItem[
-                @id = {ID}]/m:repeatableGroup[
-                @name = 'ObjPublicationGrp']/m:repeatableGroupItem[
-                    m:vocabularyReference[@name='PublicationVoc']/m:vocabularyReferenceItem[@name='Ja'] 
-                    and m:vocabularyReference[@name='TypeVoc']/m:vocabularyReferenceItem[@id = 2600647]
-                ]"""
-        )
+        r = xpaths["approvedObject"](m.etree, mtype=mtype, id=ID)
         if len(r) > 0:
             return True
         else:
             return False
 
+    def checkApprovals(self, *, IDs: Iterable[int], mtype: str = "Object") -> set:
+        """
+        Like checkApproval, but for many records at once; fetches the records
+        in a few batched searches (see MpApi.getItems).
+
+        Returns the set of approved IDs (as int).
+        """
+        if mtype != "Object":
+            raise ValueError("ERROR: checkApprovals currently only works for Object")
+        m = self.api.getItems(mtype=mtype, IDs=IDs, fields=["ObjPublicationGrp"])
+        # one pass over the document, not one per item
+        return {int(ID) for ID in xpaths["approvedObjectIDs"](m.etree, mtype=mtype)}
+
     def getByApprovalGrp(self, *, Id: int, module: str, since: str = None) -> Module:
         """
         ApprovalGrp is the term used in the multimedia module, it's a better label than
@@ -293,7 +301,15 @@ class Sar:
         }
         return self._getBy(module=module, Id=Id, field=fields[module], since=since)
 
-    def saveAttachments(self, *, data: Module, adir: Path, since=None) -> set[Path]:
+    def saveAttachments(
+        self,
+        *,
+        data: Module,
+        adir: Path,
+        since=None,
+        workers: int = 4,
+        skipExisting: bool = False,
+    ) -> set[Path]:
         """
         For a set of multimedia moduleItems (provided in xml), download their attachments.
         Attachments are saved to disk with the filename {mulId}.{ext}.
@@ -303,6 +319,9 @@ class Sar:
         * adir: directory to save the attachments to
         * since (optional): xs:date or xs:dateTime; if provided will only get attachments
           of media that are newer than this date
+        * workers (optional): number of parallel downloads
+        * skipExisting (optional): if True, existing files count as complete,
+          whether they are in the manifest or not
 
         Returns
         * a set with the paths of the identified attachments; can be counted
@@ -313,6 +332,8 @@ class Sar:
         * works only on multimedia items; other module types' items are ignored -> for now that is
           an acceptable limitation. Why would I need attachments from other mtypes atm.
         * uses streaming to save memory.
+        * files are only complete if they are in adir/manifest.json; files from
+          before the manifest are downloaded again once, unless skipExisting.
 
         New
         * downloads only attachments with approval (Typ = "SMB-Freigabe" and Freigabe =
@@ -320,19 +341,7 @@ class Sar:
         * xpath corrected 20211225
         * optional arg since 20211226
         """
-        if since is None:
-            xp = """
-                /m:application/m:modules/m:module[
-                    @name='Multimedia'
-                ]/m:moduleItem[
-                    @hasAttachments = 'true'
-                    and ./m:repeatableGroup[@name = 'MulApprovalGrp']/m:repeatableGroupItem[
-                        ./m:vocabularyReference[@name = 'TypeVoc']/m:vocabularyReferenceItem[@name = 'SMB-digital']
-                        and ./m:vocabularyReference[@name = 'ApprovalVoc']/m:vocabularyReferenceItem[@name = 'Ja']
-                    ]
-                ]            
-            """
-        else:
+        if since is not None:
             print(f" filtering multimedia records that have changed since {since}")
             """
             dateTime comparison might not work as expected if number of digits is not equal, e.g. when user
@@ -348,37 +357,38 @@ class Sar:
             where should this rewriting of the since argument took place? Not here.
             """
 
-            xp = f"""
-                /m:application/m:modules/m:module[
-                    @name='Multimedia'
-                ]/m:moduleItem[
-                    @hasAttachments = 'true'
-                    and ./m:repeatableGroup[@name = 'MulApprovalGrp']/m:repeatableGroupItem[
-                        ./m:vocabularyReference[@name = 'TypeVoc']/m:vocabularyReferenceItem[@name = 'SMB-digital']
-                        and ./m:vocabularyReference[@name = 'ApprovalVoc']/m:vocabularyReferenceItem[@name = 'Ja']
-                    ]
-                    and ./m:systemField[
-                        @name = '__lastModified'
-                        and substring(translate(m:value,'-:.TZ ',''),0, 14) > 
-                        substring(translate('{since}','-:.TZ ',''), 0, 14)
-                    ]
-                ]
-            """
-        # print(xp)
-        itemsL = data.xpath(xp)
+        # see approvedAttachments in xpaths.py; empty since means no filter
+        itemsL = xpaths["approvedAttachments"](
+            data.etree, since="" if since is None else str(since)
+        )
         print(
             f" xml has {len(itemsL)} records with attachment=True and Freigabe[@typ='SMB-Digital'] = Ja"
         )
-        return self._saveAttachments(moduleItemL=itemsL, adir=adir, since=since)
+        return self._saveAttachments(
+            moduleItemL=itemsL,
+            adir=adir,
+            since=since,
+            workers=workers,
+            skipExisting=skipExisting,
+        )
 
     def _saveAttachments(
-        self, *, moduleItemL: list, adir: Path, since=None
+        self,
+        *,
+        moduleItemL: list,
+        adir: Path,
+        since=None,
+        workers: int = 4,
+        skipExisting: bool = False,
     ) -> set[Path]:
         """
         the L in moduleItemL stands for nodeList. So it expects a list of nodes instead of
 
         a whole document.
 
+        Downloads run in parallel (see Downloader); complete downloads are
+        recorded in {adir}/manifest.json.
+
         Apparently, what I want is to split up one long xpath expression into multiple
 
         nodeList = document.xpath(A)
@@ -388,24 +398,22 @@ class Sar:
         # Why do i get suffix from old filename? Is that really the best source?
         # Seems that it is. I see no other field in RIA
         positives = set()
-        for itemN in moduleItemL:
-            # itemA = itemN.attrib
-            # mmId = itemA["id"]
-            mmId = itemN.attrib["id"]
-            fn_old = itemN.xpath(
-                "m:dataField[@name = 'MulOriginalFileTxt']/m:value/text()",
-                namespaces=NSMAP,
-            )[
-                0
-            ]  # assuming that there can be only one
-            fn = mmId + Path(fn_old).suffix
-            mm_fn = Path(adir).joinpath(fn)
-            positives.add(mm_fn)
-            if not mm_fn.exists():  # only d/l if doesn't exist yet
-                print(f" getting {mm_fn}")
-                self.api.saveAttachment(module="Multimedia", id=mmId, path=mm_fn)
-            else:
-                print(f" {mm_fn} exists already")
+        manifest = Path(adir).joinpath("manifest.json")
+        with Downloader(
+            api=self.api, workers=workers, manifest=manifest, skipExisting=skipExisting
+        ) as dl:
+            for itemN in moduleItemL:
+                # itemA = itemN.attrib
+                # mmId = itemA["id"]
+                mmId = itemN.attrib["id"]
+                # assuming that there can be only one
+                fn_old = xpaths["originalFile"](itemN)[0]
+                fn = mmId + Path(fn_old).suffix
+                mm_fn = Path(adir).joinpath(fn)
+                positives.add(mm_fn)
+                # only d/l if not complete yet
+                if not dl.add(mtype="Multimedia", ID=mmId, path=mm_fn):
+                    print(f" {mm_fn} exists already")
         return positives
 
     def search(self, *, query: Search) -> Module:
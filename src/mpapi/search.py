@@ -29,6 +29,10 @@ USAGE
     #if you only want certain fields back, list them
     q.addField(field="__id")
 
+    # check field paths offline against the module definitions
+    Search.definitions = Definitions(path="definitions.db")  # for all
+    q.definitions = Definitions(path="definitions.db")       # for this one
+
 #helpers
     q.print()  # print to STDOUT
     q.toFile(path="out.xml")
@@ -95,6 +99,9 @@ allowedOperators = {
 
 
 class Search(Helper):
+    # Definitions object to check field paths with; see definitions.py
+    definitions = None
+
     def __init__(
         self, *, module=None, limit=-1, offset=0, fromFile=None, fromString=None
     ):
@@ -137,6 +144,7 @@ class Search(Helper):
     def addCriterion(self, *, operator, field, value=None):
         if operator not in allowedOperators:
             raise ValueError(f"Unknown operator: '{operator}'")
+        self._checkField(field=field)
 
         if value is None:
             etree.SubElement(
@@ -159,6 +167,7 @@ class Search(Helper):
         I just noticed that there are situations where this method doesn't work, e.g.
         when trying to run a saved query which has no element below search.
         """
+        self._checkField(field=field)
 
         try:
             selectN = self.etree.xpath(
@@ -227,6 +236,18 @@ class Search(Helper):
             self.lastN, "{http://www.zetcom.com/ria/ws/module/search}" + Type
         )
 
+    def _checkField(self, *, field: str) -> None:
+        """
+        If we have definitions, raise ValueError for field paths that don't
+        exist in the searched module.
+        """
+        if self.definitions is None:
+            return
+        mtype = self.etree.xpath(
+            "/s:application/s:modules/s:module/@name", namespaces=NSMAP
+        )[0]
+        self.definitions.validate(mtype=mtype, path=field)
+
     def _attribute(self, *, value, key) -> int:
         searchN = self.etree.xpath(
             "/s:application/s:modules/s:module/s:search", namespaces=NSMAP
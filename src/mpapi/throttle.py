@@ -0,0 +1,140 @@
+"""
+Throttle - adaptive concurrency and rate limits for requests to RIA
+
+RIA instances are shared by a whole museum, so bulk jobs shouldn't hammer
+them. A Throttle sits under MpApi's requests and decides how many may be in
+flight at the same time; it can also cap requests and bytes per second.
+Share one Throttle between all MpApi objects of a job to limit the job as a
+whole.
+
+USAGE
+    from mpapi.throttle import Throttle
+    throttle = Throttle(maxInFlight=8, targetLatency=5, rps=20, bps=10 * 2**20)
+    api = MpApi(baseURL=baseURL, user=user, pw=pw, throttle=throttle)
+    sar = Sar(baseURL=baseURL, user=user, pw=pw, throttle=throttle)
+    print(throttle.stats())
+
+DESIGN
+* AIMD (additive increase, multiplicative decrease) like TCP's congestion
+  control: the limit of requests in flight starts low and grows by about 1
+  per round of successful requests. On a 429 or 5xx response, a connection
+  error or a response slower than targetLatency, the limit is cut by
+  decreaseFactor, at most once per round trip so that a burst of errors
+  doesn't collapse it at once. The limit stays between minInFlight and
+  maxInFlight.
+* rps and bps are enforced with token buckets that allow bursts of up to
+  one second. Bytes are counted after the fact (see consume); a big
+  response makes the following requests wait.
+"""
+
+import threading
+import time
+from typing import Optional
+
+
+class Throttle:
+    def __init__(
+        self,
+        *,
+        maxInFlight: int = 8,
+        minInFlight: int = 1,
+        start: Optional[int] = None,
+        targetLatency: Optional[float] = None,
+        decreaseFactor: float = 0.5,
+        rps: Optional[float] = None,
+        bps: Optional[float] = None,
+    ) -> None:
+        """
+        EXPECTS
+        * maxInFlight, minInFlight: bounds of the concurrency limit
+        * start (optional): initial limit; default is minInFlight
+        * targetLatency (optional): seconds; slower responses count as
+          overload
+        * decreaseFactor: limit is multiplied by it on overload
+        * rps (optional): max. requests per second
+        * bps (optional): max. bytes (sent and received) per second
+        """
+        if minInFlight < 1 or maxInFlight < minInFlight:
+            raise ValueError("Need 1 <= minInFlight <= maxInFlight")
+        self.maxInFlight = maxInFlight
+        self.minInFlight = minInFlight
+        self.limit = float(minInFlight if start is None else start)
+        self.targetLatency = targetLatency
+        self.decreaseFactor = decreaseFactor
+        self.inFlight = 0
+        self.requests = 0
+        self.decreases = 0
+        self._lastDecrease = 0.0
+        self._cond = threading.Condition()
+        self._rps = None if rps is None else _Bucket(rate=rps)
+        self._bps = None if bps is None else _Bucket(rate=bps)
+
+    def acquire(self) -> None:
+        """Wait until another request may start."""
+        with self._cond:
+            while self.inFlight >= int(self.limit):
+                self._cond.wait()
+            self.inFlight += 1
+            self.requests += 1
+        if self._rps is not None:
+            self._rps.take(1)
+
+    def consume(self, n: int) -> None:
+        """Count n bytes; waits if we're above the bytes per second limit."""
+        if self._bps is not None and n > 0:
+            self._bps.take(n)
+
+    def release(self, *, latency: float, status: Optional[int] = None) -> None:
+        """
+        A request has finished after latency seconds; status is the http
+        status or None if there was no response (connection error, timeout).
+        """
+        overload = (
+            status is None
+            or status == 429
+            or status >= 500
+            or (self.targetLatency is not None and latency > self.targetLatency)
+        )
+        with self._cond:
+            self.inFlight -= 1
+            now = time.monotonic()
+            if overload:
+                if now - self._lastDecrease > latency:
+                    self.limit = max(
+                        float(self.minInFlight), self.limit * self.decreaseFactor
+                    )
+                    self._lastDecrease = now
+                    self.decreases += 1
+            else:
+                self.limit = min(float(self.maxInFlight), self.limit + 1 / self.limit)
+            self._cond.notify_all()
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "limit": int(self.limit),
+                "inFlight": self.inFlight,
+                "requests": self.requests,
+                "decreases": self.decreases,
+            }
+
+
+class _Bucket:
+    """Token bucket; take reserves tokens and sleeps until they're there."""
+
+    def __init__(self, *, rate: float) -> None:
+        self.rate = rate
+        self.burst = max(1.0, rate)
+        self.tokens = self.burst
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
+
+    def take(self, n: float) -> None:
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+            self.last = now
+            self.tokens -= n
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0
+        if wait:
+            time.sleep(wait)
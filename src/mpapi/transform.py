@@ -0,0 +1,148 @@
+"""
+Rewrite zml documents in a single pass
+
+Methods like Module's uploadForm used to run one xpath per change, so every
+dropped field or attribute meant another traversal of the whole document.
+Here we describe the changes as rules, compile them once and apply all of
+them in one walk through the tree.
+
+USAGE
+    from mpapi.transform import Transform
+    t = Transform(
+        dropElements={"virtualField": None, "systemField": {"__id", "__uuid"}},
+        keepElements={"systemField": {"__orgUnit"}},
+        dropAttribs={"moduleItem": {"hasAttachments"}, "*": {"uuid"}},
+    )
+    t.apply(tree=m.etree)  # rewrites the document in place
+    t3 = t1 + t2           # a Transform with the rules of both
+
+RULES
+* dropElements: element name -> set of @name values or None; if None, all
+  elements of that kind are dropped, otherwise only those with a listed name
+* keepElements: element name -> set of @name values that are never dropped,
+  even if a rule in dropElements matches
+* dropAttribs: element name -> set of attribute names; use "*" for any
+  element
+
+Element names are local names in Zetcom's module namespace.
+
+DESIGN
+* We work in place, i.e. the document is changed and nodes that are not
+  dropped remain the same objects.
+* Dropped elements are collected during the walk and removed afterwards,
+  since lxml doesn't like it if we change the tree while iterating over it.
+"""
+
+from lxml import etree  # type: ignore
+from mpapi.constants import NSMAP
+from typing import Any, Optional
+
+ET = Any
+
+
+class Transform:
+    def __init__(
+        self,
+        *,
+        dropElements: Optional[dict] = None,
+        keepElements: Optional[dict] = None,
+        dropAttribs: Optional[dict] = None,
+    ) -> None:
+        self.dropElements = self._copyRules(dropElements)
+        self.keepElements = self._copyRules(keepElements)
+        self.dropAttribs = self._copyRules(dropAttribs)
+        self._compile()
+
+    def __add__(self, t2):
+        """
+        Returns a new Transform with the rules of both:
+            t3 = t1 + t2
+        If one of them drops all elements of a kind, so does t3.
+        """
+        dropElements = self._copyRules(self.dropElements)
+        for element, names in t2.dropElements.items():
+            if element in dropElements and dropElements[element] is None:
+                continue
+            if names is None or element not in dropElements:
+                dropElements[element] = None if names is None else set(names)
+            else:
+                dropElements[element] |= names
+        return Transform(
+            dropElements=dropElements,
+            keepElements=self._mergeRules(self.keepElements, t2.keepElements),
+            dropAttribs=self._mergeRules(self.dropAttribs, t2.dropAttribs),
+        )
+
+    def apply(self, *, tree: ET) -> None:
+        """
+        Apply all rules to tree (lxml document or element) in a single walk;
+        changes tree as a side-effect.
+        """
+        try:
+            root = tree.getroot()
+        except AttributeError:
+            root = tree
+
+        drop = self._drop
+        keep = self._keep
+        attribsFor = self._attribsFor
+        starAttribs = self._starAttribs
+        dropL = []
+        for elemN in root.iter(etree.Element):
+            tag = elemN.tag
+            try:
+                attribs = attribsFor[tag]
+            except KeyError:
+                attribs = starAttribs
+            if attribs:
+                elemA = elemN.attrib
+                for attrib in attribs:
+                    elemA.pop(attrib, None)
+            if tag in drop:
+                names = drop[tag]
+                name = elemN.get("name")
+                if (names is None or name in names) and name not in keep.get(tag, ()):
+                    dropL.append(elemN)
+
+        for elemN in dropL:
+            parentN = elemN.getparent()
+            if parentN is not None:
+                parentN.remove(elemN)
+
+    #
+    # private helpers
+    #
+
+    def _compile(self) -> None:
+        """
+        Translate rules to dictionaries keyed by the element's tag (in Clark
+        notation), so that each element can be dealt with by a lookup.
+        """
+        self._drop = {
+            self._tag(element): None if names is None else frozenset(names)
+            for element, names in self.dropElements.items()
+        }
+        self._keep = {
+            self._tag(element): frozenset(names)
+            for element, names in self.keepElements.items()
+        }
+        self._starAttribs = tuple(self.dropAttribs.get("*", ()))
+        self._attribsFor = {
+            self._tag(element): tuple(set(attribs) | set(self._starAttribs))
+            for element, attribs in self.dropAttribs.items()
+            if element != "*"
+        }
+
+    def _copyRules(self, rules: Optional[dict]) -> dict:
+        if rules is None:
+            return {}
+        return {k: None if v is None else set(v) for k, v in rules.items()}
+
+    def _mergeRules(self, rules1: dict, rules2: dict) -> dict:
+        merged = self._copyRules(rules1)
+        for k, v in rules2.items():
+            merged.setdefault(k, set()).update(v)
+        return merged
+
+    def _tag(self, element: str) -> str:
+        return f"{{{NSMAP['m']}}}{element}"
@@ -0,0 +1,218 @@
+"""
+Uploader - streaming, parallel uploads of attachments
+
+Attachments can be several GB big, so we don't want to read them into
+memory before we send them. UploadBody is a request body that is read in
+chunks while it is sent; Uploader pushes many files with a few threads.
+
+USAGE
+    from mpapi.uploader import Uploader, UploadBody
+
+    # single file, streamed (updateAttachment does this for you)
+    api.updateAttachment(module="Multimedia", id=123, path="big.tif")
+    api.updateAttachment(module="Multimedia", id=123, data=f)  # file handle
+    api.updateAttachment(                                      # generator
+        module="Multimedia", id=123, data=chunks(), size=size, name="big.tif"
+    )
+
+    # many files
+    def progress(mtype, ID, path, sent, total):
+        print(f"{path}: {sent}/{total}")
+
+    with Uploader(api=api, workers=4, progress=progress) as up:
+        for ID, path in todo:
+            up.add(mtype="Multimedia", ID=ID, path=path)
+    # leaving the with block waits for all uploads
+
+DESIGN
+* UploadBody has a length, so the request has a Content-Length header and
+  is not sent chunked. Every time the body is iterated it starts again from
+  the beginning (of the file or where the file handle was), so MpApi can
+  retry a failed upload. A generator can be sent only once, so uploads from
+  generators are not retried.
+* Like Downloader, Uploader feeds a pool of worker threads from a bounded
+  queue. Failed uploads are retried by MpApi (connection errors, timeouts,
+  502, 503 and 504, see its retries and retryBudget); Uploader doesn't try
+  again on top of that, so the attempts don't multiply. Other errors, e.g.
+  4xx for a wrong id, fail right away.
+"""
+
+import os
+from pathlib import Path
+import queue
+import requests
+import threading
+from typing import Any, Callable, Iterable, Iterator, Optional, Union
+
+PathX = Union[Path, str]
+
+
+class UploadBody:
+    def __init__(
+        self,
+        *,
+        source: Union[PathX, Any, Iterable[bytes]],
+        size: Optional[int] = None,
+        chunkSize: int = 1024 * 1024,
+        progress: Optional[Callable] = None,
+    ) -> None:
+        """
+        EXPECTS
+        * source: path, file handle opened in binary mode or an iterable
+          (e.g. generator) of bytes
+        * size: number of bytes; required for iterables, otherwise the
+          size of the file (from the current position of a file handle)
+        * chunkSize: bytes read and sent at a time
+        * progress (optional): called with (sent, size) after every chunk
+        """
+        self.source = source
+        self.chunkSize = chunkSize
+        self.progress = progress
+        self.path: Optional[Path] = None
+        if isinstance(source, (str, Path)):
+            self.path = Path(source)
+            self.size = self.path.stat().st_size if size is None else size
+            self.repeatable = True
+        elif hasattr(source, "read"):
+            self._start = source.tell()
+            if size is None:
+                size = os.fstat(source.fileno()).st_size - self._start
+            self.size = size
+            self.repeatable = source.seekable()
+        else:
+            if size is None:
+                raise ValueError("Need size to upload from an iterable")
+            self.size = size
+            self.repeatable = False
+            self._used = False
+
+    def __iter__(self) -> Iterator[bytes]:
+        sent = 0
+        for chunk in self._chunks():
+            sent += len(chunk)
+            if sent > self.size:
+                raise ValueError(f"Upload bigger than its size {self.size}")
+            if self.progress is not None:
+                self.progress(sent, self.size)
+            yield chunk
+        if sent != self.size:
+            raise ValueError(f"Upload has {sent} bytes, but size is {self.size}")
+
+    def __len__(self) -> int:
+        return self.size
+
+    def _chunks(self) -> Iterator[bytes]:
+        if self.path is not None:
+            with open(self.path, "rb") as f:
+                yield from iter(lambda: f.read(self.chunkSize), b"")
+        elif hasattr(self.source, "read"):
+            if self.repeatable:
+                self.source.seek(self._start)
+            yield from iter(lambda: self.source.read(self.chunkSize), b"")
+        else:
+            if self._used:
+                raise ValueError("Can't send an iterable twice")
+            self._used = True
+            yield from self.source
+
+
+class Uploader:
+    def __init__(
+        self,
+        *,
+        api: Any,
+        workers: int = 4,
+        queueSize: Optional[int] = None,
+        chunkSize: int = 1024 * 1024,
+        progress: Optional[Callable] = None,
+    ) -> None:
+        """
+        EXPECTS
+        * api: MpApi object used for the requests
+        * workers: number of concurrent uploads
+        * queueSize: max. number of waiting jobs; default is 2 * workers
+        * chunkSize: bytes read and sent at a time
+        * progress (optional): called with (mtype, ID, path, sent, total)
+          while a file is sent; from the worker threads
+        """
+        if workers < 1:
+            raise ValueError("workers needs to be at least 1")
+        self.api = api
+        self.workers = workers
+        self.chunkSize = chunkSize
+        self.progress = progress
+        self.errors: dict = {}  # (mtype, ID) -> exception
+        self.uploaded = 0
+        self._queue: queue.Queue = queue.Queue(
+            maxsize=2 * workers if queueSize is None else queueSize
+        )
+        self._threads: list = []
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def add(self, *, mtype: str = "Multimedia", ID: int, path: PathX) -> None:
+        """Queue path for upload as attachment of mtype/ID; blocks if full."""
+        if not self._threads:
+            self._start()
+        self._queue.put((mtype, ID, Path(path)))
+
+    def close(self) -> None:
+        """
+        Wait for all queued uploads. Re-raises the first error after all jobs
+        are done; see self.errors for all of them.
+        """
+        for _ in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+        if self.errors:
+            print(f"WARN: {len(self.errors)} uploads failed")
+            raise next(iter(self.errors.values()))
+
+    def upload(
+        self, *, mtype: str = "Multimedia", ID: int, path: PathX
+    ) -> requests.Response:
+        """Upload a single file in the current thread."""
+        path = Path(path)
+        progress = None
+        if self.progress is not None:
+
+            def progress(sent: int, total: int) -> None:
+                self.progress(mtype, ID, path, sent, total)
+
+        body = UploadBody(source=path, chunkSize=self.chunkSize, progress=progress)
+        return self.api.updateAttachment(module=mtype, id=ID, data=body, name=path.name)
+
+    #
+    # private helpers
+    #
+
+    def _start(self) -> None:
+        for no in range(self.workers):
+            thread = threading.Thread(
+                target=self._work, name=f"Uploader-{no}", daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+
+    def _work(self) -> None:
+        while True:
+            job = self._queue.get()
+            if job is None:
+                return
+            mtype, ID, path = job
+            try:
+                print(f" uploading {path}")
+                self.upload(mtype=mtype, ID=ID, path=path)
+                with self._lock:
+                    self.uploaded += 1
+            except Exception as e:
+                print(f"WARN: upload of {mtype} {ID} failed: {e}")
+                with self._lock:
+                    self.errors[(mtype, ID)] = e
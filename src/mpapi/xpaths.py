@@ -0,0 +1,99 @@
+"""
+Compiled xpath expressions
+
+Every call of lxml's xpath(path) parses and compiles the expression again.
+For the expressions we use over and over, we compile them once per process
+here. Values that change between calls are passed as xpath variables (e.g.
+$mtype, $id) instead of being formatted into the expression, so one
+compiled expression serves all calls.
+
+USAGE
+    from mpapi.xpaths import compiled, xpaths
+    modulesL = xpaths["modules"](m.etree)
+    idsL = xpaths["relatedIDs"](m.etree, target="Person")
+
+    # expressions that are not in the registry get compiled once and cached
+    nodesL = compiled("//m:dataField")(m.etree)
+
+Compiled expressions can be evaluated on documents and elements; absolute
+paths always start at the element's document root.
+"""
+
+from functools import lru_cache
+from lxml import etree  # type: ignore
+from mpapi.constants import NSMAP
+
+_expressions = {
+    # Module
+    "countChildItems": "count(m:moduleItem)",
+    "items": "/m:application/m:modules/m:module/m:moduleItem",
+    "lastModified": """
+        translate(m:systemField[@name ='__lastModified']/m:value,'-:.TZ ','')""",
+    "modules": "/m:application/m:modules/m:module",
+    "mtypes": "/m:application/m:modules/m:module/@name",
+    "totalSizes": "/m:application/m:modules/m:module/@totalSize",
+    # MpApi's cache
+    "lastModifiedValues": "//m:systemField[@name = '__lastModified']/m:value/text()",
+    # Sar
+    # for a Multimedia item: attachment and SMB-digital approval; if $since is
+    # not empty, only items that changed after that date
+    "approvedAttachments": """
+        /m:application/m:modules/m:module[
+            @name='Multimedia'
+        ]/m:moduleItem[
+            @hasAttachments = 'true'
+            and ./m:repeatableGroup[@name = 'MulApprovalGrp']/m:repeatableGroupItem[
+                ./m:vocabularyReference[@name = 'TypeVoc']/m:vocabularyReferenceItem[@name = 'SMB-digital']
+                and ./m:vocabularyReference[@name = 'ApprovalVoc']/m:vocabularyReferenceItem[@name = 'Ja']
+            ]
+            and ($since = '' or ./m:systemField[
+                @name = '__lastModified'
+                and substring(translate(m:value,'-:.TZ ',''),0, 14) >
+                substring(translate($since,'-:.TZ ',''), 0, 14)
+            ])
+        ]""",
+    # 2600647 = SMB-Digital
+    "approvedObject": """
+        /m:application/m:modules/m:module[
+            @name = $mtype]/m:moduleItem[
+            @id = $id]/m:repeatableGroup[
+            @name = 'ObjPublicationGrp']/m:repeatableGroupItem[
+                m:vocabularyReference[@name='PublicationVoc']/m:vocabularyReferenceItem[@name='Ja']
+                and m:vocabularyReference[@name='TypeVoc']/m:vocabularyReferenceItem[@id = 2600647]
+            ]""",
+    # ids of all approved items, same condition as approvedObject
+    "approvedObjectIDs": """
+        /m:application/m:modules/m:module[
+            @name = $mtype]/m:moduleItem[
+            m:repeatableGroup[@name = 'ObjPublicationGrp']/m:repeatableGroupItem[
+                m:vocabularyReference[@name='PublicationVoc']/m:vocabularyReferenceItem[@name='Ja']
+                and m:vocabularyReference[@name='TypeVoc']/m:vocabularyReferenceItem[@id = 2600647]
+            ]]/@id""",
+    "originalFile": "m:dataField[@name = 'MulOriginalFileTxt']/m:value/text()",
+    # Chunky
+    "relatedIDs": """
+        //m:moduleReference[@targetModule = $target]/m:moduleReferenceItem/@moduleItemId""",
+    # Record
+    "compositeByName": """
+        /m:application/m:modules/m:module/m:moduleItem/m:composite[@name = $name]""",
+    "dataFieldByName": """
+        /m:application/m:modules/m:module/m:moduleItem/m:dataField[@name = $name]""",
+    "lastDataField": "/m:application/m:modules/m:module/m:moduleItem/m:dataField[last()]",
+    # any element, including those without namespace
+    "lastElement": "/m:application/m:modules/m:module/m:moduleItem/*[last()]",
+    "lastModuleElement": "/m:application/m:modules/m:module/m:moduleItem/m:*[last()]",
+}
+
+xpaths = {
+    name: etree.XPath(expr.strip(), namespaces=NSMAP)
+    for name, expr in _expressions.items()
+}
+
+
+@lru_cache(maxsize=512)
+def compiled(path: str) -> etree.XPath:
+    """
+    Returns a compiled version of an arbitrary xpath expression (using our
+    namespace prefixes); expressions are compiled only once.
+    """
+    return etree.XPath(path, namespaces=NSMAP)
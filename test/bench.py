@@ -0,0 +1,263 @@
+"""
+Benchmarks on synthetic zml documents; not part of the test suite.
+
+USAGE
+    cd test
+    python bench.py -b transform -n 50000
+    python bench.py -b xpath -n 10000
+    python bench.py -b addItem -n 5000
+    python bench.py -b diff -n 100000
+"""
+
+import argparse
+from lxml import etree  # type: ignore
+from mpapi.constants import NSMAP
+from mpapi.module import Module
+from mpapi.xpaths import xpaths
+import time
+
+
+def synthetic(n: int, *, mtype: str = "Object", start: int = 0) -> Module:
+    """
+    Returns a Module with n moduleItems that look roughly like RIA's download
+    form, including the fields that clean and uploadForm drop.
+    """
+    itemsL = []
+    for ID in range(start, start + n):
+        itemsL.append(f"""<moduleItem hasAttachments="false" id="{ID}" uuid="{ID}">
+            <systemField dataType="Long" name="__id"><value>{ID}</value></systemField>
+            <systemField dataType="Timestamp" name="__lastModified">
+                <value>2022-01-01 12:00:00.0</value>
+                <formattedValue language="de">01.01.2022 12:00</formattedValue>
+            </systemField>
+            <systemField dataType="Varchar" name="__orgUnit"><value>EMMusikethnologie</value></systemField>
+            <dataField dataType="Varchar" name="ModifiedByTxt"><value>EM_EM</value></dataField>
+            <dataField dataType="Clob" name="ObjTechnicalTermClb" uuid="{ID}"><value>Zupftrommel</value></dataField>
+            <vocabularyReference name="ObjCategoryVoc" id="30349" instanceName="ObjCategoryVgr">
+                <vocabularyReferenceItem id="3206642" name="Musikinstrument">
+                    <formattedValue language="en">Musikinstrument</formattedValue>
+                </vocabularyReferenceItem>
+            </vocabularyReference>
+            <virtualField name="ObjObjectVrt"><value>I C {ID}</value></virtualField>
+            <repeatableGroup name="ObjValuationGrp" size="1">
+                <repeatableGroupItem id="{ID}"><dataField dataType="Long" name="ValueLnu"><value>1</value></dataField></repeatableGroupItem>
+            </repeatableGroup>
+            <repeatableGroup name="ObjObjectNumberGrp" size="1">
+                <repeatableGroupItem id="{ID}" uuid="{ID}"><dataField dataType="Varchar" name="InventarNrSTxt"><value>I C {ID}</value></dataField></repeatableGroupItem>
+            </repeatableGroup>
+            <moduleReference name="ObjMultimediaRef" targetModule="Multimedia" multiplicity="M:N" size="1">
+                <moduleReferenceItem moduleItemId="{ID}" uuid="{ID}"><formattedValue language="en">{ID}</formattedValue></moduleReferenceItem>
+            </moduleReference>
+        </moduleItem>""")
+    xml = f"""<application xmlns="http://www.zetcom.com/ria/ws/module">
+        <modules>
+            <module name="{mtype}" totalSize="{n}">{"".join(itemsL)}</module>
+        </modules>
+    </application>"""
+    return Module(xml=xml)
+
+
+#
+# transform
+#
+
+
+def legacyClean(m: Module) -> None:
+    """clean as it was before transform.py"""
+    m.dropUUID()
+    m.dropRepeatableGroup(name="ObjValuationGrp")
+
+
+def legacyUploadForm(m: Module) -> None:
+    """uploadForm as it was before transform.py"""
+    for name in [
+        "__id",
+        "__lastModified",
+        "__lastModifiedUser",
+        "__createdUser",
+        "__created",
+        "__uuid",
+    ]:
+        m._dropFieldsByName(element="systemField", name=name)
+    m._dropFields(element="virtualField")
+    m._dropFields(element="formattedValue")
+    m._dropAttribs(xpath="//m:repeatableGroup", attrib="size")
+    m._dropAttribs(xpath="//m:moduleItem", attrib="uuid")
+    m._dropAttribs(xpath="//m:vocabularyReference", attrib="id")
+    m._dropAttribs(xpath="//m:vocabularyReference", attrib="instanceName")
+    m._dropAttribs(xpath="//m:vocabularyReferenceItem", attrib="name")
+    m._dropAttribs(xpath="//m:module", attrib="totalSize")
+    m._dropAttribs(xpath="//m:moduleItem", attrib="hasAttachments")
+    m._dropAttribs(xpath="//m:dataField", attrib="dataType")
+    for name in [
+        "ModifiedByTxt",
+        "ModifiedDateDat",
+        "ObjRecordCreatedByTxt",
+        "ObjInventoryDateDat",
+        "DatestampFromFuzzySearchLnu",
+        "DatestampToFuzzySearchLnu",
+    ]:
+        m._dropFieldsByName(element="dataField", name=name)
+    m._dropFieldsByName(element="moduleReference", name="ObjMultimediaRef")
+
+
+def bench_transform(n: int) -> None:
+    m1 = synthetic(n)
+    m2 = synthetic(n)
+    print(f"clean + uploadForm on {n} moduleItems")
+
+    start = time.perf_counter()
+    legacyClean(m1)
+    legacyUploadForm(m1)
+    legacy = time.perf_counter() - start
+    print(f"  legacy (one xpath per rule): {legacy:.2f}s")
+
+    start = time.perf_counter()
+    m2.clean()
+    m2.uploadForm()
+    single = time.perf_counter() - start
+    print(f"  transform (single pass)    : {single:.2f}s ({legacy / single:.1f}x)")
+
+    if etree.tostring(m1.etree) != etree.tostring(m2.etree):
+        raise ValueError("Results differ!")
+    print("  results are identical")
+
+
+#
+# xpath
+#
+
+
+def bench_xpath(n: int, *, calls: int = 200) -> None:
+    """
+    Per-call cost of xpath expressions we use all the time: compiled once with
+    variables (xpaths.py) vs. formatted and compiled on every call.
+    """
+    m = synthetic(n)
+    m.module(name="Person")
+    print(f"per-call cost on {n} moduleItems ({calls} calls each)")
+    cases = {
+        "__len__": (
+            lambda: m.etree.xpath(
+                "count(/m:application/m:modules/m:module/m:moduleItem)",
+                namespaces=NSMAP,
+            ),
+            lambda: len(m),
+        ),
+        "actualSize": (
+            lambda: m.etree.xpath(
+                "count(/m:application/m:modules/m:module[@name ='Object']/m:moduleItem)",
+                namespaces=NSMAP,
+            ),
+            lambda: m.actualSize(module="Object"),
+        ),
+        "_types": (
+            lambda: set(
+                m.etree.xpath(
+                    "/m:application/m:modules/m:module/@name", namespaces=NSMAP
+                )
+            ),
+            lambda: m._types(),
+        ),
+        "relatedIDs": (
+            lambda: m.etree.xpath(
+                "//m:moduleReference[@targetModule = 'Multimedia']"
+                + "/m:moduleReferenceItem/@moduleItemId",
+                namespaces=NSMAP,
+            ),
+            lambda: xpaths["relatedIDs"](m.etree, target="Multimedia"),
+        ),
+    }
+    # expressions evaluated on single items, e.g. while merging documents,
+    # are where compiling costs most compared to evaluating
+    itemsL = list(m)[:calls]
+    lastModified = (
+        "translate(m:systemField[@name ='__lastModified']/m:value,'-:.TZ ','')"
+    )
+    cases["lastModified"] = (
+        lambda: [i.xpath(lastModified, namespaces=NSMAP) for i in itemsL],
+        lambda: [xpaths["lastModified"](i) for i in itemsL],
+    )
+    for name, (legacy, new) in cases.items():
+        if legacy() != new():
+            raise ValueError(f"Results differ for {name}!")
+        times = []
+        for func in (legacy, new):
+            start = time.perf_counter()
+            for _ in range(calls):
+                func()
+            times.append((time.perf_counter() - start) / calls * 1e6)
+        print(f"  {name:12}: {times[0]:10.1f}µs -> {times[1]:10.1f}µs")
+
+
+#
+# addItem
+#
+
+
+def bench_addItem(n: int) -> None:
+    """Build a Module item by item and ask for its size along the way."""
+    src = synthetic(n)
+    itemsL = list(src)
+    print(f"addItem for {n} moduleItems")
+    start = time.perf_counter()
+    m = Module()
+    for itemN in itemsL:
+        m.addItem(itemN=itemN, mtype="Object")
+        len(m)
+    m.toString()
+    print(f"  {time.perf_counter() - start:.2f}s")
+    if m.totalSize(module="Object") != n or m.describe() != {"Object": n}:
+        raise ValueError("Wrong size!")
+
+
+#
+# diff
+#
+
+
+def bench_diff(n: int) -> None:
+    """Diff two harvests of n items that differ in a few items."""
+    old = synthetic(n)
+    new = synthetic(n - 2, start=2)  # items 0 and 1 are gone
+    new.add(doc=synthetic(1, start=n).etree)  # one more
+    new[("Object", 10)].getparent().remove(new[("Object", 10)])
+    new.addItem(itemN=synthetic(1, start=10)[("Object", 10)], mtype="Object")
+    valueN = new.xpath("//m:moduleItem[@id = '10']/m:dataField/m:value")[1]
+    valueN.text = "Rahmentrommel"
+    for uuidN in new.xpath("//m:moduleItem[@id = '11']//*[@uuid]"):
+        uuidN.set("uuid", "changed")  # ignored
+    print(f"diff of two documents with {n} moduleItems")
+    start = time.perf_counter()
+    changes = old.diff(new, fields=True)
+    print(f"  {time.perf_counter() - start:.2f}s")
+    expected = {
+        "added": {("Object", str(n))},
+        "removed": {("Object", "0"), ("Object", "1")},
+        "changed": {("Object", "10")},
+        "fields": {("Object", "10"): {"ObjTechnicalTermClb"}},
+    }
+    if changes != expected:
+        raise ValueError(f"Unexpected result {changes}")
+
+
+benchmarks = {
+    "addItem": bench_addItem,
+    "diff": bench_diff,
+    "transform": bench_transform,
+    "xpath": bench_xpath,
+}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks for mpapi")
+    parser.add_argument(
+        "-b", "--bench", help="benchmark to run", choices=list(benchmarks)
+    )
+    parser.add_argument("-n", "--number", help="number of items", type=int)
+    args = parser.parse_args()
+    todo = [args.bench] if args.bench else list(benchmarks)
+    for name in todo:
+        if args.number is None:
+            benchmarks[name](50000)
+        else:
+            benchmarks[name](args.number)
@@ -0,0 +1,92 @@
+"""
+Test AsyncMpApi against a local stub server
+"""
+
+import asyncio
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from mpapi.aclient import AsyncMpApi
+from mpapi.search import Search
+import pytest
+import threading
+import time
+
+
+def _item(mtype, ID):
+    return f"""<application xmlns="http://www.zetcom.com/ria/ws/module">
+        <modules>
+            <module name="{mtype}" totalSize="1">
+                <moduleItem id="{ID}"/>
+            </module>
+        </modules>
+    </application>""".encode()
+
+
+class Stub(BaseHTTPRequestHandler):
+    """Answers like RIA after a short while; counts requests in flight."""
+
+    lock = threading.Lock()
+    inFlight = 0
+    maxInFlight = 0
+
+    def _respond(self, body):
+        cls = type(self)
+        with cls.lock:
+            cls.inFlight += 1
+            cls.maxInFlight = max(cls.maxInFlight, cls.inFlight)
+        time.sleep(0.05)
+        with cls.lock:
+            cls.inFlight -= 1
+        self.send_response(200)
+        self.send_header("Content-Type", "application/xml")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        # /ria-ws/application/module/{mtype}/{ID}
+        mtype, ID = self.path.split("/")[-2:]
+        self._respond(_item(mtype, ID))
+
+    def do_POST(self):
+        # /ria-ws/application/module/{mtype}/search
+        self.rfile.read(int(self.headers["Content-Length"]))
+        self._respond(_item(self.path.split("/")[-2], 1))
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def baseURL():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Stub)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    Stub.maxInFlight = 0
+    yield f"http://127.0.0.1:{server.server_port}"
+    server.shutdown()
+    server.server_close()
+
+
+def test_getItem2(baseURL):
+    async def main():
+        async with AsyncMpApi(
+            baseURL=baseURL, user="user", pw="pw", maxInFlight=3
+        ) as api:
+            return await asyncio.gather(
+                *[api.getItem2(mtype="Object", ID=ID) for ID in range(10)]
+            )
+
+    mL = asyncio.run(main())
+    assert [m.extract_first_id() for m in mL] == [str(ID) for ID in range(10)]
+    assert 1 < Stub.maxInFlight <= 3
+
+
+def test_search2(baseURL):
+    async def main():
+        async with AsyncMpApi(baseURL=baseURL, user="user", pw="pw") as api:
+            q = Search(module="Person")
+            q.addCriterion(operator="equalsField", field="__id", value="1")
+            return await api.search2(query=q)
+
+    m = asyncio.run(main())
+    assert m.describe() == {"Person": 1}
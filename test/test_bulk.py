@@ -0,0 +1,109 @@
+"""
+Test BulkUpdater against a local stub server that records PUTs
+"""
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+from mpapi.bulk import BulkUpdater
+from mpapi.client import MpApi
+from mpapi.module import Module
+import pytest
+import threading
+
+
+class Updates(BaseHTTPRequestHandler):
+    """Accepts PUTs to module/{mtype}/{id}; fails those in `broken` with 500."""
+
+    broken: set = set()
+    updated: list = []
+    lock = threading.Lock()
+    protocol_version = "HTTP/1.1"
+
+    def do_PUT(self):
+        cls = type(self)
+        self.rfile.read(int(self.headers["Content-Length"]))
+        ID = int(self.path.rstrip("/").split("/")[-1])
+        status = 500 if ID in cls.broken else 204
+        if status == 204:
+            with cls.lock:
+                cls.updated.append(ID)
+        self.send_response(status)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def api():
+    Updates.broken = set()
+    Updates.updated = []
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Updates)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield MpApi(
+        baseURL=f"http://127.0.0.1:{server.server_port}", user="u", pw="p", retries=0
+    )
+    server.shutdown()
+    server.server_close()
+
+
+def _module(IDs, mtype="Object"):
+    m = Module()
+    moduleN = m.module(name=mtype)
+    for ID in IDs:
+        m.moduleItem(parent=moduleN, ID=ID)
+    return m
+
+
+def test_run_and_restart(api, tmp_path):
+    journal = tmp_path / "update.journal"
+    Updates.broken = {3, 7}
+    bulk = BulkUpdater(api=api, journal=journal, workers=3)
+    stats = bulk.run(data=_module(range(1, 11)))
+    assert stats["updated"] == 8
+    assert stats["failed"] == 2
+    assert set(bulk.errors) == {("Object", 3), ("Object", 7)}
+    entries = [json.loads(line) for line in journal.read_text().splitlines()]
+    assert len(entries) == 10
+    assert {e["id"] for e in entries if e["status"] == "failed"} == {3, 7}
+
+    # restart: only the failed ones are sent again
+    Updates.broken = set()
+    Updates.updated = []
+    stats = BulkUpdater(api=api, journal=journal).run(data=_module(range(1, 11)))
+    assert sorted(Updates.updated) == [3, 7]
+    assert stats["skipped"] == 8
+    assert len(BulkUpdater(api=api, journal=journal).completed()) == 10
+
+
+def test_dir(api, tmp_path):
+    for no in range(3):
+        _module([no * 10 + 1, no * 10 + 2]).toFile(path=tmp_path / f"items{no}.xml")
+    _module([99], mtype="Person").toZip(path=tmp_path / "persons.xml")
+    calls = []
+
+    def action(*, mtype, ID, data):
+        assert len(data) == 1
+        calls.append((mtype, ID))
+        return api.updateItem2(mtype=mtype, ID=ID, data=data)
+
+    bulk = BulkUpdater(api=api, journal=tmp_path / "j", action=action)
+    stats = bulk.run(data=tmp_path)
+    assert stats["updated"] == 7
+    assert ("Person", 99) in calls
+    assert sorted(Updates.updated) == [1, 2, 11, 12, 21, 22, 99]
+
+
+def test_broken_input(api, tmp_path):
+    _module([1, 2, 3]).toFile(path=tmp_path / "items0.xml")
+    (tmp_path / "items1.xml").write_text("<application>cut off")
+    journal = tmp_path / "update.journal"
+    with pytest.raises(Exception):
+        BulkUpdater(api=api, journal=journal, workers=2).run(data=tmp_path)
+    # updates sent before the error are in the journal
+    assert BulkUpdater(api=api, journal=journal).completed() == {
+        ("Object", ID) for ID in Updates.updated
+    }
+    assert len(Updates.updated) > 0
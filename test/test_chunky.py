@@ -0,0 +1,77 @@
+"""
+Test getByType's prefetch with fake chunks instead of requests to RIA
+"""
+
+import json
+from mpapi.chunky import Chunky
+from mpapi.module import Module
+import pytest
+import threading
+import time
+
+total = 7  # object items that match
+
+
+def _fake(monkeypatch):
+    offsets = []
+    lock = threading.Lock()
+
+    def _chunk(self, *, ID, Type, target, since, offset):
+        with lock:
+            offsets.append(offset)
+        time.sleep(0.05)
+        m = Module()
+        moduleN = m.module(name="Object")
+        for ID in range(offset, min(offset + self.chunkSize, total)):
+            m.moduleItem(parent=moduleN, ID=ID)
+        return m
+
+    monkeypatch.setattr(Chunky, "_chunk", _chunk)
+    return offsets
+
+
+def _ids(chunks):
+    return [[int(itemN.get("id")) for itemN in chunk] for chunk in chunks]
+
+
+def test_prefetch(monkeypatch):
+    offsets = _fake(monkeypatch)
+    c = Chunky(chunkSize=3, baseURL="http://localhost:1", user="u", pw="p")
+    expected = [[0, 1, 2], [3, 4, 5], [6]]
+    assert _ids(c.getByType(ID=1, Type="group")) == expected
+    assert offsets == [0, 3, 6]
+
+    offsets.clear()
+    chunks = []
+    for chunk in c.getByType(ID=1, Type="group", prefetch=2):
+        if not chunks:  # the next two are on the way already
+            time.sleep(0.2)
+            assert sorted(offsets) == [0, 3, 6]
+        chunks.append(chunk)
+    assert _ids(chunks) == expected
+    assert len(offsets) <= 3 + 2  # at most prefetch chunks past the end
+
+
+def test_planned(monkeypatch, tmp_path):
+    offsets = _fake(monkeypatch)
+    monkeypatch.setattr(Chunky, "_count", lambda self, **kwargs: total)
+    c = Chunky(chunkSize=2, baseURL="http://localhost:1", user="u", pw="p")
+    plan = c.plan(ID=1, Type="group")
+    assert [entry["offset"] for entry in plan["chunks"]] == [0, 2, 4, 6]
+
+    plan_fn = tmp_path / "group1-plan.json"
+    for no, chunk in c.getPlanned(ID=1, Type="group", workers=3, planFile=plan_fn):
+        if no == 2:
+            break  # aborted while processing chunk 2
+    saved = json.loads(plan_fn.read_text())
+    assert [entry["done"] for entry in saved["chunks"]] == [True, False, False, False]
+
+    offsets.clear()
+    chunks = list(c.getPlanned(ID=1, Type="group", workers=3, planFile=plan_fn))
+    assert [no for no, chunk in chunks] == [2, 3, 4]
+    assert _ids(chunk for no, chunk in chunks) == [[2, 3], [4, 5], [6]]
+    assert sorted(offsets) == [2, 4, 6]
+    saved = json.loads(plan_fn.read_text())
+    assert all(entry["done"] for entry in saved["chunks"])
+    with pytest.raises(ValueError):
+        next(c.getPlanned(ID=2, Type="group", planFile=plan_fn))
@@ -0,0 +1,423 @@
+"""
+Test retries and timeouts of MpApi against a local stub server
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from mpapi.cache import ResponseCache
+from mpapi.client import MpApi
+from mpapi.metrics import Metrics
+from mpapi.search import Search
+from mpapi.uploader import Uploader
+from mpapi.throttle import Throttle
+import pytest
+import re
+import requests
+from requests.auth import _basic_auth_str
+import threading
+import time
+
+
+def _items(IDs):
+    items = "".join(
+        f"""<moduleItem id="{ID}"><systemField name="__lastModified">
+            <value>2022-01-01 12:00:00.0</value></systemField></moduleItem>"""
+        for ID in IDs
+    )
+    return f"""<application xmlns="http://www.zetcom.com/ria/ws/module">
+    <modules>
+        <module name="Object" totalSize="{len(IDs)}">{items}</module>
+    </modules>
+</application>""".encode()
+
+
+class Flaky(BaseHTTPRequestHandler):
+    """Fails the first `failures` requests with 503 (or status), then answers."""
+
+    failures = 0
+    status = 503
+    delay = 0
+    calls = 0
+    queries: list = []
+    gate = None  # if set, the body is sent in two parts with a pause
+    stalled = False  # True if the client didn't open the gate in time
+    validKey = None  # if set, requests need this session key (see do_GET)
+    keysIssued = 0
+    uploads: list = []
+    lock = threading.Lock()
+    protocol_version = "HTTP/1.1"
+
+    def _respond(self, body=_items([1])):
+        cls = type(self)
+        if cls.validKey is not None and self.headers["Authorization"] != (
+            _basic_auth_str("user", cls.validKey)
+        ):
+            self.send_response(401)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        with cls.lock:
+            cls.calls += 1
+            fail = cls.calls <= cls.failures
+        time.sleep(cls.delay)
+        if fail:
+            self.send_response(cls.status)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "application/xml")
+        if cls.gate is None:
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+        # chunked: first item, then wait for the gate, then the rest
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        split = body.index(b"</moduleItem>") + 13  # after the first moduleItem
+        for part in (body[:split], body[split:]):
+            self.wfile.write(f"{len(part):x}\r\n".encode() + part + b"\r\n")
+            self.wfile.flush()
+            cls.stalled = not cls.gate.wait(5)
+        self.wfile.write(b"0\r\n\r\n")
+
+    def do_GET(self):
+        if self.path.endswith("/session"):
+            return self._session()
+        self._respond()
+
+    def _session(self):
+        cls = type(self)
+        with cls.lock:
+            cls.keysIssued += 1
+            cls.validKey = f"key{cls.keysIssued}"
+        body = f"""<application xmlns="http://www.zetcom.com/ria/ws/session">
+            <session><key>{cls.validKey}</key></session></application>""".encode()
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        # answer searches with an item for every __id in the query
+        query = self.rfile.read(int(self.headers["Content-Length"])).decode()
+        type(self).queries.append(query)
+        IDs = re.findall(r'fieldPath="__id" operand="(\d+)"', query)
+        if "__lastModified" in query:
+            IDs = []  # nothing has changed since
+        elif not IDs:
+            IDs = [1]
+        self._respond(_items(IDs))
+
+    def do_PUT(self):
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        type(self).uploads.append((self.headers.get("X-File-Name"), body))
+        self._respond(b"")
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def baseURL():
+    Flaky.failures = 0
+    Flaky.status = 503
+    Flaky.delay = 0
+    Flaky.calls = 0
+    Flaky.queries = []
+    Flaky.gate = None
+    Flaky.validKey = None
+    Flaky.keysIssued = 0
+    Flaky.uploads = []
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Flaky)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}"
+    server.shutdown()
+    server.server_close()
+
+
+def _api(baseURL, **kwargs):
+    return MpApi(baseURL=baseURL, user="user", pw="pw", backoff=0.01, **kwargs)
+
+
+def test_retry_get(baseURL):
+    Flaky.failures = 2
+    api = _api(baseURL, retries=3)
+    m = api.getItem2(mtype="Object", ID=1)
+    assert len(m) == 1
+    assert Flaky.calls == 3
+    assert api.retriesUsed == 2
+
+
+def test_retries_exhausted(baseURL):
+    Flaky.failures = 5
+    api = _api(baseURL, retries=2)
+    with pytest.raises(requests.HTTPError):
+        api.getItem2(mtype="Object", ID=1)
+    assert Flaky.calls == 3
+
+
+def test_retry_budget(baseURL):
+    Flaky.failures = 3
+    api = _api(baseURL, retries=5, retryBudget=1)
+    with pytest.raises(requests.HTTPError):
+        api.getItem2(mtype="Object", ID=1)
+    assert Flaky.calls == 2
+    assert api.retriesUsed == 1
+
+
+def test_search_retried(baseURL):
+    Flaky.failures = 1
+    api = _api(baseURL)
+    q = Search(module="Object")
+    q.addCriterion(operator="equalsField", field="__id", value="1")
+    m = api.search2(query=q)
+    assert len(m) == 1
+    assert Flaky.calls == 2
+
+
+def test_post_not_retried(baseURL):
+    Flaky.failures = 1
+    api = _api(baseURL)
+    with pytest.raises(requests.HTTPError):
+        api._post(f"{api.appURL}/module/Object", data=b"<x/>")
+    assert Flaky.calls == 1
+
+
+def test_timeout(baseURL):
+    Flaky.delay = 0.5
+    api = _api(baseURL, retries=0, timeout=(1, 0.1))
+    with pytest.raises(requests.Timeout):
+        api.getItem2(mtype="Object", ID=1)
+    # per-call timeout overrides the default
+    r = api._get(f"{api.appURL}/module/Object/1", timeout=2)
+    assert r.status_code == 200
+
+
+def test_getItems(baseURL):
+    api = _api(baseURL)
+    m = api.getItems(
+        mtype="Object", IDs=[5, 1, 2, 3, 4, 5], batchSize=2, fields=["__id"]
+    )
+    assert len(m) == 5
+    assert sorted(int(itemN.get("id")) for itemN in m) == [1, 2, 3, 4, 5]
+    assert len(Flaky.queries) == 3
+    assert all('<field fieldPath="__id"/>' in q for q in Flaky.queries)
+    assert len(api.getItems(mtype="Object", IDs=[])) == 0
+
+
+def test_search_stream(baseURL):
+    Flaky.gate = threading.Event()
+    api = _api(baseURL)
+    q = Search(module="Object")
+    q.OR()
+    for ID in (1, 2, 3):
+        q.addCriterion(operator="equalsField", field="__id", value=str(ID))
+    IDs = []
+    for itemN in api.search2(query=q, stream=True):
+        # first item arrives while the server is still waiting
+        assert IDs or not Flaky.gate.is_set()
+        assert itemN.getparent().get("name") == "Object"
+        IDs.append(itemN.get("id"))
+        Flaky.gate.set()
+    assert IDs == ["1", "2", "3"]
+    assert not Flaky.stalled
+
+
+def test_getItem2_stream(baseURL):
+    itemsL = list(_api(baseURL).getItem2(mtype="Object", ID=1, stream=True))
+    assert len(itemsL) == 1
+
+
+def test_cache(baseURL, tmp_path):
+    cache = ResponseCache(path=tmp_path / "ria.cache")
+    api = _api(baseURL, cache=cache)
+    m = api.getItem2(mtype="Object", ID=1)
+    assert m.etree.xpath("//@id") == api.getItem2(mtype="Object", ID=1).etree.xpath(
+        "//@id"
+    )
+    assert Flaky.calls == 1
+
+    # same search, different whitespace
+    xml = """<application xmlns="http://www.zetcom.com/ria/ws/module/search">
+        <modules><module name="Object"><search limit="10" offset="0"><expert>
+        <equalsField fieldPath="__id" operand="2"/></expert></search></module>
+        </modules></application>"""
+    api.search(xml=xml)
+    api.search(xml=" ".join(xml.split()))
+    assert Flaky.calls == 2
+    assert cache.stats()["hits"] == 2
+    assert cache.stats()["misses"] == 2
+
+    # writing to Object drops all cached Object responses
+    api.updateItem(module="Object", id=1, xml="<x/>")
+    api.getItem2(mtype="Object", ID=1)
+    api.search(xml=xml)
+    assert Flaky.calls == 5
+
+
+def test_cache_shared(baseURL, tmp_path):
+    cache = ResponseCache(path=tmp_path / "ria.cache")
+    _api(baseURL, cache=cache, acceptLang="de").getItem2(mtype="Object", ID=1)
+    _api(baseURL, cache=cache, acceptLang="en").getItem2(mtype="Object", ID=1)
+    assert Flaky.calls == 2  # no German answers for English clients
+    assert cache.stats()["entries"] == 2
+    other = MpApi(baseURL=baseURL, user="other", pw="pw", cache=cache)
+    other.getItem2(mtype="Object", ID=1)
+    assert Flaky.calls == 3  # nor records of one user for another
+    _api(baseURL, cache=cache, acceptLang="en").getItem2(mtype="Object", ID=1)
+    assert Flaky.calls == 3
+
+
+def test_cache_revalidate(baseURL, tmp_path):
+    cache = ResponseCache(path=tmp_path / "ria.cache", ttl=0, revalidate=True)
+    api = _api(baseURL, cache=cache)
+    api.getItem2(mtype="Object", ID=1)
+    m = api.getItem2(mtype="Object", ID=1)  # stale, but unchanged
+    assert len(m) == 1
+    assert Flaky.calls == 2
+    assert 'limit="0"' in Flaky.queries[-1]
+    assert 'operand="2022-01-01T12:00:00.0"' in Flaky.queries[-1]
+    assert cache.stats()["revalidated"] == 1
+
+
+def test_cache_evict(baseURL, tmp_path):
+    cache = ResponseCache(path=tmp_path / "ria.cache", maxSize=200)
+    api = _api(baseURL, cache=cache)
+    for ID in (1, 2, 3):
+        api.getItem2(mtype="Object", ID=ID)
+    stats = cache.stats()
+    assert stats["size"] <= 200
+    assert stats["evictions"] == 3 - stats["entries"]
+
+
+def test_throttle(baseURL):
+    Flaky.failures = 1
+    throttle = Throttle(maxInFlight=4, start=4)
+    api = _api(baseURL, throttle=throttle)
+    api.getItem2(mtype="Object", ID=1)
+    stats = throttle.stats()
+    assert stats["requests"] == 2
+    assert stats["decreases"] == 1
+    assert stats["inFlight"] == 0
+
+
+def test_metrics(baseURL, tmp_path):
+    Flaky.failures = 1
+    metrics = Metrics()
+    api = _api(baseURL, metrics=metrics)
+    api.getItem2(mtype="Object", ID=1)
+    list(api.getItem2(mtype="Object", ID=2, stream=True))
+    fn = tmp_path / "photo.jpg"
+    fn.write_bytes(b"x" * 1000)
+    api.updateAttachment(module="Multimedia", id="3", path=str(fn))
+    stats = metrics.summary()
+    get = stats["GET module/{mtype}/{id}"]
+    assert get["count"] == 2
+    assert get["retries"] == 1
+    assert get["status"] == {"200": 2}
+    assert get["bytesReceived"] == 2 * len(_items([1]))
+    put = stats["PUT module/{mtype}/{id}/attachment"]
+    assert put["count"] == 1
+    assert put["bytesSent"] == 1000
+
+
+def test_session_auth(baseURL):
+    throttle = Throttle(maxInFlight=4)
+    api = _api(baseURL, auth="session", metrics=Metrics(), throttle=throttle)
+    assert api.getSessionKey() == "key1"
+    api.getItem2(mtype="Object", ID=1)
+    assert Flaky.keysIssued == 1
+    # key expires; every thread sees a 401, but only one gets a new key
+    Flaky.validKey = "somethingElse"
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        mL = list(
+            executor.map(lambda ID: api.getItem2(mtype="Object", ID=ID), range(8))
+        )
+    assert all(len(m) == 1 for m in mL)
+    assert Flaky.keysIssued == 2
+    assert api.session.auth.refreshs == 1
+    # requests sent again with the new key are throttled and recorded
+    stats = api.metrics.summary()["GET module/{mtype}/{id}"]
+    assert stats["count"] == 9
+    assert stats["retries"] >= 1
+    assert throttle.stats()["requests"] == 9 + stats["retries"]
+
+
+def test_getSessionKey(baseURL):
+    assert _api(baseURL).getSessionKey() == "key1"
+
+
+def test_updateAttachment_stream(baseURL, tmp_path):
+    fn = tmp_path / "big.tif"
+    fn.write_bytes(bytes(range(256)) * 1000)
+    Flaky.failures = 1  # the retry sends the whole file again
+    api = _api(baseURL)
+    with open(fn, "rb") as f:
+        api.updateAttachment(module="Multimedia", id=1, data=f)
+    assert Flaky.uploads[-1] == ("big.tif", fn.read_bytes())
+    assert len(Flaky.uploads) == 2
+
+    progress = []
+    chunks = (bytes([n]) * 100 for n in range(10))
+    api.updateAttachment(
+        module="Multimedia",
+        id=1,
+        data=chunks,
+        size=1000,
+        name="gen.bin",
+        progress=lambda sent, size: progress.append(sent),
+    )
+    assert Flaky.uploads[-1][0] == "gen.bin"
+    assert len(Flaky.uploads[-1][1]) == 1000
+    assert progress[-1] == 1000
+
+    # generators can't be sent twice, so there's no retry
+    Flaky.calls = 0
+    Flaky.failures = 1
+    with pytest.raises(requests.HTTPError):
+        api.updateAttachment(
+            module="Multimedia", id=1, data=iter([b"x" * 10]), size=10, name="x"
+        )
+
+
+def test_uploader(baseURL, tmp_path):
+    Flaky.failures = 1
+    sizes = {}
+
+    def progress(mtype, ID, path, sent, total):
+        sizes[ID] = (sent, total)
+
+    api = _api(baseURL, retries=2)  # MpApi retries the failed file
+    with Uploader(api=api, workers=2, progress=progress) as up:
+        for ID in range(5):
+            fn = tmp_path / f"{ID}.jpg"
+            fn.write_bytes(b"x" * (ID + 1) * 100)
+            up.add(mtype="Multimedia", ID=ID, path=fn)
+    assert up.uploaded == 5
+    assert len(Flaky.uploads) == 6  # one failed and was sent again
+    assert {name for name, body in Flaky.uploads} == {f"{ID}.jpg" for ID in range(5)}
+    assert sizes[4] == (500, 500)
+
+
+def test_uploader_client_error(baseURL, tmp_path):
+    Flaky.failures = 1
+    Flaky.status = 404  # e.g. unknown id; trying again won't help
+    fn = tmp_path / "1.jpg"
+    fn.write_bytes(b"x" * 100)
+    up = Uploader(api=_api(baseURL, retries=2))
+    with pytest.raises(requests.HTTPError):
+        up.upload(mtype="Multimedia", ID=1, path=fn)
+    assert len(Flaky.uploads) == 1
+
+
+def test_uploader_retries(baseURL, tmp_path):
+    Flaky.failures = 10
+    fn = tmp_path / "1.jpg"
+    fn.write_bytes(b"x" * 100)
+    up = Uploader(api=_api(baseURL, retries=2))
+    with pytest.raises(requests.HTTPError):
+        up.upload(mtype="Multimedia", ID=1, path=fn)
+    assert len(Flaky.uploads) == 3  # only MpApi's retries, not retries x retries
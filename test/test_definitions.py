@@ -0,0 +1,82 @@
+from mpapi.definitions import Definitions, Field
+from mpapi.module import Module
+from mpapi.search import Search
+import pytest
+
+xml = """<application xmlns="http://www.zetcom.com/ria/ws/module">
+    <modules>
+        <module name="Object">
+            <systemField name="__id" dataType="Long"/>
+            <dataField name="ObjTechnicalTermClb" dataType="Clob"/>
+            <dataField name="ObjNumberOddTxt" dataType="Long"/>
+            <vocabularyReference name="ObjCategoryVoc" instanceName="ObjCategoryVgr"/>
+            <repeatableGroup name="ObjPublicationGrp">
+                <vocabularyReference name="TypeVoc" instanceName="ObjPublicationTypeVgr"/>
+                <dataField name="NotesClb" dataType="Clob"/>
+            </repeatableGroup>
+            <moduleReference name="ObjMultimediaRef" targetModule="Multimedia">
+                <dataField name="ThumbnailBoo" dataType="Boolean"/>
+            </moduleReference>
+        </module>
+        <module name="Multimedia">
+            <dataField name="MulOriginalFileTxt" dataType="Varchar"/>
+            <moduleReference name="MulObjectRef" targetModule="Object"/>
+        </module>
+    </modules>
+</application>"""
+
+
+@pytest.fixture
+def defs(tmp_path):
+    d = Definitions(path=tmp_path / "definitions.db")
+    d.load(xml=xml)
+    yield d
+    d.close()
+
+
+def test_field(defs, tmp_path):
+    assert defs.mtypes() == ["Multimedia", "Object"]
+    assert defs.field(mtype="Object", name="ObjTechnicalTermClb") == Field(
+        "dataField", "Clob", None
+    )
+    assert defs.field(mtype="Object", name="ObjPublicationGrp.NotesClb").dataType == (
+        "Clob"
+    )
+    assert defs.field(mtype="Object", name="NotesClb") is None
+    # persisted
+    again = Definitions(path=tmp_path / "definitions.db")
+    assert again.field(mtype="Multimedia", name="MulObjectRef").target == "Object"
+
+
+def test_validate(defs):
+    f = defs.validate(mtype="Multimedia", path="MulObjectRef.ObjPublicationGrp.TypeVoc")
+    assert f.kind == "vocabularyReference"
+    assert defs.validate(mtype="Multimedia", path="MulObjectRef.__id").kind == (
+        "systemField"
+    )
+    assert defs.validate(mtype="Object", path="ObjMultimediaRef.ThumbnailBoo")
+    assert defs.validate(mtype="Object", path="ObjMultimediaRef.MulOriginalFileTxt")
+    assert defs.validate(mtype="Person", path="PerNameTxt") is None  # unknown mtype
+    with pytest.raises(ValueError, match="did you mean ObjPublicationGrp"):
+        defs.validate(mtype="Multimedia", path="MulObjectRef.ObjPublicationGr.TypeVoc")
+
+
+def test_search(defs, monkeypatch):
+    monkeypatch.setattr(Search, "definitions", defs)
+    q = Search(module="Object")
+    q.addCriterion(operator="equalsField", field="ObjCategoryVoc", value="1")
+    with pytest.raises(ValueError):
+        q.addCriterion(operator="equalsField", field="ObjCategoryVok", value="1")
+    with pytest.raises(ValueError):
+        q.addField(field="ObjTechnicalTerm")
+
+
+def test_dataField(defs, monkeypatch):
+    monkeypatch.setattr(Module, "definitions", defs)
+    m = Module()
+    itemN = m.moduleItem(parent=m.module(name="Object"), ID=1)
+    # suffix says Varchar, definition says Long
+    fieldN = m.dataField(parent=itemN, name="ObjNumberOddTxt", value="1")
+    assert fieldN.get("dataType") == "Long"
+    fieldN = m.dataField(parent=itemN, name="ObjUnknownTxt", value="1")
+    assert fieldN.get("dataType") == "Varchar"
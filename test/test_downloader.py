@@ -0,0 +1,156 @@
+"""
+Test Downloader against a local stub server that supports Range requests
+"""
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+from mpapi.client import MpApi
+from mpapi.downloader import Downloader
+import hashlib
+import pytest
+import requests
+import threading
+
+content = bytes(range(256)) * 400  # 100 KB
+
+
+class Files(BaseHTTPRequestHandler):
+    """Serves content for every attachment; can break off the first transfer."""
+
+    breakAfter = None  # bytes sent before the first response breaks off
+    missing: set = set()  # ids answered with 404
+    ranges: list = []
+    requests = 0
+    paths: list = []
+
+    def do_GET(self):
+        cls = type(self)
+        cls.requests += 1
+        cls.paths.append(self.path)
+        if any(f"/{ID}/" in self.path for ID in cls.missing):
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        start = 0
+        if "Range" in self.headers:
+            start = int(self.headers["Range"].split("=")[1].rstrip("-"))
+            cls.ranges.append(start)
+            self.send_response(206)
+        else:
+            self.send_response(200)
+        body = content[start:]
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if cls.breakAfter is not None:
+            body = body[: cls.breakAfter]
+            cls.breakAfter = None
+            self.close_connection = True
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def api():
+    Files.breakAfter = None
+    Files.missing = set()
+    Files.ranges = []
+    Files.requests = 0
+    Files.paths = []
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Files)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield MpApi(
+        baseURL=f"http://127.0.0.1:{server.server_port}",
+        user="user",
+        pw="pw",
+        backoff=0.01,
+    )
+    server.shutdown()
+    server.server_close()
+
+
+def test_download(api, tmp_path):
+    path = tmp_path / "1.jpg"
+    size, sha256 = Downloader(api=api, chunkSize=4096).download(ID=1, path=path)
+    assert path.read_bytes() == content
+    assert size == len(content)
+    assert sha256 == hashlib.sha256(content).hexdigest()
+    assert not (tmp_path / "1.jpg.part").exists()
+
+
+def test_resume_part(api, tmp_path):
+    # left over from an interrupted run
+    (tmp_path / "1.jpg.part").write_bytes(content[:1000])
+    api.saveAttachment(id=1, path=tmp_path / "1.jpg")
+    assert Files.ranges == [1000]
+    assert (tmp_path / "1.jpg").read_bytes() == content
+
+
+def test_resume_broken(api, tmp_path):
+    Files.breakAfter = 5000
+    path = tmp_path / "1.jpg"
+    dl = Downloader(api=api, chunkSize=1000)
+    size, sha256 = dl.download(ID=1, path=path)
+    assert Files.ranges == [5000]
+    assert path.read_bytes() == content
+    assert sha256 == hashlib.sha256(content).hexdigest()
+
+
+def test_parallel_manifest(api, tmp_path):
+    manifest = tmp_path / "manifest.json"
+    with Downloader(api=api, workers=3, queueSize=2, manifest=manifest) as dl:
+        for ID in range(10):
+            assert dl.add(ID=ID, path=tmp_path / f"{ID}.jpg")
+    assert dl.downloaded == 10
+    entries = json.loads(manifest.read_text())
+    assert entries["3.jpg"]["size"] == len(content)
+    assert entries["3.jpg"]["id"] == 3
+
+    # rerun skips complete files, but not truncated or unknown ones
+    (tmp_path / "4.jpg").write_bytes(content[:10])
+    (tmp_path / "10.jpg").write_bytes(content)
+    Files.requests = 0
+    with Downloader(api=api, manifest=manifest) as dl:
+        queued = [ID for ID in range(11) if dl.add(ID=ID, path=tmp_path / f"{ID}.jpg")]
+    assert queued == [4, 10]
+    assert dl.skipped == 9
+    assert Files.requests == 2
+    assert (tmp_path / "4.jpg").read_bytes() == content
+
+
+def test_before_manifest(api, tmp_path):
+    # half-written file left by a download from before we had a manifest
+    (tmp_path / "1.jpg").write_bytes(content[:10])
+    manifest = tmp_path / "manifest.json"
+    with Downloader(api=api, manifest=manifest) as dl:
+        assert dl.add(ID=1, path=tmp_path / "1.jpg")
+    assert (tmp_path / "1.jpg").read_bytes() == content
+    assert json.loads(manifest.read_text())["1.jpg"]["size"] == len(content)
+
+
+def test_thumbnails(api, tmp_path):
+    (tmp_path / "2.jpg").write_bytes(b"old")
+    stats = api.saveThumbnails(IDs=[1, 2, 3], tdir=tmp_path)
+    assert stats == {"downloaded": 2, "skipped": 1}
+    assert (tmp_path / "2.jpg").read_bytes() == b"old"
+    assert (tmp_path / "3.jpg").read_bytes() == content
+    assert sorted(Files.paths) == [
+        "/ria-ws/application/module/Multimedia/1/thumbnail",
+        "/ria-ws/application/module/Multimedia/3/thumbnail",
+    ]
+    assert api.getThumbnail(module="Multimedia", id=4, path=tmp_path / "4.jpg") == 4
+    assert (tmp_path / "4.jpg").read_bytes() == content
+    api.getItem(module="Multimedia", id=5, loadThumbnailSmall=True)
+    assert Files.paths[-1].endswith("/Multimedia/5?loadThumbnailSmall=true")
+
+
+def test_thumbnails_missing(api, tmp_path):
+    Files.missing = {2}
+    with pytest.raises(requests.HTTPError):
+        api.saveThumbnails(IDs=[1, 2, 3], tdir=tmp_path)
+    assert (tmp_path / "3.jpg").read_bytes() == content  # the others are done
+    assert not (tmp_path / "2.jpg").exists()
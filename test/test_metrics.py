@@ -0,0 +1,42 @@
+from mpapi.metrics import Metrics, endpoint
+import json
+
+
+def test_endpoint():
+    app = "http://host/ria-ws/application"
+    assert endpoint(f"{app}/module/Object/123") == "module/{mtype}/{id}"
+    assert endpoint(f"{app}/module/Multimedia/7/attachment") == (
+        "module/{mtype}/{id}/attachment"
+    )
+    assert endpoint(f"{app}/module/Object/search/") == "module/{mtype}/search"
+    assert endpoint(f"{app}/module/definition") == "module/definition"
+    assert endpoint(f"{app}/vocabulary/instances/ObjCategoryVgr/nodes/5") == (
+        "vocabulary/instances/{instanceName}/nodes/{id}"
+    )
+
+
+def test_record(tmp_path):
+    m = Metrics()
+    url = "http://host/ria-ws/application/module/Object/1"
+    m.record(method="GET", url=url, status=200, latency=0.2, received=100)
+    m.record(method="GET", url=url, status=503, latency=3, retries=2)
+    m.record(method="GET", url=url, status=None, latency=40)
+    m.addReceived(method="GET", url=url, n=50)
+    stats = m.summary()["GET module/{mtype}/{id}"]
+    assert stats["count"] == 3
+    assert stats["errors"] == 2
+    assert stats["retries"] == 2
+    assert stats["bytesReceived"] == 150
+    assert stats["status"] == {"200": 1, "503": 1, "error": 1}
+    assert stats["latency"]["buckets"]["0.25"] == 1
+    assert stats["latency"]["buckets"]["5"] == 2
+    assert stats["latency"]["buckets"]["+Inf"] == 3
+
+    m.toJSON(path=tmp_path / "metrics.json")
+    assert json.loads((tmp_path / "metrics.json").read_text()) == m.summary()
+    m.toPrometheus(path=tmp_path / "metrics.prom")
+    prom = (tmp_path / "metrics.prom").read_text()
+    labels = 'method="GET",endpoint="module/{mtype}/{id}"'
+    assert f'mpapi_requests_total{{{labels},status="503"}} 1' in prom
+    assert f'mpapi_request_duration_seconds_bucket{{{labels},le="+Inf"}} 3' in prom
+    assert f"mpapi_retries_total{{{labels}}} 2" in prom
@@ -0,0 +1,74 @@
+"""
+Test mink's pack command; both modes should write the same pack
+"""
+
+from mpapi import Mink  # importing mink first would be circular
+from mpapi.constants import NSMAP
+from mpapi.module import Module
+import pytest
+
+
+def _doc(*items):
+    """items: (mtype, id, lastModified)"""
+    modules = {}
+    for mtype, ID, lastModified in items:
+        modules.setdefault(mtype, []).append(f"""
+            <moduleItem id="{ID}">
+              <systemField name="__lastModified">
+                <value>{lastModified}</value>
+              </systemField>
+            </moduleItem>""")
+    body = "".join(
+        f'<module name="{mtype}" totalSize="{len(itemsL)}">{"".join(itemsL)}</module>'
+        for mtype, itemsL in modules.items()
+    )
+    return f"""<application xmlns="http://www.zetcom.com/ria/ws/module">
+        <modules>{body}</modules>
+    </application>"""
+
+
+def _pack(tmp_path, mode):
+    project_dir = tmp_path / mode / "label" / "20240101"
+    project_dir.mkdir(parents=True)
+    docs = [
+        _doc(
+            ("Object", 1, "2022-01-01T00:00:00Z"), ("Object", 2, "2022-01-01T00:00:00Z")
+        ),
+        _doc(
+            ("Object", 2, "2023-01-01T00:00:00Z"), ("Person", 3, "2023-01-01T00:00:00Z")
+        ),
+        _doc(
+            ("Object", 1, "2021-01-01T00:00:00Z"), ("Person", 4, "2023-01-01T00:00:00Z")
+        ),
+    ]
+    for no, xml in enumerate(docs):
+        Module(xml=xml).toFile(path=project_dir / f"group{no}-join-{no}.xml")
+    mink = Mink.__new__(Mink)  # without conf and job
+    mink.project_dir = project_dir
+    mink.pack([mode])
+    return Module(file=project_dir.parent / "label20240101.xml")
+
+
+def _summary(m):
+    lastModified = "m:systemField[@name = '__lastModified']/m:value/text()"
+    return {
+        (itemN.getparent().get("name"), int(itemN.get("id"))): str(
+            itemN.xpath(lastModified, namespaces=NSMAP)[0]
+        )
+        for itemN in m.iter()
+    }
+
+
+def test_pack_modes(tmp_path):
+    stream = _pack(tmp_path, "stream")
+    memory = _pack(tmp_path, "memory")
+    assert _summary(stream) == _summary(memory)
+    assert _summary(stream)[("Object", 2)] == "2023-01-01T00:00:00Z"
+    assert _summary(stream)[("Object", 1)] == "2022-01-01T00:00:00Z"
+    for mtype in ("Object", "Person"):
+        assert stream.totalSize(module=mtype) == memory.totalSize(module=mtype) == 2
+
+
+def test_pack_unknown_mode(tmp_path):
+    with pytest.raises(SyntaxError):
+        _pack(tmp_path, "other")
@@ -1,4 +1,5 @@
 from mpapi.constants import NSMAP
+from mpapi.itemindex import ItemIndex
 from mpapi.search import Search
 from mpapi.module import Module
 import lxml
@@ -174,3 +175,299 @@ def test_add():
 def test_toZip():
     m1 = Module(file="sdata/exhibit20222.xml")
     m1.toZip(path="sdata/exhibit20222.xml")
+
+
+def _doc(*items):
+    # items are (mtype, id, lastModified) tuples
+    modules = {}
+    for mtype, ID, lastModified in items:
+        modules.setdefault(mtype, []).append(f"""<moduleItem id="{ID}">
+                <systemField dataType="Timestamp" name="__lastModified">
+                    <value>{lastModified}</value>
+                </systemField>
+            </moduleItem>""")
+    xml = '<application xmlns="http://www.zetcom.com/ria/ws/module"><modules>'
+    for mtype in modules:
+        xml += f'<module name="{mtype}">{"".join(modules[mtype])}</module>'
+    xml += "</modules></application>"
+    return xml
+
+
+def test_index():
+    m = Module(
+        xml=_doc(("Object", 1, "2022-01-01T00:00:00Z"), ("Person", 2, "2022-01-01"))
+    )
+    assert m.existsItem(mtype="Object", modItemId=1)
+    assert not m.existsItem(mtype="Object", modItemId=2)
+    assert m[("Person", 2)].get("id") == "2"
+    with pytest.raises(KeyError):
+        m[("Object", 3)]
+
+    m.delItem(mtype="Object", modItemId=1)
+    assert not m.existsItem(mtype="Object", modItemId=1)
+    assert len(m) == 1
+
+    itemN = etree.fromstring(_doc(("Object", 3, "2022-01-01")))[0][0][0]
+    m.addItem(itemN=itemN, mtype="Object")
+    m.addItem(itemN=itemN, mtype="Object")  # replaces the first copy
+    assert m.actualSize(module="Object") == 1
+    assert m[("Object", 3)] is not itemN
+
+    # replacing the document resets the index
+    m.etree = etree.fromstring(_doc(("Object", 4, "2022-01-01")))
+    assert m.existsItem(mtype="Object", modItemId=4)
+    assert not m.existsItem(mtype="Person", modItemId=2)
+
+
+def test_add_newer_wins():
+    m1 = Module(
+        xml=_doc(
+            ("Object", 1, "2022-01-01T00:00:00Z"),
+            ("Object", 2, "2022-01-01T00:00:00Z"),
+        )
+    )
+    m2 = Module(
+        xml=_doc(
+            ("Object", 1, "2021-01-01T00:00:00Z"),  # older, ignored
+            ("Object", 2, "2023-01-01T00:00:00Z"),  # newer, replaces
+            ("Object", 3, "2023-01-01T00:00:00Z"),  # new
+            ("Person", 4, "2023-01-01T00:00:00Z"),  # new mtype
+        )
+    )
+    m1.add(doc=m2.etree)
+    assert m1.describe() == {"Object": 3, "Person": 1}
+    assert m1.totalSize(module="Object") == 3
+    lastModified = "m:systemField[@name = '__lastModified']/m:value/text()"
+    assert m1[("Object", 1)].xpath(lastModified, namespaces=NSMAP) == [
+        "2022-01-01T00:00:00Z"
+    ]
+    assert m1[("Object", 2)].xpath(lastModified, namespaces=NSMAP) == [
+        "2023-01-01T00:00:00Z"
+    ]
+    assert len(m2) == 4  # doc remains unchanged
+
+
+def test_iadd_adopt():
+    m1 = Module(xml=_doc(("Object", 1, "2022-01-01T00:00:00Z")))
+    m2 = Module(xml=_doc(("Object", 2, "2022-01-01T00:00:00Z")))
+    before = m1
+    m1 += m2
+    assert m1 is before  # in place
+    assert len(m1) == 2
+    assert len(m2) == 1  # m2 remains unchanged
+
+    partET = etree.fromstring(_doc(("Person", 3, "2022-01-01T00:00:00Z")))
+    itemN = partET[0][0][0]
+    m1.add(doc=partET, adopt=True)
+    assert m1[("Person", 3)] is itemN  # moved, not copied
+    assert m1.describe() == {"Object": 2, "Person": 1}
+
+
+def test_uploadForm_single_pass():
+    m = Module(xml=_doc(("Object", 1, "2022-01-01T00:00:00Z")))
+    itemN = m[("Object", 1)]
+    orgUnitN = etree.SubElement(
+        itemN, "{http://www.zetcom.com/ria/ws/module}systemField", name="__orgUnit"
+    )
+    m.clean()
+    m.uploadForm()
+    assert m[("Object", 1)] is itemN  # in place
+    assert itemN.xpath("m:systemField", namespaces=NSMAP) == [orgUnitN]
+
+
+def test_uploadForm_totalSize():
+    # uploadForm drops totalSize; it mustn't come back when we write
+    m = Module()
+    src = Module(xml=_doc(("Object", 1, "2022-01-01T00:00:00Z")))
+    m.addItem(itemN=src[("Object", 1)], mtype="Object")
+    m.uploadForm()
+    assert "totalSize" not in m.toString()
+
+
+def test_counts_lxml_edit():
+    m = Module(
+        xml=_doc(
+            ("Object", 1, "2022-01-01T00:00:00Z"),
+            ("Object", 2, "2022-01-01T00:00:00Z"),
+            ("Person", 3, "2022-01-01T00:00:00Z"),
+        )
+    )
+    assert len(m) == 3
+    moduleN = m[("Object", 1)].getparent()
+    moduleN.remove(m[("Object", 1)])  # behind Module's back
+    assert len(m) == 2
+    assert m.actualSize(module="Object") == 1
+    assert m.describe() == {"Object": 1, "Person": 1}
+    m.toString()
+    assert moduleN.get("totalSize") in (None, "1")
+
+
+def test_iterFile(tmp_path):
+    m = Module(
+        xml=_doc(
+            ("Object", 1, "2022-01-01T00:00:00Z"),
+            ("Object", 2, "2022-01-01T00:00:00Z"),
+            ("Person", 3, "2022-01-01T00:00:00Z"),
+        )
+    )
+    m.toFile(path=tmp_path / "data.xml")
+    zipPath = m.toZip(path=tmp_path / "chunk.xml")
+    for path in (tmp_path / "data.xml", zipPath):
+        itemsL = [
+            (itemN.getparent().get("name"), itemN.get("id"))
+            for itemN in Module.iterFile(path=path)
+        ]
+        assert itemsL == [("Object", "1"), ("Object", "2"), ("Person", "3")]
+        idsL = [itemN.get("id") for itemN in Module.iterFile(path=path, mtype="Person")]
+        assert idsL == ["3"]
+
+
+def test_iterStream():
+    xml = _doc(
+        ("Object", 1, "2022-01-01T00:00:00Z"),
+        ("Object", 2, "2022-01-01T00:00:00Z"),
+        ("Person", 3, "2022-01-01T00:00:00Z"),
+    ).encode()
+    chunks = (xml[i : i + 50] for i in range(0, len(xml), 50))
+    itemsL = [
+        (itemN.getparent().get("name"), itemN.get("id"))
+        for itemN in Module.iterStream(chunks=chunks)
+    ]
+    assert itemsL == [("Object", "1"), ("Object", "2"), ("Person", "3")]
+    idsL = [
+        itemN.get("id") for itemN in Module.iterStream(chunks=[xml], mtype="Person")
+    ]
+    assert idsL == ["3"]
+
+
+def test_fromIndex(tmp_path):
+    old = Module(
+        xml=_doc(
+            ("Object", 1, "2022-01-01T00:00:00Z"),
+            ("Object", 2, "2022-01-01T00:00:00Z"),
+        )
+    )
+    new = Module(
+        xml=_doc(
+            ("Object", 2, "2023-01-01T00:00:00Z"),
+            ("Person", 3, "2023-01-01T00:00:00Z"),
+        )
+    )
+    old.toFile(path=tmp_path / "old.xml")
+    zipPath = new.toZip(path=tmp_path / "new.xml")
+    idx = ItemIndex(path=tmp_path / "test.idx")
+    assert idx.add(path=tmp_path / "old.xml") == 2
+    assert idx.add(path=zipPath) == 2
+    assert list(idx.keys()) == [("Object", 1), ("Object", 2), ("Person", 3)]
+    assert len(idx.lookup(mtype="Object", ID=2)) == 2
+
+    m = Module.fromIndex(index=idx, keys=[("Object", 2), ("Person", 3)])
+    assert m.describe() == {"Object": 1, "Person": 1}
+    lastModified = "m:systemField[@name = '__lastModified']/m:value/text()"
+    assert m[("Object", 2)].xpath(lastModified, namespaces=NSMAP) == [
+        "2023-01-01T00:00:00Z"
+    ]
+    with pytest.raises(KeyError):
+        Module.fromIndex(index=idx, keys=[("Object", 4)])
+    idx.close()
+
+    # index can be reopened from disk
+    m = Module.fromIndex(index=tmp_path / "test.idx", keys=[("Object", 1)])
+    assert m.totalSize(module="Object") == 1
+
+
+def test_index_lastModified(tmp_path):
+    Module(xml=_doc(("Object", 1, "2021-06-01T10:00:00+01:00"))).toFile(
+        path=tmp_path / "old.xml"
+    )
+    Module(xml=_doc(("Object", 1, "2022-01-01"))).toFile(path=tmp_path / "new.xml")
+    idx = ItemIndex(path=tmp_path / "test.idx")
+    idx.add(path=tmp_path / "old.xml")
+    idx.add(path=tmp_path / "new.xml")
+    # date without time is still newer than a full timestamp
+    assert [row[1] for row in idx.lookup(mtype="Object", ID=1)] == [
+        20220101000000,
+        20210601100000,
+    ]
+    idx.close()
+
+
+def test_index_selfclosing(tmp_path):
+    path = tmp_path / "empty.xml"
+    path.write_bytes(b"""<application xmlns="http://www.zetcom.com/ria/ws/module">
+  <modules>
+    <module name="Object" totalSize="3">
+      <moduleItem id="1"/>
+      <moduleItem hasAttachments="false" id="2" />
+      <moduleItem id="3"><dataField name="ObjTitleTxt"/></moduleItem>
+    </module>
+  </modules>
+</application>""")
+    idx = ItemIndex(path=tmp_path / "test.idx")
+    assert idx.add(path=path) == 3
+    keys = [("Object", 2), ("Object", 3)]
+    items = {itemN.get("id"): itemN for _, itemN in idx.read(keys=keys)}
+    assert len(items["2"]) == 0
+    assert len(items["3"]) == 1
+    idx.close()
+
+
+def test_counters():
+    m = Module()
+    objModule = m.module(name="Object")
+    m.moduleItem(parent=objModule, ID=1)
+    assert len(m) == 1
+    assert objModule.get("totalSize") is None  # from scratch, as before
+
+    itemN = etree.fromstring(_doc(("Object", 2, "2022-01-01")))[0][0][0]
+    m.addItem(itemN=itemN, mtype="Object")
+    m.addItem(itemN=itemN, mtype="Person")
+    assert m.describe() == {"Object": 2, "Person": 1}
+    assert objModule.get("totalSize") is None  # written lazily
+    assert m.totalSize(module="Object") == 2
+
+    m.delItem(mtype="Object", modItemId=1)
+    assert m.actualSize(module="Object") == 1
+    assert m.actualSize(module="Multimedia") == 0
+    assert 'name="Object" totalSize="1"' in m.toString()
+
+
+def test_validateItems():
+    m = Module(
+        xml=_doc(
+            ("Object", 1, "2022-01-01T00:00:00Z"),
+            ("Object", 2, "2022-01-01T00:00:00Z"),
+        )
+    )
+    assert m.validateItems() == {}
+    m[("Object", 2)][0].set("dataType", "Bogus")
+    errors = m.validateItems(workers=2)
+    assert list(errors) == [("Object", "2")]
+    assert "Bogus" in errors[("Object", "2")]
+
+
+def test_diff():
+    old = Module(
+        xml=_doc(
+            ("Object", 1, "2022-01-01T00:00:00Z"),
+            ("Object", 2, "2022-01-01T00:00:00Z"),
+            ("Object", 3, "2022-01-01T00:00:00Z"),
+        )
+    )
+    new = Module(
+        xml=_doc(
+            ("Object", 2, "2022-01-01T00:00:00Z"),
+            ("Object", 3, "2023-01-01T00:00:00Z"),
+            ("Person", 4, "2023-01-01T00:00:00Z"),
+        )
+    )
+    new[("Object", 2)].set("uuid", "ignored")
+    digestsD = old.digests()
+    assert len(digestsD) == 3
+    assert digestsD[("Object", "2")] == new.digests()[("Object", "2")]
+    assert old.diff(new, fields=True) == {
+        "added": {("Person", "4")},
+        "removed": {("Object", "1")},
+        "changed": {("Object", "3")},
+        "fields": {("Object", "3"): {"__lastModified"}},
+    }
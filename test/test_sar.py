@@ -1,9 +1,7 @@
 from mpapi.search import Search
 from mpapi.module import Module
 from mpapi.sar import Sar
-
-with open("sdata/credentials.py") as f:
-    exec(f.read())
+import pytest
 
 NSMAP = {
     "s": "http://www.zetcom.com/ria/ws/module/search",
@@ -15,6 +13,54 @@ NSMAP = {
 """
 
 
-def test_init():
-    sr = Sar(baseURL=baseURL, user=user, pw=pw)
+@pytest.fixture
+def credentials():
+    """Read only by the tests that need them, so the others run without."""
+    cred = {}
+    with open("sdata/credentials.py") as f:
+        exec(f.read(), cred)
+    return {key: cred[key] for key in ("baseURL", "user", "pw")}
+
+
+def test_init(credentials):
+    sr = Sar(**credentials)
     assert sr
+
+
+def test_checkApprovals():
+    def item(ID, publication, typeId):
+        return f"""
+        <moduleItem id="{ID}">
+          <repeatableGroup name="ObjPublicationGrp">
+            <repeatableGroupItem>
+              <vocabularyReference name="PublicationVoc">
+                <vocabularyReferenceItem name="{publication}"/>
+              </vocabularyReference>
+              <vocabularyReference name="TypeVoc">
+                <vocabularyReferenceItem id="{typeId}"/>
+              </vocabularyReference>
+            </repeatableGroupItem>
+          </repeatableGroup>
+        </moduleItem>"""
+
+    xml = f"""
+    <application xmlns="http://www.zetcom.com/ria/ws/module">
+      <modules>
+        <module name="Object" totalSize="4">
+          {item(1, "Ja", 2600647)}
+          {item(2, "Nein", 2600647)}
+          {item(3, "Ja", 1234)}
+          {item(4, "Ja", 2600647)}
+        </module>
+      </modules>
+    </application>"""
+    sr = Sar(baseURL="http://127.0.0.1:1", user="user", pw="pw")  # no requests
+    calls = []
+
+    def getItems(**kwargs):
+        calls.append(kwargs)
+        return Module(xml=xml)
+
+    sr.api.getItems = getItems
+    assert sr.checkApprovals(IDs=[1, 2, 3, 4]) == {1, 4}
+    assert calls[0]["fields"] == ["ObjPublicationGrp"]
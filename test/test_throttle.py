@@ -0,0 +1,64 @@
+from mpapi.throttle import Throttle
+import pytest
+import threading
+import time
+
+
+def _request(throttle, *, latency=0.01, status=200):
+    throttle.acquire()
+    throttle.release(latency=latency, status=status)
+
+
+def test_aimd():
+    t = Throttle(maxInFlight=4)
+    assert t.stats()["limit"] == 1
+    for _ in range(20):
+        _request(t)
+    assert t.stats()["limit"] == 4  # grows, but not beyond max
+    _request(t, status=503)
+    assert t.stats()["limit"] == 2
+    # a burst of errors within one round trip cuts only once
+    _request(t, status=429, latency=10)
+    assert t.stats()["limit"] == 2
+    assert t.decreases == 1
+
+
+def test_targetLatency():
+    t = Throttle(maxInFlight=8, start=8, targetLatency=1)
+    _request(t, latency=0.5)
+    assert t.stats()["limit"] == 8
+    _request(t, latency=2)
+    assert t.stats()["limit"] == 4
+    _request(t, status=None)  # connection error, but too soon after last cut
+    assert t.stats()["limit"] == 4
+
+
+def test_limit_blocks():
+    t = Throttle(maxInFlight=2, start=2)
+    t.acquire()
+    t.acquire()
+    started = threading.Event()
+
+    def third():
+        t.acquire()
+        started.set()
+
+    threading.Thread(target=third, daemon=True).start()
+    assert not started.wait(0.1)
+    t.release(latency=0.01, status=200)
+    assert started.wait(1)
+
+
+def test_rps():
+    t = Throttle(maxInFlight=8, start=8, rps=20)
+    start = time.monotonic()
+    for _ in range(30):  # 20 from the burst, 10 at 20/s
+        _request(t)
+    assert time.monotonic() - start == pytest.approx(0.5, abs=0.2)
+
+
+def test_bps():
+    t = Throttle(bps=1000)
+    start = time.monotonic()
+    t.consume(1500)
+    assert time.monotonic() - start == pytest.approx(0.5, abs=0.2)